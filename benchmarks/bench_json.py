@@ -0,0 +1,44 @@
+"""
+列表响应编码的微基准测试：对比 handle_db_list+Flask jsonify 与 快速读取路径 的单文档耗时
+  python -m benchmarks.bench_json
+"""
+import json
+import timeit
+from datetime import datetime
+from bson.objectid import ObjectId
+from flask import Flask, jsonify
+from rainbond_python.tools import handle_db_list
+from rainbond_python.json_encoder import dumps_json, handle_db_json_list, get_json_encoder
+
+
+def make_docu_list(size: int = 1000) -> list:
+    # 模拟数据库返回的原始文档
+    return [{
+        '_id': ObjectId(),
+        'name': 'Xiao Ming {0}'.format(i),
+        'age': i % 80,
+        'tags': ['tag_a', 'tag_b', 'tag_c'],
+        'detail': {'city': 'Guangzhou', 'score': i * 1.5},
+        'creation_time': datetime(2021, 5, 6, 7, 8, 9),
+        'update_time': datetime.today(),
+    } for i in range(size)]
+
+
+def main(number: int = 20):
+    app = Flask(__name__)
+    docu_list = make_docu_list()
+    with app.app_context():
+        # 原有流程会修改文档，每次使用新的字典
+        old_func = lambda: jsonify(handle_db_list([dict(docu) for docu in docu_list])).get_data()
+        new_func = lambda: dumps_json(handle_db_json_list(docu_list))
+        assert json.loads(old_func()) == json.loads(new_func())
+        old_time = timeit.timeit(old_func, number=number)
+        new_time = timeit.timeit(new_func, number=number)
+    per_docu = number * len(docu_list) / 1000000
+    print('encoder: {0}'.format(get_json_encoder().__name__))
+    print('jsonify: {0:.2f}us/docu  fast path: {1:.2f}us/docu  x{2:.1f}'.format(
+        old_time / per_docu, new_time / per_docu, old_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
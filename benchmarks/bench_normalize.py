@@ -0,0 +1,54 @@
+"""
+文档规范化的微基准测试：对比 深拷贝+处理 与 只复制顶层字典 的耗时
+  python -m benchmarks.bench_normalize
+"""
+import copy
+import timeit
+from datetime import datetime
+from rainbond_python.tools import handle_db_id, handle_db_docu, handle_db_remove
+
+
+def make_docu(width: int = 50, depth: int = 3) -> dict:
+    # 生成嵌套的较大文档
+    if depth == 0:
+        return {'value_{0}'.format(i): 'x' * 32 for i in range(width)}
+    return {
+        'id': '600535c49495e1c2bec76356',
+        'tags': ['tag_{0}'.format(i) for i in range(width)],
+        'children': [make_docu(width // 5 or 1, depth - 1) for _ in range(5)],
+    }
+
+
+def deepcopy_write(docu: dict) -> dict:
+    # 原有写入流程：深拷贝后再处理id与时间
+    deep_docu = handle_db_id(copy.deepcopy(docu))
+    if not deep_docu.__contains__('creation_time'):
+        deep_docu['creation_time'] = datetime.today()
+    if not deep_docu.__contains__('update_time'):
+        deep_docu['update_time'] = datetime.today()
+    return deep_docu
+
+
+def deepcopy_find(find_dict: dict) -> dict:
+    # 原有查询流程
+    return handle_db_remove(handle_db_id(copy.deepcopy(find_dict)))
+
+
+def copy_free_find(find_dict: dict) -> dict:
+    return handle_db_remove(handle_db_id(find_dict))
+
+
+def main(number: int = 200):
+    docu = make_docu()
+    for name, old_func, new_func in [
+        ('write', deepcopy_write, handle_db_docu),
+        ('find', deepcopy_find, copy_free_find),
+    ]:
+        old_time = timeit.timeit(lambda: old_func(docu), number=number)
+        new_time = timeit.timeit(lambda: new_func(docu), number=number)
+        print('{0:<6} deepcopy: {1:.3f}ms  copy-free: {2:.3f}ms  x{3:.1f}'.format(
+            name, old_time / number * 1000, new_time / number * 1000, old_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+参数校验的微基准测试：对比 verification(verify, optional) 与 预先编译的 Schema 的单次耗时
+  python -m benchmarks.bench_schema
+"""
+import timeit
+from flask import Flask, request
+from rainbond_python.parameter import Parameter
+from rainbond_python.paging import PAGING_SCHEMA
+
+VERIFY = {
+    '$limit': int, '$offset': int, '$orderby': str, '$start_date': str, '$date_type': str,
+    '$end_date': str, '$after': str, '$before': str, '$fields': str,
+}
+OPTIONAL = {'$start_date': '', '$end_date': '', '$date_type': 'update_time',
+            '$offset': 0, '$limit': 10, '$orderby': '', '$after': '', '$before': '', '$fields': ''}
+
+
+def main(number: int = 100000):
+    app = Flask(__name__)
+    with app.test_request_context('/?$limit=20&$offset=40&$orderby=age desc&name=Xiao'):
+        parameter = Parameter(request)
+        param_url = parameter.param_url
+        old_func = lambda: parameter.verification(dict(param_url), VERIFY, OPTIONAL, allow_extra=True)
+        new_func = lambda: parameter.verification(dict(param_url), PAGING_SCHEMA)
+        assert old_func() == new_func()
+        old_time = timeit.timeit(old_func, number=number)
+        new_time = timeit.timeit(new_func, number=number)
+    per_call = number / 1000000
+    print('verification: {0:.2f}us/call  schema: {1:.2f}us/call  x{2:.1f}'.format(
+        old_time / per_call, new_time / per_call, old_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
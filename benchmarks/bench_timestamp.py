@@ -0,0 +1,24 @@
+"""
+时间戳转换的微基准测试：对比 time.mktime() 逐个转换 与 handle_timestamp_list() 批量转换
+  python -m benchmarks.bench_timestamp
+"""
+import time
+import timeit
+from datetime import datetime, timedelta
+from rainbond_python.tools import handle_timestamp_list
+
+
+def main(size: int = 100000, number: int = 5):
+    start = datetime(2021, 1, 1)
+    value_list = [start + timedelta(seconds=i * 37, microseconds=i) for i in range(size)]
+    case_list = [
+        ('mktime', lambda: [int(time.mktime(value.timetuple())) * 1000 for value in value_list]),
+        ('batch', lambda: handle_timestamp_list(value_list)),
+    ]
+    for name, func in case_list:
+        cost = timeit.timeit(func, number=number) / number
+        print('{0:<7} {1:.1f}ms/{2} ({3:.3f}us/value)'.format(name, cost * 1000, size, cost / size * 1000000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import time
+import logging
+from datetime import timedelta
+from pymongo import ASCENDING, ReplaceOne
+from .tools import handle_abnormal, db_now
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='[%(asctime)s] [%(levelname)s] %(message)s'
+)
+
+
+class SoftDeleteArchiver:
+    """
+    假删除数据的归档与清理任务
+      1. 将 remove_time 早于 archive_after 天的文档分批移动到归档集合（写入 archive_time）
+      2. 将 archive_time 早于 purge_after 天的归档文档分批真删除
+    每个批次先写入归档集合再从原集合删除，中断后重新执行会从剩余的文档继续
+      archiver = SoftDeleteArchiver(db, archive_after=30, purge_after=180)
+      print(archiver.run())
+    """
+
+    def __init__(self, db, archive_collection: str = None, archive_after: float = 30, purge_after: float = None, batch_size: int = 500, sleep: float = 0.0, max_batches: int = None, on_progress=None):
+        """
+        :param db: DBConnect 实例
+        :param archive_collection: 归档集合名称，默认为 `原集合名称_archive`
+        :param archive_after: 假删除多少天后归档
+        :param purge_after: 归档多少天后真删除，为 None 时不清理
+        :param batch_size: 每批次处理的文档数
+        :param sleep: 每批次之间的等待时间（秒），用于限制对线上业务的影响
+        :param max_batches: 单次执行最多处理的批次数（归档与清理分别计算），为 None 时处理全部
+        :param on_progress: 每个批次完成后的回调函数，参数为 stats 字典
+        """
+        if batch_size < 1:
+            handle_abnormal(message='参数 batch_size 必须从 1 开始计算', status=500)
+        if archive_after < 0 or (purge_after is not None and purge_after < 0):
+            handle_abnormal(message='归档与清理的天数不能小于 0', status=500)
+        self.db = db
+        self.source = db.mongo_collection
+        self.archive = db.mongo_db[archive_collection or '{0}_archive'.format(self.source.name)]
+        self.archive_after = archive_after
+        self.purge_after = purge_after
+        self.batch_size = batch_size
+        self.sleep = sleep
+        self.max_batches = max_batches
+        self.on_progress = on_progress
+        self.last_id = None
+        self.stats = {
+            'archived': 0, 'purged': 0, 'restored': 0, 'batches': 0,
+            'archive_pending': None, 'purge_pending': None, 'elapsed': 0.0, 'rate': 0.0,
+        }
+
+    def report(self, start: float):
+        self.stats['batches'] += 1
+        self.stats['elapsed'] += time.perf_counter() - start
+        if self.stats['elapsed']:
+            self.stats['rate'] = (self.stats['archived'] + self.stats['purged']) / self.stats['elapsed']
+        logging.info('MongoDB(组件)归档进度: {0}'.format(self.stats))
+        if self.on_progress:
+            self.on_progress(dict(self.stats))
+
+    def archive_batch(self, archive_dict: dict) -> int:
+        """
+        归档一个批次
+        :return: 本批次处理的文档数，为 0 时说明已经没有需要归档的文档
+        """
+        # 从上一批次的最后一个 _id 之后继续查找，避免每个批次都从头扫描
+        find_dict = archive_dict if self.last_id is None else {'$and': [archive_dict, {'_id': {'$gt': self.last_id}}]}
+        docu_list = list(self.source.find(find_dict).sort('_id', 1).limit(self.batch_size))
+        if not docu_list:
+            return 0
+        self.last_id = docu_list[-1]['_id']
+        now = db_now()
+        # 以 _id 覆盖写入，中断后重复执行不会产生重复的归档文档
+        self.archive.bulk_write([
+            ReplaceOne({'_id': docu['_id']}, dict(docu, archive_time=now), upsert=True) for docu in docu_list
+        ], ordered=False)
+        id_list = [docu['_id'] for docu in docu_list]
+        # 只删除仍然满足归档条件的文档，期间被恢复的文档保留在原集合中
+        result = self.source.delete_many({'$and': [archive_dict, {'_id': {'$in': id_list}}]})
+        if result.deleted_count < len(id_list):
+            restored_list = [docu['_id'] for docu in self.source.find({'_id': {'$in': id_list}}, {'_id': 1})]
+            self.archive.delete_many({'_id': {'$in': restored_list}})
+            self.stats['restored'] += len(restored_list)
+        self.stats['archived'] += result.deleted_count
+        self.db.invalidate_cache()
+        return len(docu_list)
+
+    def purge_batch(self, purge_dict: dict) -> int:
+        """
+        清理一个批次的归档文档
+        :return: 本批次删除的文档数
+        """
+        id_list = [docu['_id'] for docu in self.archive.find(purge_dict, {'_id': 1}).sort('_id', 1).limit(self.batch_size)]
+        if not id_list:
+            return 0
+        result = self.archive.delete_many({'_id': {'$in': id_list}})
+        self.stats['purged'] += result.deleted_count
+        return len(id_list)
+
+    def run_batches(self, batch_func, find_dict: dict):
+        batches = 0
+        while self.max_batches is None or batches < self.max_batches:
+            start = time.perf_counter()
+            if not batch_func(find_dict):
+                break
+            batches += 1
+            self.report(start)
+            if self.sleep:
+                time.sleep(self.sleep)
+
+    def archive_docu(self) -> dict:
+        """
+        归档假删除时间超过 archive_after 天的文档
+        """
+        # 与 ensure_indexes() 创建的部分索引一致，只包含假删除的文档
+        try:
+            self.source.create_index([('remove_time', ASCENDING)], name='remove_time_partial',
+                                     partialFilterExpression={'remove_time': {'$exists': True}})
+        except Exception as err:
+            logging.error('MongoDB(组件)集合 {0} 创建索引 remove_time_partial 失败: {1}'.format(
+                self.source.full_name, err))
+        archive_dict = {'remove_time': {'$lt': db_now() - timedelta(days=self.archive_after)}}
+        self.last_id = None
+        self.run_batches(self.archive_batch, archive_dict)
+        self.stats['archive_pending'] = self.source.count_documents(archive_dict)
+        return self.stats
+
+    def purge_docu(self) -> dict:
+        """
+        真删除归档时间超过 purge_after 天的归档文档
+        """
+        if self.purge_after is None:
+            return self.stats
+        self.archive.create_index('archive_time')
+        purge_dict = {'archive_time': {'$lt': db_now() - timedelta(days=self.purge_after)}}
+        self.run_batches(self.purge_batch, purge_dict)
+        self.stats['purge_pending'] = self.archive.count_documents(purge_dict)
+        return self.stats
+
+    def run(self) -> dict:
+        """
+        依次执行归档与清理
+        :return: {'archived': 归档数, 'purged': 清理数, 'restored': 归档期间被恢复的文档数, 'batches': 批次数,
+                  'archive_pending': 剩余待归档数, 'purge_pending': 剩余待清理数, 'elapsed': 耗时（秒）, 'rate': 每秒处理数}
+        """
+        try:
+            self.archive_docu()
+            self.purge_docu()
+        except Exception as err:
+            handle_abnormal(
+                message='MongoDB(组件)归档任务异常',
+                status=500,
+                other={'prompt': str(err), 'stats': self.stats}
+            )
+        return self.stats
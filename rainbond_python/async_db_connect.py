@@ -0,0 +1,369 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from bson import ObjectId, json_util
+from .parameter import Parameter
+from .mongo_client import pool_options_from_env
+from .db_connect import COUNT_STRATEGIES, COUNT_CACHE_SIZE
+from .json_encoder import dumps_json, handle_db_json_list
+from .paging import verify_paging_param, build_paging_query, build_paging_result, build_facet_pipeline, build_facet_result
+from .tools import handle_db_dict, handle_db_list, handle_db_id, handle_db_docu, handle_db_remove, handle_abnormal, handle_db_error, db_now, handle_db_projection, handle_group_pipeline
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='[%(asctime)s] [%(levelname)s] %(message)s'
+)
+
+motor_clients = {}  # 进程内共享的 Motor 客户端，key 与 MongoClientRegistry 相同
+motor_clients_lock = threading.Lock()
+
+
+def get_motor_client(host: str, port: int, username: str = None, password: str = None, **options):
+    """
+    获取共享的 AsyncIOMotorClient，相同 地址+端口+认证信息 只创建一个客户端
+    """
+    if AsyncIOMotorClient is None:
+        raise ImportError('AsyncDBConnect 依赖 motor，请执行: pip install rainbond-python[async]')
+    key = (host, int(port), username, password)
+    with motor_clients_lock:
+        if key not in motor_clients:
+            merged_options = pool_options_from_env()
+            merged_options.update(options)
+            if username or password:
+                merged_options.update(username=username, password=password)
+            motor_clients[key] = AsyncIOMotorClient(
+                host=host, port=int(port), **merged_options)
+        return motor_clients[key]
+
+
+class AsyncDBConnect:
+    """
+    DBConnect 的 asyncio 版本，基于 motor 驱动，方法与 DBConnect 一一对应（需要 await）
+      db = AsyncDBConnect(db='db_name', collection='collection_name')
+      docu_list = await db.find_docu({'name': 'LaoXu'})
+    """
+
+    def __init__(self, db: str, collection: str, home_key='MONGODB_HOST', port_key='MONGODB_PORT', name_key='MONGODB_NAME', password_key='MONGODB_PASSWORD', client_options: dict = None, client=None, filter_fields: dict = None):
+        """
+        :param client: 可选的异步客户端（Eg: 测试时传入内存实现），默认按环境变量创建共享的 AsyncIOMotorClient
+        """
+        self.mongo_home = os.environ.get(home_key, None)
+        self.mongo_port = os.environ.get(port_key, 27017)
+        # 额外的认证用户与密码
+        self.mongo_name = os.environ.get(name_key, None)
+        self.mongo_password = os.environ.get(password_key, None)
+        if client is None:
+            if not self.mongo_home or not self.mongo_port:
+                logging.error('MongoDB(组件)的组件连接信息是不完整的')
+            client = get_motor_client(
+                host=self.mongo_home,
+                port=self.mongo_port,
+                username=self.mongo_name,
+                password=self.mongo_password,
+                **(client_options or {})
+            )
+        self.mongo_client = client
+        self.mongo_db = self.mongo_client[db]
+        self.mongo_collection = self.mongo_db[collection]
+        self.filter_fields = filter_fields or {}
+        # 计数缓存（count='cached' 策略使用），{筛选条件: (过期时间, 数量)}
+        self.count_cache = {}
+
+    async def write_one_docu(self, docu: dict) -> str:
+        try:
+            # 兼容直接指定ID的创建方式，添加创建时间和更新时间
+            new_data = await self.mongo_collection.insert_one(handle_db_docu(docu))
+            return str(new_data.inserted_id)
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现写入错误: {0}'.format(json.dumps(docu, default=str)))
+
+    async def write_many_docu(self, docu_list: list) -> list:
+        new_docu_list = []
+        for docu in docu_list:
+            if not isinstance(docu, dict):
+                handle_abnormal(
+                    message='参数docu_list格式不正确，要求为：[{},{},{}...]',
+                    status=500,
+                    other={'prompt': {'docu_list': str(docu_list)}}
+                )
+            new_docu_list.append(handle_db_docu(docu))
+        try:
+            new_data_list = await self.mongo_collection.insert_many(new_docu_list)
+            return [str(_id) for _id in new_data_list.inserted_ids]
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现写入错误')
+
+    async def does_it_exist(self, docu: dict) -> bool:
+        count = await self.mongo_collection.count_documents(handle_db_id(docu))
+        return count != 0
+
+    async def update_docu(self, find_docu: dict, modify_docu: dict, many=False) -> dict:
+        # 标准更新
+        try:
+            find_docu = handle_db_remove(handle_db_id(find_docu))
+            # 重置更新时间
+            if not modify_docu.__contains__('update_time'):
+                modify_docu = dict(modify_docu, update_time=db_now())
+            if many:
+                student = await self.mongo_collection.update_many(find_docu, {'$set': modify_docu})
+            else:
+                student = await self.mongo_collection.update_one(find_docu, {'$set': modify_docu})
+            # 返回匹配条数、受影响条数
+            return {'matched_count': student.matched_count, 'modified_count': student.modified_count}
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现更新错误')
+
+    async def update_docu_inc(self, find_docu: dict, modify_docu: dict, many=False) -> dict:
+        # 字段自增更新
+        try:
+            find_docu = handle_db_remove(handle_db_id(find_docu))
+            update = {'$inc': modify_docu, '$set': {'update_time': db_now()}}
+            if many:
+                student = await self.mongo_collection.update_many(find_docu, update)
+            else:
+                student = await self.mongo_collection.update_one(find_docu, update)
+            # 返回匹配条数、受影响条数
+            return {'matched_count': student.matched_count, 'modified_count': student.modified_count}
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现更新错误')
+
+    async def delete_docu(self, find_docu: dict, many: bool = False, false_delete: bool = False) -> dict:
+        if false_delete:
+            # 假删除流程
+            result = await self.update_docu(
+                find_docu=find_docu, modify_docu={'remove_time': db_now()}, many=many)
+            if not result['modified_count']:
+                logging.warning('MongoDB(组件)出现删除异常: 没有任何文档被假删除')
+            return {'deleted_count': result['modified_count'], 'false_delete': false_delete}
+        try:
+            find_docu = handle_db_remove(handle_db_id(find_docu))
+            # 真删除流程
+            if many:
+                result = await self.mongo_collection.delete_many(find_docu)
+            else:
+                result = await self.mongo_collection.delete_one(find_docu)
+            if not result.deleted_count:
+                logging.error('MongoDB(组件)出现删除异常: 没有任何文档被真删除')
+            return {'deleted_count': result.deleted_count, 'false_delete': false_delete}
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现删除错误')
+
+    async def find_docu(self, find_dict: dict, many: bool = True, projection=None) -> list:
+        try:
+            deep_find_dict = handle_db_remove(handle_db_id(find_dict))
+            projection = handle_db_projection(projection)
+            if many:
+                # 多文档查询方式
+                docu_list = await self.mongo_collection.find(deep_find_dict, projection).to_list(None)
+                return handle_db_list(docu_list)
+            # 单文档查询方式
+            query_dict = await self.mongo_collection.find_one(deep_find_dict, projection)
+            return [handle_db_dict(query_dict)] if query_dict else []
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现查询错误')
+
+    async def iter_docu(self, find_dict: dict, batch_size: int = 1000, sort_list: list = None, projection=None):
+        """
+        以异步生成器方式逐个返回查询结果
+          async for docu in db.iter_docu({'age': 18}):
+              ...
+        """
+        deep_find_dict = handle_db_remove(handle_db_id(find_dict))
+        query_cursor = self.mongo_collection.find(
+            deep_find_dict, handle_db_projection(projection)).batch_size(batch_size)
+        if sort_list:
+            query_cursor = query_cursor.sort(sort_list)
+        async for docu in query_cursor:
+            yield handle_db_dict(docu)
+
+    async def aggregate_group(self, field: str, find_dict: dict = None, unwind: bool = True, stages: list = None) -> list:
+        pipeline = handle_group_pipeline(field, find_dict, unwind) + (stages or [])
+        try:
+            return await self.mongo_collection.aggregate(pipeline, allowDiskUse=True).to_list(None)
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现查询错误')
+
+    async def find_docu_distinct(self, find_str: str, find_dict: dict = None, unwind: bool = True) -> int:
+        result = await self.aggregate_group(find_str, find_dict, unwind, stages=[{'$count': 'count'}])
+        return result[0]['count'] if result else 0
+
+    async def distinct_values(self, field: str, find_dict: dict = None, limit: int = None, unwind: bool = True) -> list:
+        stages = [{'$sort': {'_id': 1}}]
+        if limit:
+            stages.append({'$limit': limit})
+        return [item['_id'] for item in await self.aggregate_group(field, find_dict, unwind, stages)]
+
+    async def group_counts(self, field: str, find_dict: dict = None, limit: int = 10, unwind: bool = True) -> list:
+        stages = [{'$sort': {'count': -1, '_id': 1}}]
+        if limit:
+            stages.append({'$limit': limit})
+        stages.append({'$project': {'_id': 0, 'value': '$_id', 'count': 1}})
+        return await self.aggregate_group(field, find_dict, unwind, stages)
+
+    async def find_docu_by_id(self, id: str, raise_err=True, projection=None) -> dict:
+        """
+        根据id查找记录
+        :param id:记录id
+        :param raise_err:是否抛出异常（使用abort抛出），否则返回{}
+        :param projection:可选的字段投影
+        :return: 将结果转换为字典
+        """
+        if not isinstance(id, str):
+            handle_abnormal(
+                message='类型错误, 预期 %s ,却得到 %s' % (str, type(id)),
+                status=400,
+            )
+        entity = await self.find_docu({'id': id}, many=False, projection=projection)
+        if not entity:
+            if raise_err:
+                handle_abnormal(
+                    message='找不到 id= %s 的记录' % (id,),
+                    status=400,
+                )
+            return {}
+        return entity[0]
+
+    async def find_docu_by_id_list(self, id_list: list, projection=None, chunk_size: int = 1000, missing: str = 'ignore', dedupe: bool = True) -> list:
+        """
+        根据id列表查找记录列表，各个分块的 $in 查询并发执行，并按传入的id顺序返回，参数与 DBConnect.find_docu_by_id_list() 相同
+        """
+        if not isinstance(id_list, list):
+            handle_abnormal(
+                message='类型错误, 预期 %s ,却得到 %s' % (list, type(id_list)),
+                status=400,
+            )
+        try:
+            object_id_list = [ObjectId(str(id)) for id in id_list]
+        except Exception as err:
+            handle_abnormal(
+                message='MongoDB _id 格式解析异常',
+                status=400,
+                other={'prompt': str(err)}
+            )
+        if dedupe:
+            object_id_list = list(dict.fromkeys(object_id_list))
+        unique_id_list = list(dict.fromkeys(object_id_list))
+        chunk_list = await asyncio.gather(*[
+            self.find_docu({'_id': {'$in': unique_id_list[i:i + chunk_size]}}, projection=projection)
+            for i in range(0, len(unique_id_list), chunk_size)
+        ])
+        docu_dict = {docu['id']: docu for chunk in chunk_list for docu in chunk}
+        data = []
+        missing_list = []
+        for object_id in object_id_list:
+            docu = docu_dict.get(str(object_id), None)
+            if docu is None:
+                missing_list.append(str(object_id))
+                if missing == 'none':
+                    data.append(None)
+            else:
+                data.append(docu)
+        if missing_list and missing == 'raise':
+            handle_abnormal(
+                message='找不到部分id的记录',
+                status=400,
+                other={'prompt': missing_list}
+            )
+        return data
+
+    async def get_cached_count(self, find_dict: dict, ttl: int) -> int:
+        """
+        按规范化后的筛选条件缓存计数结果，过期后重新计数，与 DBConnect.get_cached_count() 相同
+        """
+        key = json_util.dumps(find_dict, sort_keys=True)
+        now = time.monotonic()
+        cached = self.count_cache.get(key, None)
+        if cached and cached[0] > now:
+            return cached[1]
+        count = await self.mongo_collection.count_documents(find_dict)
+        if len(self.count_cache) >= COUNT_CACHE_SIZE:
+            # 先清理过期的条目，仍然超过上限时全部清空
+            self.count_cache = {k: v for k, v in self.count_cache.items() if v[0] > now}
+            if len(self.count_cache) >= COUNT_CACHE_SIZE:
+                self.count_cache = {}
+        self.count_cache[key] = (now + ttl, count)
+        return count
+
+    async def count_docu(self, find_dict: dict, count: str = 'exact', count_cap: int = 10000, count_ttl: int = 60) -> tuple:
+        """
+        按指定策略统计文档数量，参数与 DBConnect.count_docu() 相同（不支持 collection/max_time_ms）
+        :return: (数量, 实际使用的计数策略)
+        """
+        if count not in COUNT_STRATEGIES:
+            raise Exception('计数策略必须是 {0} 之一'.format(COUNT_STRATEGIES))
+        if count == 'estimated':
+            if find_dict == handle_db_remove({}):
+                estimated, remove_count = await asyncio.gather(
+                    self.mongo_collection.estimated_document_count(),
+                    self.get_cached_count({'remove_time': {'$exists': True}}, count_ttl))
+                return max(estimated - remove_count, 0), 'estimated'
+            count = 'exact'
+        if count == 'capped':
+            capped = await self.mongo_collection.count_documents(find_dict, limit=count_cap + 1)
+            if capped > count_cap:
+                return '{0}+'.format(count_cap), 'capped'
+            return capped, 'capped'
+        if count == 'cached':
+            return await self.get_cached_count(find_dict, count_ttl), 'cached'
+        return await self.mongo_collection.count_documents(find_dict), 'exact'
+
+    async def find_facet(self, find_dict: dict, sort_list: list, limit: int, skip: int = 0, items_dict: dict = None, projection: dict = None) -> dict:
+        """
+        通过一次 $match + $facet 聚合，同时获取当前页文档、筛选总数和假删除文档数，参数与 DBConnect.find_facet() 相同（不支持 collection/max_time_ms）
+        :return: {'items': 原始文档列表, 'total': 筛选总数, 'dummy_remove': 假删除文档数}
+        """
+        pipeline = build_facet_pipeline(find_dict, sort_list, limit, skip, items_dict, projection)
+        facet_list = await self.mongo_collection.aggregate(pipeline, allowDiskUse=True).to_list(1)
+        return build_facet_result(facet_list[0] if facet_list else {})
+
+    async def find_paging(self, parameter: Parameter, keyset: bool = False, facet: bool = False, count: str = 'exact', count_cap: int = 10000, count_ttl: int = 60, projection=None, fields: list = None, as_json: bool = False) -> dict:
+        """
+        分页查询，文档查询、筛选计数、假删除计数三者并发执行，参数与 DBConnect.find_paging() 相同
+        不支持 read_preference/max_time_ms（可以在创建客户端时通过 client_options 设置），也不使用查询结果缓存
+        """
+        param = verify_paging_param(parameter)
+        try:
+            query = build_paging_query(
+                param, filter_fields=self.filter_fields, projection=projection, fields=fields, keyset=keyset)
+            if query['use_text']:
+                # $text 只能出现在聚合的第一个阶段，全文搜索时不使用 $facet
+                facet = False
+            if facet:
+                # 一次网络往返完成查询与计数
+                facet_data = await self.find_facet(
+                    find_dict=query['find_dict'], sort_list=query['query_sort'], limit=query['fetch_limit'],
+                    skip=query['skip'], items_dict=query['query_dict'], projection=query['projection'])
+                docu_list = facet_data['items']
+                records_filtered = facet_data['total']
+                remove_count = facet_data['dummy_remove']
+                total_strategy = 'exact'
+            else:
+                # 查找假删除数据的数据量，非精确计数策略时使用缓存
+                remove_dict = {'remove_time': {'$exists': True}}
+                if count == 'exact':
+                    remove_task = self.mongo_collection.count_documents(remove_dict)
+                else:
+                    remove_task = self.get_cached_count(remove_dict, count_ttl)
+                find_data = self.mongo_collection.find(query['query_dict'], query['projection'])
+                if query['query_sort']:
+                    find_data = find_data.sort(query['query_sort'])
+                find_data = find_data.skip(query['skip']).limit(query['fetch_limit'])
+                docu_list, (records_filtered, total_strategy), remove_count = await asyncio.gather(
+                    find_data.to_list(query['fetch_limit']),
+                    self.count_docu(query['find_dict'], count=count, count_cap=count_cap, count_ttl=count_ttl),
+                    remove_task,
+                )
+            if as_json:
+                return dumps_json(build_paging_result(
+                    query, docu_list, records_filtered, remove_count, total_strategy, list_handler=handle_db_json_list))
+            return build_paging_result(query, docu_list, records_filtered, remove_count, total_strategy)
+        except Exception as err:
+            handle_db_error(err, message='计算组件分页参数异常', status=400)
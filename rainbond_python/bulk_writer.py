@@ -0,0 +1,199 @@
+import time
+import logging
+import threading
+from collections import deque
+from pymongo import InsertOne, UpdateOne, UpdateMany
+from pymongo.errors import BulkWriteError
+from .tools import handle_db_id, handle_db_docu, handle_db_remove, handle_abnormal, db_now
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='[%(asctime)s] [%(levelname)s] %(message)s'
+)
+
+
+class BulkWriter:
+    """
+    批量写入器，支持混合的 新增/更新/新增或更新/假删除 操作，按批次以无序 bulk_write 写入
+      with db.bulk_writer(batch_size=1000) as writer:
+          writer.insert({'name': 'LaoXu'})
+          writer.update({'name': 'LaoHe'}, {'age': 18})
+          writer.upsert({'name': 'LaoYang'}, {'age': 35})
+          writer.soft_delete({'id': '60053fa139842d28d7563c6c'})
+      print(writer.stats)
+    """
+
+    def __init__(self, db, batch_size: int = 1000, background: bool = False, flush_interval: float = 1.0, max_reports: int = 100):
+        """
+        :param db: DBConnect 实例
+        :param batch_size: 每批次的最大操作数，达到后自动写入
+        :param background: 是否由后台线程按 flush_interval 间隔写入
+        :param flush_interval: 后台写入的时间间隔（秒）
+        :param max_reports: 保留最近多少个批次的写入报告
+        """
+        if batch_size < 1:
+            handle_abnormal(message='参数 batch_size 必须从 1 开始计算', status=500)
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []  # [(序号, 操作类型, pymongo 操作)]
+        self.sequence = 0  # 操作序号，用于定位出错的操作
+        self.reports = deque(maxlen=max_reports)  # 最近批次的写入报告
+        self.stats = {
+            'batches': 0, 'operations': 0, 'inserted_count': 0, 'matched_count': 0,
+            'modified_count': 0, 'upserted_count': 0, 'error_count': 0, 'latency': 0.0,
+        }
+        self.lock = threading.Lock()  # 保护 pending
+        self.flush_lock = threading.Lock()  # 保证同一时间只有一个批次在写入
+        self.closed = False
+        self.thread = None
+        self.wakeup = threading.Event()
+        if background:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def add(self, op_type: str, operation) -> int:
+        if self.closed:
+            handle_abnormal(message='BulkWriter 已关闭，无法继续写入', status=500)
+        with self.lock:
+            index = self.sequence
+            self.sequence += 1
+            self.pending.append((index, op_type, operation))
+            full = len(self.pending) >= self.batch_size
+        if full:
+            if self.thread:
+                self.wakeup.set()
+            else:
+                self.flush()
+        return index
+
+    def insert(self, docu: dict) -> int:
+        """
+        新增文档，与 write_one_docu 相同地处理 id 和创建/更新时间
+        :return: 操作序号
+        """
+        return self.add('insert', InsertOne(handle_db_docu(docu)))
+
+    def update(self, find_docu: dict, modify_docu: dict, many: bool = False) -> int:
+        """
+        更新文档，与 update_docu 相同地排除假删除数据并重置更新时间
+        :return: 操作序号
+        """
+        find_docu = handle_db_remove(handle_db_id(find_docu))
+        modify_docu = dict(modify_docu)
+        modify_docu.setdefault('update_time', db_now())
+        operation = UpdateMany if many else UpdateOne
+        return self.add('update', operation(find_docu, {'$set': modify_docu}))
+
+    def upsert(self, find_docu: dict, modify_docu: dict) -> int:
+        """
+        更新文档，不存在时新增（新增时补充创建时间）
+        :return: 操作序号
+        """
+        find_docu = handle_db_remove(handle_db_id(find_docu))
+        now = db_now()
+        modify_docu = dict(modify_docu)
+        modify_docu.setdefault('update_time', now)
+        update = {'$set': modify_docu}
+        if 'creation_time' not in modify_docu:
+            update['$setOnInsert'] = {'creation_time': now}
+        return self.add('upsert', UpdateOne(find_docu, update, upsert=True))
+
+    def soft_delete(self, find_docu: dict, many: bool = False) -> int:
+        """
+        假删除文档，与 delete_docu(false_delete=True) 相同地写入 remove_time
+        :return: 操作序号
+        """
+        find_docu = handle_db_remove(handle_db_id(find_docu))
+        now = db_now()
+        operation = UpdateMany if many else UpdateOne
+        return self.add('soft_delete', operation(find_docu, {'$set': {'remove_time': now, 'update_time': now}}))
+
+    def flush(self) -> list:
+        """
+        写入全部等待中的操作
+        :return: 本次写入的批次报告列表
+        """
+        reports = []
+        with self.flush_lock:
+            while True:
+                with self.lock:
+                    batch = self.pending[:self.batch_size]
+                    self.pending = self.pending[self.batch_size:]
+                if not batch:
+                    break
+                reports.append(self.write_batch(batch))
+        return reports
+
+    def write_batch(self, batch: list) -> dict:
+        """
+        以无序方式写入一个批次，单个操作失败不影响其他操作
+        :return: {'size', 'latency', 'inserted_count', 'matched_count', 'modified_count', 'upserted_count', 'errors'}
+        """
+        requests = [operation for _, _, operation in batch]
+        report = {
+            'size': len(batch), 'latency': 0.0, 'inserted_count': 0, 'matched_count': 0,
+            'modified_count': 0, 'upserted_count': 0, 'errors': [],
+        }
+        start = time.perf_counter()
+        try:
+            result = self.db.mongo_collection.bulk_write(requests, ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as err:
+            details = err.details
+        except Exception as err:
+            # 网络等整体异常，整个批次都视为失败
+            logging.warning('MongoDB(组件)批量写入异常: {0}'.format(err))
+            details = {'writeErrors': [{'index': i, 'code': None, 'errmsg': str(err)} for i in range(len(batch))]}
+        report['latency'] = time.perf_counter() - start
+        # 部分操作可能已经写入，无论成功与否都使查询缓存失效
+        self.db.invalidate_cache()
+        report['inserted_count'] = details.get('nInserted', 0)
+        report['matched_count'] = details.get('nMatched', 0)
+        report['modified_count'] = details.get('nModified', 0)
+        report['upserted_count'] = details.get('nUpserted', 0)
+        for write_error in details.get('writeErrors', []):
+            index, op_type, _ = batch[write_error['index']]
+            report['errors'].append({
+                'index': index, 'op': op_type,
+                'code': write_error.get('code'), 'message': write_error.get('errmsg'),
+            })
+        if report['errors']:
+            logging.warning('MongoDB(组件)批量写入中有 {0} 个操作失败'.format(len(report['errors'])))
+        with self.lock:
+            self.reports.append(report)
+            self.stats['batches'] += 1
+            self.stats['operations'] += report['size']
+            self.stats['error_count'] += len(report['errors'])
+            self.stats['latency'] += report['latency']
+            for key in ('inserted_count', 'matched_count', 'modified_count', 'upserted_count'):
+                self.stats[key] += report[key]
+        return report
+
+    def run(self):
+        # 后台线程，按时间间隔或批次已满时写入
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as err:
+                logging.warning('MongoDB(组件)后台批量写入异常: {0}'.format(err))
+
+    def close(self):
+        """
+        停止后台线程并写入剩余的操作
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.thread:
+            self.wakeup.set()
+            self.thread.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
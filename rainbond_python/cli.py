@@ -1,8 +1,10 @@
 import os
 import sys
+import json
 import zipfile
 import argparse
 from pathlib import Path
+from werkzeug.exceptions import HTTPException
 
 
 def main():
@@ -11,8 +13,25 @@ def main():
     parser = argparse.ArgumentParser(description='Rainbond Python CLI')
     parser.add_argument('-c', '--create', help='Create Rainbond Python Component',
                         action='store', dest='component_name')
+    parser.add_argument('-a', '--archive', help='Archive soft-deleted documents of DB.COLLECTION (connection from MONGODB_* env)',
+                        action='store', dest='archive_target')
+    parser.add_argument('--archive-after', help='Archive documents soft-deleted more than N days ago (default: 30)',
+                        action='store', type=float, default=30)
+    parser.add_argument('--purge-after', help='Hard-delete archived documents older than N days (default: never)',
+                        action='store', type=float, default=None)
+    parser.add_argument('--archive-collection', help='Archive collection name (default: COLLECTION_archive)',
+                        action='store', default=None)
+    parser.add_argument('--batch-size', help='Documents per batch (default: 500)',
+                        action='store', type=int, default=500)
+    parser.add_argument('--sleep', help='Seconds to sleep between batches (default: 0)',
+                        action='store', type=float, default=0.0)
+    parser.add_argument('--max-batches', help='Stop after N batches per phase, rerun to resume (default: all)',
+                        action='store', type=int, default=None)
     args = parser.parse_args()
 
+    if args.archive_target:
+        archive(args)
+
     if args.component_name:
         component_root = Path(__file__).resolve().parents[0]
         os.mkdir(args.component_name)
@@ -22,6 +41,30 @@ def main():
             'Successfully created `{0}` component. Run command:\n$ cd {0}\n$ pip3 install -r requirements.txt\n$ python3 app.py'.format(args.component_name))
 
 
+def archive(args):
+    """归档并清理假删除数据"""
+    from .db_connect import DBConnect
+    if '.' not in args.archive_target:
+        sys.exit('Archive target must be DB.COLLECTION, got `{0}`'.format(args.archive_target))
+    db_name, collection_name = args.archive_target.split('.', 1)
+    db = DBConnect(db=db_name, collection=collection_name)
+    archiver = db.archiver(
+        archive_after=args.archive_after,
+        purge_after=args.purge_after,
+        archive_collection=args.archive_collection,
+        batch_size=args.batch_size,
+        sleep=args.sleep,
+        max_batches=args.max_batches,
+        on_progress=lambda stats: print(
+            'batch {batches}: archived={archived} purged={purged} rate={rate:.1f}/s'.format(**stats), flush=True),
+    )
+    try:
+        stats = archiver.run()
+    except HTTPException as err:
+        sys.exit(err.get_response().get_data(as_text=True))
+    print(json.dumps(stats))
+
+
 def extract(z_file, path):
     """解压缩文件到指定目录"""
     f = zipfile.ZipFile(z_file, 'r')
@@ -0,0 +1,236 @@
+import time
+import atexit
+import logging
+import threading
+from bson import json_util
+from pymongo import UpdateOne, UpdateMany
+from pymongo.errors import BulkWriteError
+from .tools import handle_db_id, handle_db_remove, handle_abnormal, db_now
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='[%(asctime)s] [%(levelname)s] %(message)s'
+)
+
+# 可以重试的写入错误码（网络、超时、主节点切换、写冲突等），其他错误码（Eg: 对非数字字段自增）重试也不会成功
+TRANSIENT_ERROR_CODES = frozenset([
+    6, 7, 50, 89, 91, 112, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436,
+])
+
+
+def parse_amount(value):
+    # Redis 返回的是字符串，整数与小数分别解析
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+class CounterBuffer:
+    """
+    自增计数的写后缓冲，合并同一 (查询条件, 字段) 的自增量，按时间间隔或数量阈值以一次 bulk_write 写入
+      counter = db.counter_buffer(flush_interval=1.0)
+      counter.incr({'id': '60053fa139842d28d7563c6c'}, {'views': 1})
+    未写入的自增量最多丢失 flush_interval 秒（进程异常退出时），正常退出时会自动写入
+    """
+
+    def __init__(self, db, redis_connect=None, flush_interval: float = 1.0, max_keys: int = 1000, touch_update_time: bool = True, prefix: str = 'rainbond_counter'):
+        """
+        :param db: DBConnect 实例
+        :param redis_connect: RedisConnect 实例，设置后在 Redis 中合并自增量（多个进程共享），默认在进程内存中合并
+        :param flush_interval: 写入的时间间隔（秒），也是进程异常退出时最多丢失的时间范围
+        :param max_keys: 等待写入的 (查询条件, 字段) 数量达到该值时立即写入
+        :param touch_update_time: 写入时是否同时更新 update_time（每次写入更新一次）
+        :param prefix: Redis 键前缀
+        """
+        if flush_interval <= 0:
+            handle_abnormal(message='参数 flush_interval 必须大于 0', status=500)
+        self.db = db
+        self.redis_connect = redis_connect
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self.touch_update_time = touch_update_time
+        self.redis_key = '{0}:{1}'.format(prefix, db.mongo_collection.full_name)
+        self.pending = {}  # 查询条件 -> {字段: 自增量}
+        self.pending_keys = 0  # 等待写入的 (查询条件, 字段) 数量
+        self.stats = {
+            'increments': 0, 'flushes': 0, 'operations': 0, 'modified_count': 0,
+            'error_count': 0, 'dropped_count': 0, 'latency': 0.0,
+        }
+        self.lock = threading.Lock()  # 保护 pending
+        self.flush_lock = threading.Lock()  # 保证同一时间只有一次写入
+        self.closed = False
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def incr(self, find_docu: dict, modify_docu: dict, many: bool = False):
+        """
+        记录自增量，与 update_docu_inc 的参数相同
+        :param find_docu: 查询条件
+        :param modify_docu: {字段: 自增量}
+        :param many: 是否更新全部匹配的文档
+        """
+        if self.closed:
+            handle_abnormal(message='CounterBuffer 已关闭，无法继续计数', status=500)
+        if not isinstance(modify_docu, dict) or not all(
+                isinstance(amount, (int, float)) and not isinstance(amount, bool) for amount in modify_docu.values()):
+            handle_abnormal(
+                message='自增内容格式不正确，要求为：{字段: 数字}',
+                status=500,
+                other={'prompt': str(modify_docu)}
+            )
+        find_docu = handle_db_remove(handle_db_id(find_docu))
+        # 规范化的查询条件作为合并的键
+        key = json_util.dumps([many, find_docu], json_options=json_util.CANONICAL_JSON_OPTIONS)
+        if self.redis_connect:
+            try:
+                self.redis_incr({json_util.dumps([key, field]): amount for field, amount in modify_docu.items()})
+            except Exception as err:
+                handle_abnormal(message='Redis 计数写入失败', status=500, other={'prompt': str(err)})
+            with self.lock:
+                self.stats['increments'] += 1
+                self.pending_keys += len(modify_docu)
+                full = self.pending_keys >= self.max_keys
+        else:
+            with self.lock:
+                fields = self.pending.setdefault(key, {})
+                for field, amount in modify_docu.items():
+                    if field not in fields:
+                        self.pending_keys += 1
+                    fields[field] = fields.get(field, 0) + amount
+                self.stats['increments'] += 1
+                full = self.pending_keys >= self.max_keys
+        if full:
+            self.wakeup.set()
+
+    def redis_incr(self, amounts: dict):
+        # 统一使用 HINCRBYFLOAT，同一字段先后合并整数和小数时不会报错，整数结果由 parse_amount() 还原为 int
+        pipe = self.redis_connect.connect().pipeline(transaction=False)
+        for hash_key, amount in amounts.items():
+            pipe.hincrbyfloat(self.redis_key, hash_key, amount)
+        pipe.execute()
+
+    def take_pending(self) -> dict:
+        """
+        取出全部等待写入的自增量
+        :return: {查询条件: {字段: 自增量}}
+        """
+        with self.lock:
+            self.pending_keys = 0
+            if not self.redis_connect:
+                pending, self.pending = self.pending, {}
+                return pending
+        # 在一个事务中读取并删除，多个进程同时写入时每个自增量只会被取出一次
+        pipe = self.redis_connect.connect().pipeline(transaction=True)
+        pipe.hgetall(self.redis_key)
+        pipe.delete(self.redis_key)
+        raw, _ = pipe.execute()
+        pending = {}
+        for hash_key, amount in raw.items():
+            key, field = json_util.loads(hash_key)
+            pending.setdefault(key, {})[field] = parse_amount(amount)
+        return pending
+
+    def restore_pending(self, pending: dict):
+        # 写入失败的自增量放回缓冲区，下次继续写入
+        if self.redis_connect:
+            try:
+                self.redis_incr({
+                    json_util.dumps([key, field]): amount for key, fields in pending.items() for field, amount in fields.items()
+                })
+            except Exception as err:
+                # 已经从 Redis 中取出，无法放回时记录丢失的自增量
+                logging.error('Redis 计数放回失败，丢失的自增量 {0}: {1}'.format(pending, err))
+            return
+        with self.lock:
+            for key, fields in pending.items():
+                current = self.pending.setdefault(key, {})
+                for field, amount in fields.items():
+                    if field not in current:
+                        self.pending_keys += 1
+                    current[field] = current.get(field, 0) + amount
+
+    def flush(self) -> dict:
+        """
+        写入全部等待中的自增量
+        :return: {'operations': 操作数, 'modified_count': 受影响条数, 'errors': 失败后等待重试的数量, 'dropped': 无法写入而丢弃的数量, 'latency': 耗时}
+        """
+        with self.flush_lock:
+            pending = self.take_pending()
+            report = {'operations': len(pending), 'modified_count': 0, 'errors': 0, 'dropped': 0, 'latency': 0.0}
+            if not pending:
+                return report
+            key_list = list(pending.keys())
+            requests = []
+            for key in key_list:
+                many, find_docu = json_util.loads(key)
+                update = {'$inc': pending[key]}
+                if self.touch_update_time:
+                    update['$set'] = {'update_time': db_now()}
+                requests.append((UpdateMany if many else UpdateOne)(find_docu, update))
+            failed = {}
+            start = time.perf_counter()
+            try:
+                result = self.db.mongo_collection.bulk_write(requests, ordered=False)
+                report['modified_count'] = result.modified_count
+            except BulkWriteError as err:
+                report['modified_count'] = err.details.get('nModified', 0)
+                for write_error in err.details.get('writeErrors', []):
+                    key = key_list[write_error['index']]
+                    if write_error.get('code', None) in TRANSIENT_ERROR_CODES:
+                        failed[key] = pending[key]
+                        continue
+                    report['dropped'] += 1
+                    logging.error('MongoDB(组件)计数写入失败，已丢弃 {0} {1}: {2}'.format(
+                        key, pending[key], write_error.get('errmsg', write_error)))
+            except Exception as err:
+                logging.warning('MongoDB(组件)计数写入异常: {0}'.format(err))
+                failed = pending
+            report['latency'] = time.perf_counter() - start
+            self.db.invalidate_cache()
+            if failed:
+                report['errors'] = len(failed)
+                logging.warning('MongoDB(组件)计数写入中有 {0} 个操作失败，将在下次写入时重试'.format(len(failed)))
+                self.restore_pending(failed)
+            with self.lock:
+                self.stats['flushes'] += 1
+                self.stats['operations'] += report['operations']
+                self.stats['modified_count'] += report['modified_count']
+                self.stats['error_count'] += report['errors']
+                self.stats['dropped_count'] += report['dropped']
+                self.stats['latency'] += report['latency']
+            return report
+
+    def run(self):
+        # 后台线程，按时间间隔或数量达到阈值时写入
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as err:
+                logging.warning('MongoDB(组件)后台计数写入异常: {0}'.format(err))
+
+    def close(self):
+        """
+        停止后台线程并写入剩余的自增量
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join()
+        self.flush()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,23 +1,40 @@
 import os
 import json
-import pymongo
 import logging
 import math
-import copy
-from datetime import datetime
+import time
+import threading
 from .parameter import Parameter
-from .tools import handle_date, handle_db_to_list, handle_db_dict, handle_db_id, handle_db_remove, handle_abnormal
+from .mongo_client import get_mongo_client, parse_read_preference, parse_write_concern
+from .bulk_writer import BulkWriter
+from .archiver import SoftDeleteArchiver
+from .counter_buffer import CounterBuffer
+from .index_advisor import ensure_indexes, explain_query
+from .query_cache import QueryCache
+from .loader import DocuLoader, get_request_loader, clear_request_loaders
+from .json_encoder import dumps_json, handle_db_json_list
+from .paging import verify_paging_param, build_paging_query, build_paging_result, build_facet_pipeline, build_facet_result
+from .tools import handle_db_to_list, handle_db_dict, handle_db_id, handle_db_docu, handle_db_remove, handle_abnormal, handle_db_error, db_now, handle_json_stream, handle_db_projection, handle_group_pipeline, FILTER_MODES
 from flask import abort, Response
-from bson import ObjectId
+from bson import ObjectId, json_util
 
 logging.basicConfig(
     level=logging.WARNING,
     format='[%(asctime)s] [%(levelname)s] %(message)s'
 )
 
+COUNT_STRATEGIES = ('exact', 'estimated', 'capped', 'cached')
+COUNT_CACHE_SIZE = 1000  # 计数缓存的最大条目数
+
 
 class DBConnect:
-    def __init__(self, db: str, collection: str, home_key='MONGODB_HOST', port_key='MONGODB_PORT', name_key='MONGODB_NAME', password_key='MONGODB_PASSWORD'):
+    def __init__(self, db: str, collection: str, home_key='MONGODB_HOST', port_key='MONGODB_PORT', name_key='MONGODB_NAME', password_key='MONGODB_PASSWORD', client_options: dict = None, indexes: list = None, diagnose: bool = False, diagnose_ratio: float = 10.0, cache: QueryCache = None, filter_fields: dict = None, read_preference=None, write_concern=None, max_time_ms: int = None, batch_size: int = None):
+        """
+        :param read_preference: 默认的读偏好（Eg: 'secondaryPreferred'），可以在单次查询中覆盖
+        :param write_concern: 默认的写关注（Eg: {'w': 'majority', 'wtimeout': 5000}），可以在单次写入中覆盖
+        :param max_time_ms: 默认的查询执行时间上限（毫秒），也可以通过环境变量 MONGODB_MAX_TIME_MS 设置
+        :param batch_size: 默认的查询游标批次大小
+        """
         self.mongo_home = os.environ.get(home_key, None)
         self.mongo_port = os.environ.get(port_key, 27017)
         # 额外的认证用户与密码
@@ -29,81 +46,151 @@ class DBConnect:
         else:
             logging.warning('已连接地址为 {0}:{1} 的 MongoDB(组件)'.format(
                 self.mongo_home, self.mongo_port))
-        if self.mongo_name or self.mongo_password:
-            # 额外的认证
-            self.mongo_client = pymongo.MongoClient(
-                host=self.mongo_home,
-                port=int(self.mongo_port),
-                username=self.mongo_name,
-                password=self.mongo_password
-            )
-        else:
-            # 常规连接
-            self.mongo_client = pymongo.MongoClient(
-                host=self.mongo_home,
-                port=int(self.mongo_port)
-            )
+        # 从进程级注册表获取共享的客户端，相同连接信息的 DBConnect 共用一个连接池
+        self.mongo_client = get_mongo_client(
+            host=self.mongo_home,
+            port=self.mongo_port,
+            username=self.mongo_name,
+            password=self.mongo_password,
+            **(client_options or {})
+        )
         self.mongo_db = self.mongo_client[db]
-        self.mongo_collection = self.mongo_db[collection]
+        self.mongo_collection = self.mongo_db.get_collection(
+            collection,
+            read_preference=parse_read_preference(read_preference),
+            write_concern=parse_write_concern(write_concern)
+        )
+        # 查询的执行时间上限（毫秒）与游标批次大小，为 None 时不限制/使用驱动默认值
+        env_max_time_ms = os.environ.get('MONGODB_MAX_TIME_MS', None)
+        self.max_time_ms = max_time_ms or (int(env_max_time_ms) if env_max_time_ms else None)
+        self.batch_size = batch_size
+        # 声明式索引，启动时确保索引存在
+        if indexes is not None:
+            ensure_indexes(self.mongo_collection, indexes)
+        # 诊断模式，对分页查询执行 explain() 并输出低效查询与索引建议
+        self.diagnose = diagnose or os.environ.get('MONGODB_DIAGNOSE', '') == 'true'
+        self.diagnose_ratio = diagnose_ratio
+        self.last_explain = None
+        # 计数缓存（count='cached' 策略使用），{筛选条件: (过期时间, 数量)}
+        self.count_cache = {}
+        self.count_cache_lock = threading.Lock()
+        # 可选的查询结果缓存，通过当前实例写入时自动失效
+        self.cache = cache
+        # 自增计数的写后缓冲（update_docu_inc(buffered=True) 使用），首次使用时创建
+        self.counter = None
+        # 分页查询中字符串筛选字段的匹配方式，{字段: exact/prefix/text/regex}，未配置的字段使用 regex
+        self.filter_fields = filter_fields or {}
+        for filter_key, filter_mode in self.filter_fields.items():
+            if filter_mode not in FILTER_MODES:
+                logging.error('筛选字段 {0} 的匹配方式必须是 {1} 之一'.format(filter_key, FILTER_MODES))
+
+    def invalidate_cache(self):
+        """
+        使当前集合的查询结果缓存和当前请求的批量加载器缓存失效，通过当前实例写入时会自动调用
+        """
+        clear_request_loaders(self)
+        if self.cache:
+            self.cache.invalidate(self.mongo_collection.full_name)
+
+    def get_cache(self, *parts) -> tuple:
+        """
+        :return: (是否命中, 缓存键, 结果)，缓存键包含读取时的版本号，未命中时以同一个版本号写入
+        """
+        if not self.cache:
+            return False, None, None
+        key = self.cache.make_key(*parts)
+        generation = self.cache.snapshot(self.mongo_collection.full_name)
+        hit, value = self.cache.get(self.mongo_collection.full_name, key, generation=generation)
+        return hit, (key, generation), value
+
+    def set_cache(self, cache_key: tuple, value):
+        if self.cache and cache_key:
+            self.cache.set(self.mongo_collection.full_name, cache_key[0], value, generation=cache_key[1])
 
-    def write_one_docu(self, docu: dict) -> str:
+    def get_collection(self, read_preference=None, write_concern=None):
+        """
+        获取单次调用使用的集合，未指定 读偏好/写关注 时返回实例默认配置的集合
+        """
+        if read_preference is None and write_concern is None:
+            return self.mongo_collection
+        return self.mongo_collection.with_options(
+            read_preference=parse_read_preference(read_preference),
+            write_concern=parse_write_concern(write_concern)
+        )
+
+    def get_time_options(self, max_time_ms: int = None) -> dict:
+        """
+        单次查询的执行时间上限参数，用于 count_documents()/aggregate() 等方法
+        """
+        max_time_ms = max_time_ms or self.max_time_ms
+        return {'maxTimeMS': max_time_ms} if max_time_ms else {}
+
+    def get_cursor(self, collection, find_dict: dict, projection=None, max_time_ms: int = None, batch_size: int = None):
+        # 创建带有执行时间上限和批次大小的查询游标
+        cursor = collection.find(find_dict, projection)
+        max_time_ms = max_time_ms or self.max_time_ms
+        if max_time_ms:
+            cursor = cursor.max_time_ms(max_time_ms)
+        batch_size = batch_size or self.batch_size
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        return cursor
+
+    def write_one_docu(self, docu: dict, write_concern=None) -> str:
         try:
-            deep_docu = copy.deepcopy(docu)  # 深拷贝
-            # 兼容直接指定ID的创建方式
-            deep_docu = handle_db_id(deep_docu)
-            # 添加创建时间和更新时间，日期格式
-            if not deep_docu.__contains__('creation_time'):
-                deep_docu['creation_time'] = datetime.today()
-            if not deep_docu.__contains__('update_time'):
-                deep_docu['update_time'] = datetime.today()
-            new_data = self.mongo_collection.insert_one(deep_docu)
+            # 兼容直接指定ID的创建方式，添加创建时间和更新时间
+            new_docu = handle_db_docu(docu)
+            new_data = self.get_collection(write_concern=write_concern).insert_one(new_docu)
+            self.invalidate_cache()
             return str(new_data.inserted_id)
         except Exception as err:
-            handle_abnormal(
-                message='MongoDB(组件)出现写入错误: {0}'.format(json.dumps(docu)),
-                status=500,
-                other={'prompt': str(err)}
-            )
+            handle_db_error(err, message='MongoDB(组件)出现写入错误: {0}'.format(json.dumps(docu, default=str)))
 
-    def write_many_docu(self, docu_list: list) -> list:
+    def write_many_docu(self, docu_list: list, write_concern=None) -> list:
         try:
             new_docu_list = []
             for docu in docu_list:
                 if isinstance(docu, dict):
-                    # 添加创建时间和更新时间，日期格式
-                    if not docu.__contains__('creation_time'):
-                        docu['creation_time'] = datetime.today()
-                    if not docu.__contains__('update_time'):
-                        docu['update_time'] = datetime.today()
-                    # 深渊巨坑，字段append()到列表中要用深拷贝
-                    deep_docu = copy.deepcopy(docu)
-                    new_docu_list.append(deep_docu)
+                    # 兼容直接指定ID的创建方式，添加创建时间和更新时间
+                    new_docu_list.append(handle_db_docu(docu))
                 else:
                     handle_abnormal(
                         message='参数docu_list格式不正确，要求为：[{},{},{}...]',
                         status=500,
                         other={'prompt': {'docu_list': docu_list}}
                     )
-            new_data_list = self.mongo_collection.insert_many(new_docu_list)
+            new_data_list = self.get_collection(write_concern=write_concern).insert_many(new_docu_list)
+            self.invalidate_cache()
             new_id_list = [str(_id) for _id in new_data_list.inserted_ids]
             return new_id_list
         except Exception as err:
-            handle_abnormal(
-                message='MongoDB(组件)出现写入错误',
-                status=500,
-                other={'prompt': str(err)}
-            )
+            handle_db_error(err, message='MongoDB(组件)出现写入错误')
+
+    def bulk_writer(self, batch_size: int = 1000, background: bool = False, flush_interval: float = 1.0) -> BulkWriter:
+        """
+        创建批量写入器，支持混合的 新增/更新/新增或更新/假删除 操作，详见 BulkWriter
+        :param batch_size: 每批次的最大操作数
+        :param background: 是否由后台线程定时写入
+        :param flush_interval: 后台写入的时间间隔（秒）
+        """
+        return BulkWriter(self, batch_size=batch_size, background=background, flush_interval=flush_interval)
+
+    def archiver(self, archive_after: float = 30, purge_after: float = None, **options) -> SoftDeleteArchiver:
+        """
+        创建假删除数据的归档任务，详见 SoftDeleteArchiver
+        :param archive_after: 假删除多少天后移动到归档集合
+        :param purge_after: 归档多少天后真删除，为 None 时不清理
+        """
+        return SoftDeleteArchiver(self, archive_after=archive_after, purge_after=purge_after, **options)
 
     def does_it_exist(self, docu: dict) -> bool:
-        deep_docu = copy.deepcopy(docu)  # 深拷贝
-        deep_docu = handle_db_id(deep_docu)
-        count = self.mongo_collection.count_documents(deep_docu)
+        count = self.mongo_collection.count_documents(handle_db_id(docu))
         if count != 0:
             return True
         else:
             return False
 
-    def update_docu(self, find_docu: dict, modify_docu: dict, many=False) -> dict:
+    def update_docu(self, find_docu: dict, modify_docu: dict, many=False, write_concern=None) -> dict:
         # 标准更新
         try:
             # 将参数id处理成符合mongo格式的_id对象
@@ -112,26 +199,44 @@ class DBConnect:
             find_docu = handle_db_remove(find_docu)
             # 重置更新时间
             if not modify_docu.__contains__('update_time'):
-                modify_docu['update_time'] = datetime.today()
+                modify_docu = dict(modify_docu, update_time=db_now())
             # 将更新内容转化为mongo能识别的更新格式
             modify_docu = {'$set': modify_docu}
+            collection = self.get_collection(write_concern=write_concern)
             if many:
-                student = self.mongo_collection.update_many(
+                student = collection.update_many(
                     find_docu, modify_docu)
             else:
-                student = self.mongo_collection.update_one(
+                student = collection.update_one(
                     find_docu, modify_docu)
+            self.invalidate_cache()
             # 返回匹配条数、受影响条数
             return {'matched_count': student.matched_count, 'modified_count': student.modified_count}
         except Exception as err:
-            handle_abnormal(
-                message='MongoDB(组件)出现更新错误',
-                status=500,
-                other={'prompt': str(err)}
-            )
+            handle_db_error(err, message='MongoDB(组件)出现更新错误')
 
-    def update_docu_inc(self, find_docu: dict, modify_docu: dict, many=False) -> dict:
-        # 字段自增更新
+    def counter_buffer(self, redis_connect=None, flush_interval: float = 1.0, max_keys: int = 1000, touch_update_time: bool = True) -> CounterBuffer:
+        """
+        获取当前实例的自增计数写后缓冲，首次调用时按参数创建，详见 CounterBuffer
+        :param redis_connect: RedisConnect 实例，设置后在 Redis 中合并自增量
+        :param flush_interval: 写入的时间间隔（秒）
+        :param max_keys: 等待写入的 (查询条件, 字段) 数量达到该值时立即写入
+        :param touch_update_time: 写入时是否同时更新 update_time
+        """
+        if self.counter is None or self.counter.closed:
+            self.counter = CounterBuffer(
+                self, redis_connect=redis_connect, flush_interval=flush_interval,
+                max_keys=max_keys, touch_update_time=touch_update_time)
+        return self.counter
+
+    def update_docu_inc(self, find_docu: dict, modify_docu: dict, many=False, buffered: bool = False, write_concern=None) -> dict:
+        """
+        字段自增更新
+        :param buffered: 是否通过 counter_buffer() 合并后延迟写入，此时不返回匹配条数和受影响条数
+        """
+        if buffered:
+            self.counter_buffer().incr(find_docu, modify_docu, many=many)
+            return {'matched_count': None, 'modified_count': None, 'buffered': True}
         try:
             # 将参数id处理成符合mongo格式的_id对象
             find_docu = handle_db_id(find_docu)
@@ -139,29 +244,27 @@ class DBConnect:
             find_docu = handle_db_remove(find_docu)
             # 将更新内容转化为mongo能识别的更新格式
             modify_docu = {'$inc': modify_docu, '$set': {
-                'update_time': datetime.today()}}
+                'update_time': db_now()}}
+            collection = self.get_collection(write_concern=write_concern)
             if many:
-                student = self.mongo_collection.update_many(
+                student = collection.update_many(
                     find_docu, modify_docu)
             else:
-                student = self.mongo_collection.update_one(
+                student = collection.update_one(
                     find_docu, modify_docu)
+            self.invalidate_cache()
             # 返回匹配条数、受影响条数
             return {'matched_count': student.matched_count, 'modified_count': student.modified_count}
         except Exception as err:
-            handle_abnormal(
-                message='MongoDB(组件)出现更新错误',
-                status=500,
-                other={'prompt': str(err)}
-            )
+            handle_db_error(err, message='MongoDB(组件)出现更新错误')
 
-    def delete_docu(self, find_docu: dict, many: bool = False, false_delete: bool = False) -> dict:
+    def delete_docu(self, find_docu: dict, many: bool = False, false_delete: bool = False, write_concern=None) -> dict:
         try:
             if false_delete:
                 # 假删除流程
-                modify_dict = {'remove_time': datetime.today()}
+                modify_dict = {'remove_time': db_now()}
                 result = self.update_docu(
-                    find_docu=find_docu, modify_docu=modify_dict, many=many)
+                    find_docu=find_docu, modify_docu=modify_dict, many=many, write_concern=write_concern)
                 if not result['modified_count']:
                     logging.warning('MongoDB(组件)出现删除异常: 没有任何文档被假删除')
                 return {'deleted_count': result['modified_count'], 'false_delete': false_delete}
@@ -169,38 +272,71 @@ class DBConnect:
                 find_docu = handle_db_id(find_docu)
                 find_docu = handle_db_remove(find_docu)
                 # 真删除流程
+                collection = self.get_collection(write_concern=write_concern)
                 if many:
                     # 文档批量删除方式
-                    result = self.mongo_collection.delete_many(find_docu)
+                    result = collection.delete_many(find_docu)
                 else:
                     # 文档精确删除方式
-                    result = self.mongo_collection.delete_one(find_docu)
+                    result = collection.delete_one(find_docu)
+                self.invalidate_cache()
                 if not result.deleted_count:
                     logging.error('MongoDB(组件)出现删除异常: 没有任何文档被真删除')
                 # 返回删除成功条数
                 return {'deleted_count': result.deleted_count, 'false_delete': false_delete}
         except Exception as err:
-            handle_abnormal(
-                message='MongoDB(组件)出现删除错误',
-                status=500,
-                other={'prompt': str(err)}
-            )
+            handle_db_error(err, message='MongoDB(组件)出现删除错误')
 
-    def find_docu(self, find_dict: dict, many: bool = True) -> list:
+    def find_docu(self, find_dict: dict, many: bool = True, projection=None, as_json: bool = False, read_preference=None, max_time_ms: int = None, batch_size: int = None) -> list:
+        """
+        查询文档
+        :param as_json: 是否直接返回编码好的 JSON bytes（快速读取路径，详见 json_encoder 模块）
+        :param read_preference: 本次查询的读偏好，默认使用实例配置
+        :param max_time_ms: 本次查询的执行时间上限（毫秒），默认使用实例配置
+        :param batch_size: 本次查询的游标批次大小，默认使用实例配置
+        """
         try:
-            deep_find_dict = copy.deepcopy(find_dict)  # 深拷贝
-            deep_find_dict = handle_db_id(deep_find_dict)
+            deep_find_dict = handle_db_id(find_dict)
             deep_find_dict = handle_db_remove(deep_find_dict)
-            if many:
-                # 多文档查询方式
-                query_cursor = self.mongo_collection.find(deep_find_dict)
-                return handle_db_to_list(query_cursor)
+            # 只获取需要的字段
+            projection = handle_db_projection(projection)
+            hit, cache_key, cache_value = self.get_cache(
+                'find_docu', deep_find_dict, many, projection, as_json)
+            if hit:
+                return cache_value
+            collection = self.get_collection(read_preference=read_preference)
+            query_cursor = self.get_cursor(
+                collection, deep_find_dict, projection, max_time_ms=max_time_ms, batch_size=batch_size)
+            if not many:
+                # 单文档查询方式，与 find_one() 相同
+                query_cursor = query_cursor.limit(-1)
+            if as_json:
+                # 编码时转换id和时间，不再修改每个文档
+                result = dumps_json(handle_db_json_list(list(query_cursor)))
             else:
-                # 单文档查询方式
-                query_dict = self.mongo_collection.find_one(deep_find_dict)
-                if not query_dict:
-                    return []
-                return [handle_db_dict(query_dict)]
+                result = handle_db_to_list(query_cursor)
+            self.set_cache(cache_key, result)
+            return result
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现查询错误')
+
+    def iter_docu(self, find_dict: dict, batch_size: int = 1000, sort_list: list = None, projection=None):
+        """
+        以生成器方式逐个返回查询结果，内存占用与结果集大小无关
+        :param find_dict: 查询条件
+        :param batch_size: 每次从数据库获取的文档数量
+        :param sort_list: 可选的排序规则列表，Eg: [('update_time', pymongo.DESCENDING)]
+        :param projection: 可选的字段投影，Eg: ['name', 'age'] 或 {'detail': 0}
+        :return: 经过 handle_db_dict 处理的文档生成器
+        """
+        try:
+            # 查询条件的校验与处理在返回生成器之前完成，以便直接返回异常响应
+            deep_find_dict = handle_db_id(find_dict)
+            deep_find_dict = handle_db_remove(deep_find_dict)
+            query_cursor = self.mongo_collection.find(
+                deep_find_dict, handle_db_projection(projection)).batch_size(batch_size)
+            if sort_list:
+                query_cursor = query_cursor.sort(sort_list)
         except Exception as err:
             handle_abnormal(
                 message='MongoDB(组件)出现查询错误',
@@ -208,23 +344,87 @@ class DBConnect:
                 other={'prompt': str(err)}
             )
 
-    def find_docu_distinct(self, find_str: str) -> int:
-        # 去重查询
+        def generate():
+            try:
+                for docu in query_cursor:
+                    yield handle_db_dict(docu)
+            finally:
+                query_cursor.close()
+
+        return generate()
+
+    def stream_docu(self, find_dict: dict, json_array: bool = False, batch_size: int = 1000, sort_list: list = None, projection=None) -> Response:
+        """
+        以流式响应返回查询结果
+        :param json_array: 是否返回 JSON 数组，默认返回 NDJSON（每行一个文档）
+        :return: Flask Response
+        """
+        docu_iter = self.iter_docu(
+            find_dict=find_dict, batch_size=batch_size, sort_list=sort_list, projection=projection)
+        return handle_json_stream(docu_iter, json_array=json_array)
+
+    def aggregate_group(self, field: str, find_dict: dict = None, unwind: bool = True, stages: list = None) -> list:
+        """
+        按字段分组聚合，由数据库完成计算，只返回最终结果
+        :param stages: 追加在 $group 之后的聚合阶段
+        :return: 聚合结果列表
+        """
+        pipeline = handle_group_pipeline(field, find_dict, unwind) + (stages or [])
+        hit, cache_key, cache_value = self.get_cache('aggregate_group', pipeline)
+        if hit:
+            return cache_value
         try:
-            query_res = self.mongo_collection.distinct(find_str)
-            return len(query_res)
+            result = list(self.mongo_collection.aggregate(pipeline, allowDiskUse=True))
         except Exception as err:
             handle_abnormal(
                 message='MongoDB(组件)出现查询错误',
                 status=500,
                 other={'prompt': str(err)}
             )
+        self.set_cache(cache_key, result)
+        return result
+
+    def find_docu_distinct(self, find_str: str, find_dict: dict = None, unwind: bool = True) -> int:
+        """
+        去重查询，返回字段不同值的数量（排除假删除数据）
+        :param find_str: 字段名称
+        :param find_dict: 可选的查询条件
+        :param unwind: 是否按数组元素去重（与 distinct() 相同）
+        """
+        result = self.aggregate_group(find_str, find_dict, unwind, stages=[{'$count': 'count'}])
+        return result[0]['count'] if result else 0
 
-    def find_docu_by_id(self, id: str, raise_err=True) -> dict:
+    def distinct_values(self, field: str, find_dict: dict = None, limit: int = None, unwind: bool = True) -> list:
+        """
+        获取字段的不同值，按值升序排列
+        :param limit: 最多返回的数量，默认全部返回（值会全部加载到内存中，数量较多时建议设置）
+        :return: 字段值列表
+        """
+        stages = [{'$sort': {'_id': 1}}]
+        if limit:
+            stages.append({'$limit': limit})
+        return [item['_id'] for item in self.aggregate_group(field, find_dict, unwind, stages)]
+
+    def group_counts(self, field: str, find_dict: dict = None, limit: int = 10, unwind: bool = True) -> list:
+        """
+        统计字段每个值的文档数量，返回数量最多的前 N 个值
+        :param limit: 返回的数量，为 None 时全部返回
+        :return: [{'value': 字段值, 'count': 文档数量}, ...]，按数量降序、值升序排列
+        """
+        stages = [{'$sort': {'count': -1, '_id': 1}}]
+        if limit:
+            stages.append({'$limit': limit})
+        stages.append({'$project': {'_id': 0, 'value': '$_id', 'count': 1}})
+        return self.aggregate_group(field, find_dict, unwind, stages)
+
+    def find_docu_by_id(self, id: str, raise_err=True, projection=None, batched: bool = False) -> dict:
         """
         根据id查找记录
         :param id:记录id
         :param raise_err:是否抛出异常（使用abort抛出），否则返回None
+        :param projection:可选的字段投影
+        :param batched:是否通过当前请求的加载器查询并缓存结果，只会与之前通过 loader().defer() 登记的id合并为一次批量查询，
+                       连续多次调用仍然各自查询一次（已缓存的id除外），需要合并时先 defer() 全部id
         :return: 将结果转换为字典
         """
         if not isinstance(id, str):
@@ -232,7 +432,11 @@ class DBConnect:
                 message='类型错误, 预期 %s ,却得到 %s' % (str, type(id)),
                 status=400,
             )
-        entity = self.find_docu({'id': id}, many=False)
+        if batched:
+            entity = self.loader(projection=projection).load(id)
+            entity = [entity] if entity else []
+        else:
+            entity = self.find_docu({'id': id}, many=False, projection=projection)
         if entity is None or len(entity) == 0:
             if raise_err:
                 handle_abnormal(
@@ -243,10 +447,14 @@ class DBConnect:
                 return {}
         return entity[0]
 
-    def find_docu_by_id_list(self, id_list: list) -> list:
+    def find_docu_by_id_list(self, id_list: list, projection=None, chunk_size: int = 1000, missing: str = 'ignore', dedupe: bool = True) -> list:
         """
-        根据id列表查找记录列表
-        :param id_list:
+        根据id列表查找记录列表，分块使用 $in 查询，并按传入的id顺序返回
+        :param id_list:id列表
+        :param projection:可选的字段投影
+        :param chunk_size:每次 $in 查询的id数量
+        :param missing:不存在的id的处理方式，ignore=忽略，none=对应位置返回None，raise=返回异常响应
+        :param dedupe:是否去除重复的id，否则重复的id对应同一个文档
         :return:
         """
         if not isinstance(id_list, list):
@@ -254,105 +462,200 @@ class DBConnect:
                 message='类型错误, 预期 %s ,却得到 %s' % (list, type(id_list)),
                 status=400,
             )
-        id_search = []
-        for id in id_list:
-            id_search.append({'_id': ObjectId(id)})
-        find_dict = {'$or': id_search}
-        data = self.find_docu(find_dict)
-        return data
-
-    def find_paging(self, parameter: Parameter) -> dict:
-        # 兼容GET和POST两个请求方式
-        if parameter.method == 'GET':
-            checking = parameter.param_url
-        else:
-            checking = parameter.param_json
-        param = parameter.verification(
-            checking=checking,
-            verify={
-                '$limit': int, '$offset': int, '$orderby': str, '$start_date': str, '$date_type': str,
-                '$end_date': str,
-            },
-            optional={'$start_date': '', '$end_date': '', '$date_type': 'update_time',
-                      '$offset': 0, '$limit': 10, '$orderby': ''},
-            allow_extra=True
-        )
+        if missing not in ('ignore', 'none', 'raise'):
+            handle_abnormal(
+                message='参数 missing 必须是 ignore、none、raise 之一',
+                status=500,
+            )
         try:
-            limit = int(param['$limit'])  # 指示页大小（从1开始）
-            offset = int(param['$offset'])  # 指示记录起始位置（从0开始）
-            if limit < 1:
-                raise Exception('指示页大小必须从 1 开始计算')
-            # 排序规则（`key1 desc,key2 asc`），asc=升序，desc=降序
-            orderby = param['$orderby']
-            sort_list = []  # 数据库排序规则列表
-            if orderby:
-                # 整理请求参数中的筛排序列表
-                orderby = orderby.split(',')
-                for order in orderby:
-                    order_kv = order.split(' ')
-                    if len(order_kv) == 2 and (order_kv[1] == 'asc' or order_kv[1] == 'desc') and order_kv[0].strip() != '':
-                        if order_kv[1] == 'asc':
-                            sort_list.append((order_kv[0], pymongo.ASCENDING))
-                        elif order_kv[1] == 'desc':
-                            sort_list.append((order_kv[0], pymongo.DESCENDING))
-                    else:
-                        raise Exception(
-                            '排序参数不符合格式要求: "{0}"'.format(param['$orderby']))
-            start_date = handle_date(date=param['$start_date'])  # 可选——开始日期
-            # 可选——结束日期，与开始日期组成日期区间
-            end_date = handle_date(date=param['$end_date'], date_type='end')
-            # 查找假删除数据的数据量
-            remove_count = self.mongo_collection.count_documents(
-                {'remove_time': {'$exists': True}})
-            # 查找字典和排序列表，处理假删除数据
-            find_dict = handle_db_remove({})
-            redundant_filter = param['redundant_dict']  # 额外的数据库筛选字典
-            for filter_key, filter_value in redundant_filter.items():
-                # 整理请求参数中的筛选项字典
-                if type(filter_value) == int or type(filter_value) == dict or type(filter_value) == bool:
-                    find_dict[filter_key] = filter_value
-                elif filter_key == 'id' or filter_key == '_id':
-                    find_dict['_id'] = ObjectId(str(filter_value))
-                elif type(filter_value) == list:
-                    # 值为列表，则使用元素匹配逻辑，将数据库中对应字段包含list元素的数据全部赛选出来
-                    find_dict[filter_key] = {
-                        "$elemMatch": {"$in": filter_value}}
-                else:
-                    # 查询值模糊匹配的结果
-                    if filter_value.strip() != '':
-                        filter_value = filter_value.replace("(", "\(")
-                        filter_value = filter_value.replace(")", "\)")
-                        find_dict[filter_key] = {'$regex': filter_value}
-            # 仅存在日期查询区间参数时，进行额外的创建时间区间查询
-            if start_date and end_date:
-                find_dict[param['$date_type']] = {
-                    '$gte': start_date, '$lte': end_date}
-            # 对排序规则处理
-            if sort_list:
-                find_data = self.mongo_collection.find(find_dict).sort(sort_list).limit(
-                    limit).skip(offset)
-            else:
-                find_data = self.mongo_collection.find(find_dict).limit(
-                    limit).skip(offset)
-            # 处理返回数据
-            query_result = handle_db_to_list(find_data)
-            records_filtered = self.mongo_collection.count_documents(find_dict)
-            # 判断数据是否为空
-            if records_filtered:
-                return {
-                    'total': records_filtered,
-                    'items': query_result,
-                    'dummy_remove': remove_count,
-                }
-            else:
-                return {
-                    'total': 0,
-                    'items': [],
-                    'dummy_remove': remove_count,
-                }
+            object_id_list = [ObjectId(str(id)) for id in id_list]
         except Exception as err:
             handle_abnormal(
-                message='计算组件分页参数异常',
+                message='MongoDB _id 格式解析异常',
                 status=400,
                 other={'prompt': str(err)}
             )
+        if dedupe:
+            object_id_list = list(dict.fromkeys(object_id_list))
+        unique_id_list = list(dict.fromkeys(object_id_list))
+        docu_dict = {}
+        for i in range(0, len(unique_id_list), chunk_size):
+            chunk = unique_id_list[i:i + chunk_size]
+            for docu in self.find_docu({'_id': {'$in': chunk}}, projection=projection):
+                docu_dict[docu['id']] = docu
+        data = []
+        missing_list = []
+        for object_id in object_id_list:
+            docu = docu_dict.get(str(object_id), None)
+            if docu is None:
+                missing_list.append(str(object_id))
+                if missing == 'none':
+                    data.append(None)
+            else:
+                data.append(docu)
+        if missing_list and missing == 'raise':
+            handle_abnormal(
+                message='找不到部分id的记录',
+                status=400,
+                other={'prompt': missing_list}
+            )
+        return data
+
+    def loader(self, projection=None, chunk_size: int = 1000) -> DocuLoader:
+        """
+        获取当前请求范围内的批量加载器，用于合并同一请求中的多次按id查询
+          author = db.loader().defer(docu['author_id'])  # 先登记
+          ...
+          author()  # 第一次取值时，全部登记的id合并为一次查询
+        """
+        return get_request_loader(self, projection=projection, chunk_size=chunk_size)
+
+    def get_cached_count(self, find_dict: dict, ttl: int, collection=None, max_time_ms: int = None) -> int:
+        """
+        按规范化后的筛选条件缓存计数结果，过期后重新计数
+        :param find_dict: 已处理好的查询条件
+        :param ttl: 缓存有效期（秒）
+        :param collection: 计数使用的集合（带有读偏好），默认为实例的集合
+        :param max_time_ms: 计数的执行时间上限（毫秒）
+        """
+        collection = collection or self.mongo_collection
+        key = json_util.dumps([collection.name, find_dict], sort_keys=True)
+        now = time.monotonic()
+        with self.count_cache_lock:
+            cached = self.count_cache.get(key, None)
+            if cached and cached[0] > now:
+                return cached[1]
+        count = collection.count_documents(find_dict, **self.get_time_options(max_time_ms))
+        with self.count_cache_lock:
+            if len(self.count_cache) >= COUNT_CACHE_SIZE:
+                # 清理过期项，仍然过多时整体清空
+                self.count_cache = {k: v for k, v in self.count_cache.items() if v[0] > now}
+                if len(self.count_cache) >= COUNT_CACHE_SIZE:
+                    self.count_cache = {}
+            self.count_cache[key] = (now + ttl, count)
+        return count
+
+    def count_docu(self, find_dict: dict, count: str = 'exact', count_cap: int = 10000, count_ttl: int = 60, collection=None, max_time_ms: int = None) -> tuple:
+        """
+        按指定策略统计文档数量
+        :param find_dict: 已处理好的查询条件
+        :param count: 计数策略
+          exact: 精确计数
+          estimated: 无额外筛选条件时使用 estimated_document_count() 估算（减去假删除数），否则退回精确计数
+          capped: 最多计数到 count_cap，超过时返回 '<count_cap>+' 字符串
+          cached: 按筛选条件缓存精确计数 count_ttl 秒
+        :param count_cap: capped 策略的计数上限
+        :param count_ttl: cached 策略的缓存有效期（秒）
+        :param collection: 计数使用的集合（带有读偏好），默认为实例的集合
+        :param max_time_ms: 计数的执行时间上限（毫秒），默认使用实例配置
+        :return: (数量, 实际使用的计数策略)
+        """
+        if count not in COUNT_STRATEGIES:
+            raise Exception('计数策略必须是 {0} 之一'.format(COUNT_STRATEGIES))
+        collection = collection or self.mongo_collection
+        time_options = self.get_time_options(max_time_ms)
+        if count == 'estimated':
+            if find_dict == handle_db_remove({}):
+                remove_count = self.get_cached_count(
+                    {'remove_time': {'$exists': True}}, count_ttl, collection=collection, max_time_ms=max_time_ms)
+                estimated = collection.estimated_document_count(**time_options)
+                return max(estimated - remove_count, 0), 'estimated'
+            count = 'exact'
+        if count == 'capped':
+            capped = collection.count_documents(
+                find_dict, limit=count_cap + 1, **time_options)
+            if capped > count_cap:
+                return '{0}+'.format(count_cap), 'capped'
+            return capped, 'capped'
+        if count == 'cached':
+            return self.get_cached_count(find_dict, count_ttl, collection=collection, max_time_ms=max_time_ms), 'cached'
+        return collection.count_documents(find_dict, **time_options), 'exact'
+
+    def find_facet(self, find_dict: dict, sort_list: list, limit: int, skip: int = 0, items_dict: dict = None, projection: dict = None, collection=None, max_time_ms: int = None) -> dict:
+        """
+        通过一次 $match + $facet 聚合，同时获取当前页文档、筛选总数和假删除文档数
+        :param find_dict: 已处理好的查询条件（用于统计总数）
+        :param sort_list: 排序规则列表
+        :param limit: 获取文档数量
+        :param skip: 跳过文档数量
+        :param items_dict: 获取当前页文档的查询条件，默认与 find_dict 相同（游标分页时会额外带有范围条件）
+        :param projection: 已处理好的字段投影
+        :param collection: 查询使用的集合（带有读偏好），默认为实例的集合
+        :param max_time_ms: 聚合的执行时间上限（毫秒），默认使用实例配置
+        :return: {'items': 原始文档列表, 'total': 筛选总数, 'dummy_remove': 假删除文档数}
+        """
+        pipeline = build_facet_pipeline(find_dict, sort_list, limit, skip, items_dict, projection)
+        collection = collection or self.mongo_collection
+        return build_facet_result(next(collection.aggregate(pipeline, allowDiskUse=True, **self.get_time_options(max_time_ms)), {}))
+
+    def find_paging(self, parameter: Parameter, keyset: bool = False, facet: bool = False, count: str = 'exact', count_cap: int = 10000, count_ttl: int = 60, projection=None, fields: list = None, as_json: bool = False, read_preference=None, max_time_ms: int = None) -> dict:
+        """
+        分页查询
+        :param parameter: 请求参数实例
+        :param keyset: 是否使用游标分页（请求中带有 $after/$before 参数时自动启用）
+        :param facet: 是否通过一次 $facet 聚合完成查询和计数（一次网络往返），此时总是精确计数
+        :param count: 总数计数策略（exact/estimated/capped/cached），详见 count_docu()
+        :param count_cap: capped 策略的计数上限
+        :param count_ttl: cached/estimated 策略的缓存有效期（秒）
+        :param projection: 固定的字段投影，请求中的 $fields 参数会覆盖该设置
+        :param fields: 允许通过 $fields 参数获取的字段白名单，'*' 为不限制，默认不允许使用 $fields 参数
+        :param as_json: 是否直接返回编码好的 JSON bytes（快速读取路径，详见 json_encoder 模块）
+        :param read_preference: 本次查询的读偏好（Eg: 'secondaryPreferred'，适合报表类分页），默认使用实例配置
+        :param max_time_ms: 本次查询与计数的执行时间上限（毫秒），超时返回 504，默认使用实例配置
+        :return: {'total': 总数, 'items': 文档列表, 'dummy_remove': 假删除文档数}，游标分页时额外返回 next_cursor/prev_cursor
+        """
+        param = verify_paging_param(parameter)
+        try:
+            query = build_paging_query(
+                param, filter_fields=self.filter_fields, projection=projection, fields=fields, keyset=keyset)
+            hit, cache_key, cache_value = self.get_cache(
+                'find_paging', query['find_dict'], query['query_dict'], query['query_sort'], query['fetch_limit'],
+                query['skip'], query['projection'], query['use_keyset'], facet, count, count_cap, as_json)
+            if hit:
+                return cache_value
+            if query['use_text']:
+                # $text 只能出现在聚合的第一个阶段，全文搜索时不使用 $facet
+                facet = False
+            find_dict = query['find_dict']
+            collection = self.get_collection(read_preference=read_preference)
+            if facet:
+                # 一次网络往返完成查询与计数
+                facet_data = self.find_facet(
+                    find_dict=find_dict, sort_list=query['query_sort'], limit=query['fetch_limit'], skip=query['skip'],
+                    items_dict=query['query_dict'], projection=query['projection'],
+                    collection=collection, max_time_ms=max_time_ms)
+                docu_list = facet_data['items']
+                records_filtered = facet_data['total']
+                remove_count = facet_data['dummy_remove']
+                total_strategy = 'exact'
+            else:
+                # 查找假删除数据的数据量，非精确计数策略时使用缓存
+                remove_dict = {'remove_time': {'$exists': True}}
+                if count == 'exact':
+                    remove_count = collection.count_documents(remove_dict, **self.get_time_options(max_time_ms))
+                else:
+                    remove_count = self.get_cached_count(
+                        remove_dict, count_ttl, collection=collection, max_time_ms=max_time_ms)
+                if self.diagnose:
+                    self.last_explain = explain_query(
+                        self.mongo_collection, query['query_dict'], query['query_sort'], limit=query['fetch_limit'],
+                        skip=query['skip'], max_ratio=self.diagnose_ratio)
+                # 对排序规则处理
+                find_data = self.get_cursor(
+                    collection, query['query_dict'], query['projection'], max_time_ms=max_time_ms)
+                if query['query_sort']:
+                    find_data = find_data.sort(query['query_sort'])
+                docu_list = find_data.limit(query['fetch_limit']).skip(query['skip'])
+                records_filtered, total_strategy = self.count_docu(
+                    find_dict, count=count, count_cap=count_cap, count_ttl=count_ttl,
+                    collection=collection, max_time_ms=max_time_ms)
+            if as_json:
+                result = dumps_json(build_paging_result(
+                    query, docu_list, records_filtered, remove_count, total_strategy, list_handler=handle_db_json_list))
+            else:
+                result = build_paging_result(
+                    query, docu_list, records_filtered, remove_count, total_strategy)
+            self.set_cache(cache_key, result)
+            return result
+        except Exception as err:
+            handle_db_error(err, message='计算组件分页参数异常', status=400)
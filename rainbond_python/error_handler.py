@@ -39,6 +39,10 @@ def error_handler(app, simple_cors: bool = True):
     def handle_412_error(error):
         return handle_abnormal(message='前置条件失败', status=412, is_raw=True)
 
+    @app.errorhandler(413)
+    def handle_413_error(error):
+        return handle_abnormal(message='请求内容过大', status=413, is_raw=True)
+
     @app.errorhandler(415)
     def handle_415_error(error):
         return handle_abnormal(message='不支持收到的表示', status=415, is_raw=True)
@@ -0,0 +1,159 @@
+import logging
+import threading
+import pymongo
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='[%(asctime)s] [%(levelname)s] %(message)s'
+)
+
+# 查询条件中的范围运算符
+RANGE_OPERATORS = ('$gt', '$gte', '$lt', '$lte', '$ne', '$nin', '$regex', '$exists', '$elemMatch')
+# 已经确认过索引的集合，避免每次创建 DBConnect 都请求数据库
+ensured_namespaces = set()
+ensured_lock = threading.Lock()
+
+
+def handle_index_spec(spec) -> tuple:
+    """
+    将声明的索引整理成 create_index() 的参数
+    :param spec: 支持以下格式
+      'name': 单字段升序索引
+      [('name', 1), ('update_time', -1)]: 复合索引
+      {'keys': [...], 'soft_delete': True, 'unique': True, ...}: 带有 create_index() 参数的索引，
+        soft_delete=True 时在末尾追加 remove_time 字段，使 handle_db_remove 添加的假删除条件可以通过索引过滤
+    :return: (索引字段列表, create_index() 参数字典)
+    """
+    options = {}
+    if isinstance(spec, dict):
+        options = dict(spec)
+        spec = options.pop('keys')
+        soft_delete = options.pop('soft_delete', False)
+    else:
+        soft_delete = False
+    if isinstance(spec, str):
+        keys = [(spec, pymongo.ASCENDING)]
+    else:
+        keys = [(key, direction) for key, direction in spec]
+    if soft_delete and 'remove_time' not in [key for key, _ in keys]:
+        keys.append(('remove_time', pymongo.ASCENDING))
+    return keys, options
+
+
+def ensure_indexes(collection, indexes: list) -> list:
+    """
+    确保集合中存在声明的索引，并额外创建只包含假删除文档的部分索引（用于假删除计数和归档）
+    MongoDB 的部分索引不支持 {'$exists': False} 条件，所以未删除文档通过在复合索引末尾追加 remove_time 来过滤
+    :param collection: pymongo 集合
+    :param indexes: 索引声明列表，格式见 handle_index_spec()
+    :return: 创建成功的索引名称列表
+    """
+    namespace = (collection.full_name, repr(indexes))
+    with ensured_lock:
+        if namespace in ensured_namespaces:
+            return []
+        ensured_namespaces.add(namespace)
+    index_specs = [handle_index_spec(spec) for spec in indexes]
+    index_specs.append(([('remove_time', pymongo.ASCENDING)], {
+        'name': 'remove_time_partial',
+        'partialFilterExpression': {'remove_time': {'$exists': True}},
+    }))
+    names = []
+    for keys, options in index_specs:
+        try:
+            names.append(collection.create_index(keys, **options))
+        except Exception as err:
+            logging.error('MongoDB(组件)集合 {0} 创建索引 {1} 失败: {2}'.format(
+                collection.full_name, keys, err))
+    return names
+
+
+def handle_query_fields(find_dict: dict, equality: list, ranges: list):
+    # 递归整理查询条件中的 等值字段 与 范围字段，$or/$nor 中的字段无法确定，不参与索引建议
+    for key, value in find_dict.items():
+        if key == '$and':
+            for sub_dict in value:
+                handle_query_fields(sub_dict, equality, ranges)
+        elif key.startswith('$'):
+            continue
+        elif isinstance(value, dict) and any(op in value for op in RANGE_OPERATORS):
+            if key not in ranges:
+                ranges.append(key)
+        elif key not in equality:
+            equality.append(key)
+
+
+def suggest_index(find_dict: dict, sort_list: list = None) -> list:
+    """
+    按 等值字段 -> 排序字段 -> 范围字段 的顺序（ESR 原则）建议复合索引
+    :return: [(key, direction), ...]
+    """
+    equality = []
+    ranges = []
+    handle_query_fields(find_dict, equality, ranges)
+    keys = [(key, pymongo.ASCENDING) for key in equality]
+    for key, direction in sort_list or []:
+        if key not in equality:
+            keys.append((key, direction))
+    used = [key for key, _ in keys]
+    for key in ranges:
+        if key not in used:
+            keys.append((key, pymongo.ASCENDING))
+    return keys
+
+
+def collect_stages(plan: dict) -> list:
+    # 递归收集执行计划中的全部阶段名称
+    stages = [plan.get('stage')]
+    for child_key in ('inputStage', 'queryPlan'):
+        if isinstance(plan.get(child_key), dict):
+            stages += collect_stages(plan[child_key])
+    for child in plan.get('inputStages', []):
+        stages += collect_stages(child)
+    return [stage for stage in stages if stage]
+
+
+def analyze_explain(explain: dict, find_dict: dict, sort_list: list = None, max_ratio: float = 10.0) -> dict:
+    """
+    分析 explain() 结果
+    :param max_ratio: 扫描文档数/返回文档数 超过该值时视为低效查询
+    :return: {'stages', 'collscan', 'docs_examined', 'keys_examined', 'returned', 'ratio', 'slow', 'suggest_index'}
+    """
+    query_planner = explain.get('queryPlanner', {})
+    winning_plan = query_planner.get('winningPlan', {})
+    stages = collect_stages(winning_plan)
+    stats = explain.get('executionStats', {})
+    docs_examined = stats.get('totalDocsExamined', 0)
+    returned = stats.get('nReturned', 0)
+    ratio = docs_examined / max(returned, 1)
+    collscan = 'COLLSCAN' in stages
+    slow = collscan or ratio > max_ratio
+    return {
+        'stages': stages,
+        'collscan': collscan,
+        'docs_examined': docs_examined,
+        'keys_examined': stats.get('totalKeysExamined', 0),
+        'returned': returned,
+        'ratio': ratio,
+        'slow': slow,
+        'suggest_index': suggest_index(find_dict, sort_list) if slow else [],
+    }
+
+
+def explain_query(collection, find_dict: dict, sort_list: list = None, limit: int = 0, skip: int = 0, max_ratio: float = 10.0) -> dict:
+    """
+    执行 explain() 并在发现全表扫描或扫描比例过高时输出警告日志与索引建议
+    """
+    cursor = collection.find(find_dict)
+    if sort_list:
+        cursor = cursor.sort(sort_list)
+    if limit:
+        cursor = cursor.limit(limit)
+    if skip:
+        cursor = cursor.skip(skip)
+    report = analyze_explain(cursor.explain(), find_dict, sort_list, max_ratio)
+    if report['slow']:
+        logging.warning('MongoDB(组件)集合 {0} 存在低效查询（{1}，扫描 {2} 条返回 {3} 条）: {4}，建议创建索引: {5}'.format(
+            collection.full_name, '全表扫描' if report['collscan'] else '扫描比例过高',
+            report['docs_examined'], report['returned'], find_dict, report['suggest_index']))
+    return report
@@ -0,0 +1,96 @@
+import json
+import uuid
+import decimal
+import logging
+from datetime import date
+from bson.objectid import ObjectId
+from flask import Response
+from werkzeug.http import http_date
+from .tools import handle_timestamp_list
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='[%(asctime)s] [%(levelname)s] %(message)s'
+)
+
+
+def handle_json_default(obj):
+    """
+    与 Flask 默认 JSON 序列化相同地处理特殊类型，额外支持 ObjectId
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    raise TypeError('Object of type {0} is not JSON serializable'.format(type(obj).__name__))
+
+
+def stdlib_encoder(data) -> bytes:
+    # 与 Flask 默认的 JSON 响应相同：按键排序、紧凑格式、转义非 ASCII 字符
+    return json.dumps(data, default=handle_json_default, sort_keys=True,
+                      ensure_ascii=True, separators=(',', ':')).encode('utf-8')
+
+
+def orjson_encoder(data) -> bytes:
+    # datetime 交给 handle_json_default 处理，保持与 Flask 相同的日期格式
+    return orjson.dumps(data, default=handle_json_default,
+                        option=orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+json_encoder = orjson_encoder if orjson else stdlib_encoder  # 当前使用的编码函数
+
+
+def set_json_encoder(encoder=None):
+    """
+    替换快速读取路径使用的 JSON 编码函数
+    :param encoder: 接收数据返回 bytes 的函数，为 None 时恢复默认（安装了 orjson 时使用 orjson）
+    """
+    global json_encoder
+    json_encoder = encoder or (orjson_encoder if orjson else stdlib_encoder)
+
+
+def get_json_encoder():
+    return json_encoder
+
+
+def dumps_json(data) -> bytes:
+    return json_encoder(data)
+
+
+def handle_db_json_list(docu_list: list, missing: str = None) -> list:
+    """
+    将数据库原始文档列表转换为响应格式，与 handle_db_list 的结果相同，但返回新的字典而不修改原文档
+    """
+    docu_list = list(docu_list)
+    creation_list = handle_timestamp_list(
+        [docu.get('creation_time', None) for docu in docu_list], missing=missing)
+    update_list = handle_timestamp_list(
+        [docu.get('update_time', None) for docu in docu_list], missing=missing)
+    result_list = []
+    for docu, creation_time, update_time in zip(docu_list, creation_list, update_list):
+        result = {}
+        for key, value in docu.items():
+            if key == '_id':
+                continue
+            result[key] = value
+        result['id'] = str(docu['_id'])
+        result['creation_time'] = creation_time
+        result['update_time'] = update_time
+        result_list.append(result)
+    return result_list
+
+
+def handle_json_response(data, status: int = 200, headers: dict = None) -> Response:
+    """
+    使用快速编码函数生成 JSON 响应，data 可以是已经编码好的 bytes
+    """
+    if not isinstance(data, (bytes, bytearray)):
+        data = dumps_json(data)
+    return Response(data, status=status, headers=headers, mimetype='application/json')
@@ -0,0 +1,96 @@
+from flask import g, has_request_context
+
+
+class DocuLoader:
+    """
+    按id批量加载文档的加载器（DataLoader 模式），同一个加载器内：
+      1. 通过 defer() 登记的id会在第一次取值时合并为一次批量查询
+      2. 已经查询过的id直接从缓存中返回，不会重复查询
+    """
+
+    def __init__(self, db, projection=None, chunk_size: int = 1000):
+        self.db = db
+        self.projection = projection
+        self.chunk_size = chunk_size
+        self.cache = {}  # id -> 文档字典，不存在的id缓存为 None
+        self.pending = []  # 等待批量查询的id列表
+        self.batch_count = 0  # 实际执行的批量查询次数
+
+    def flush(self):
+        """
+        将等待中的id合并为一次批量查询
+        """
+        id_list = [id for id in dict.fromkeys(self.pending) if id not in self.cache]
+        self.pending = []
+        if not id_list:
+            return
+        # 不去重，结果与 id_list 一一对应（大小写不同的id会解析为同一个 ObjectId）
+        docu_list = self.db.find_docu_by_id_list(
+            id_list, projection=self.projection, chunk_size=self.chunk_size, missing='none', dedupe=False)
+        self.batch_count += 1
+        for id, docu in zip(id_list, docu_list):
+            self.cache[id] = docu
+
+    def defer(self, id: str):
+        """
+        登记需要加载的id，返回取值函数，调用时才会批量查询全部登记的id
+        :return: 无参数函数，调用后返回文档字典（不存在时返回 {}）
+        """
+        if id not in self.cache:
+            self.pending.append(id)
+        return lambda: self.load(id)
+
+    def load(self, id: str) -> dict:
+        """
+        加载单个文档，会同时查询全部已登记的id
+        :return: 文档字典，不存在时返回 {}
+        """
+        if id not in self.cache:
+            self.pending.append(id)
+            self.flush()
+        return self.cache[id] or {}
+
+    def load_many(self, id_list: list) -> list:
+        """
+        加载多个文档，按传入顺序返回，不存在的id对应 {}
+        """
+        for id in id_list:
+            if id not in self.cache:
+                self.pending.append(id)
+        self.flush()
+        return [self.cache[id] or {} for id in id_list]
+
+    def clear(self, id: str = None):
+        """
+        清除缓存，通常在当前请求中修改了文档之后调用
+        """
+        if id is None:
+            self.cache = {}
+        else:
+            self.cache.pop(id, None)
+
+
+def get_request_loader(db, projection=None, chunk_size: int = 1000) -> DocuLoader:
+    """
+    获取当前请求范围内的加载器，同一个请求中多次获取会得到同一个加载器，请求结束后自动释放
+    不在请求上下文中时，返回新的加载器
+    """
+    if not has_request_context():
+        return DocuLoader(db, projection=projection, chunk_size=chunk_size)
+    loaders = g.setdefault('rainbond_docu_loaders', {})
+    key = (id(db), repr(projection))
+    if key not in loaders:
+        loaders[key] = DocuLoader(
+            db, projection=projection, chunk_size=chunk_size)
+    return loaders[key]
+
+
+def clear_request_loaders(db):
+    """
+    清除当前请求中该 DBConnect 全部加载器的缓存，在当前请求中写入文档后调用，不在请求上下文中时不做任何处理
+    """
+    if not has_request_context():
+        return
+    for key, loader in g.get('rainbond_docu_loaders', {}).items():
+        if key[0] == id(db):
+            loader.clear()
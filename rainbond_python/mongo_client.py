@@ -0,0 +1,248 @@
+import os
+import atexit
+import logging
+import threading
+import pymongo
+from pymongo import monitoring
+from pymongo.read_preferences import ReadPreference, read_pref_mode_from_name, make_read_preference
+from pymongo.write_concern import WriteConcern
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='[%(asctime)s] [%(levelname)s] %(message)s'
+)
+
+# 连接池参数与对应的环境变量，未设置时使用 pymongo 的默认值
+POOL_OPTION_ENV = {
+    'maxPoolSize': 'MONGODB_MAX_POOL_SIZE',
+    'minPoolSize': 'MONGODB_MIN_POOL_SIZE',
+    'maxIdleTimeMS': 'MONGODB_MAX_IDLE_TIME_MS',
+    'waitQueueTimeoutMS': 'MONGODB_WAIT_QUEUE_TIMEOUT_MS',
+    'connectTimeoutMS': 'MONGODB_CONNECT_TIMEOUT_MS',
+    'socketTimeoutMS': 'MONGODB_SOCKET_TIMEOUT_MS',
+    'serverSelectionTimeoutMS': 'MONGODB_SERVER_SELECTION_TIMEOUT_MS',
+}
+
+
+class PoolCounter(monitoring.ConnectionPoolListener):
+    """
+    统计单个 MongoClient 连接池的套接字数量
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open_sockets = 0  # 当前打开的套接字
+        self.checked_out = 0  # 当前被借出使用的套接字
+        self.created_total = 0  # 累计创建的套接字
+        self.check_out_failed = 0  # 累计借出失败次数（等待超时、连接错误等）
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_sockets += 1
+            self.created_total += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_sockets -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.check_out_failed += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'open_sockets': self.open_sockets,
+                'checked_out': self.checked_out,
+                'created_total': self.created_total,
+                'check_out_failed': self.check_out_failed,
+            }
+
+
+def pool_options_from_env() -> dict:
+    """
+    从环境变量中读取连接池参数
+    :return: 仅包含已设置项的参数字典
+    """
+    options = {}
+    for option, env_key in POOL_OPTION_ENV.items():
+        value = os.environ.get(env_key, None)
+        if value:
+            options[option] = int(value)
+    return options
+
+
+def parse_read_preference(read_preference):
+    """
+    解析读偏好
+    :param read_preference: 模式名称（primary/primaryPreferred/secondary/secondaryPreferred/nearest）或 ReadPreference 实例
+    :return: ReadPreference 实例，参数为空时返回 None
+    """
+    if read_preference is None or not isinstance(read_preference, str):
+        return read_preference
+    if read_preference == 'primary':
+        return ReadPreference.PRIMARY
+    return make_read_preference(read_pref_mode_from_name(read_preference), None)
+
+
+def parse_write_concern(write_concern):
+    """
+    解析写关注
+    :param write_concern: 参数字典（Eg: {'w': 'majority', 'wtimeout': 5000}）或 WriteConcern 实例
+    :return: WriteConcern 实例，参数为空时返回 None
+    """
+    if write_concern is None or isinstance(write_concern, WriteConcern):
+        return write_concern
+    return WriteConcern(**write_concern)
+
+
+class MongoClientRegistry:
+    """
+    进程内共享的 MongoClient 注册表，相同 地址+端口+认证信息 只创建一个客户端（一个连接池）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}  # key -> (MongoClient, PoolCounter, options)
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # MongoClient 不是 fork 安全的，子进程中丢弃从父进程继承的客户端（不关闭，避免影响父进程）
+        if self._pid != os.getpid():
+            self._clients = {}
+            self._pid = os.getpid()
+
+    def get_client(self, host: str, port: int, username: str = None, password: str = None, **options) -> pymongo.MongoClient:
+        """
+        获取共享的 MongoClient，不存在时创建
+        :param host: MongoDB 地址
+        :param port: MongoDB 端口
+        :param username: 认证用户
+        :param password: 认证密码
+        :param options: 连接池与超时参数（maxPoolSize、serverSelectionTimeoutMS 等），覆盖环境变量中的配置
+        :return: MongoClient
+        """
+        key = (host, int(port), username, password)
+        with self._lock:
+            self._check_fork()
+            if key in self._clients:
+                client, _, client_options = self._clients[key]
+                if options and options != client_options:
+                    logging.warning('MongoDB(组件)客户端 {0}:{1} 已存在，忽略新的连接池参数 {2}'.format(
+                        host, port, options))
+                return client
+            client_options = options
+            merged_options = pool_options_from_env()
+            merged_options.update(options)
+            counter = PoolCounter()
+            if username or password:
+                # 额外的认证
+                client = pymongo.MongoClient(
+                    host=host,
+                    port=int(port),
+                    username=username,
+                    password=password,
+                    event_listeners=[counter],
+                    **merged_options
+                )
+            else:
+                # 常规连接
+                client = pymongo.MongoClient(
+                    host=host,
+                    port=int(port),
+                    event_listeners=[counter],
+                    **merged_options
+                )
+            self._clients[key] = (client, counter, client_options)
+            return client
+
+    def close(self, host: str, port: int, username: str = None, password: str = None) -> bool:
+        """
+        关闭并移除指定的客户端
+        :return: 是否存在并关闭了客户端
+        """
+        key = (host, int(port), username, password)
+        with self._lock:
+            self._check_fork()
+            item = self._clients.pop(key, None)
+        if not item:
+            return False
+        item[0].close()
+        return True
+
+    def close_all(self):
+        """
+        关闭全部客户端，通常在进程退出或测试清理时调用
+        """
+        with self._lock:
+            self._check_fork()
+            items = list(self._clients.values())
+            self._clients = {}
+        for client, _, _ in items:
+            try:
+                client.close()
+            except Exception as err:
+                logging.warning('MongoDB(组件)客户端关闭异常: {0}'.format(err))
+
+    def stats(self) -> dict:
+        """
+        统计存活的客户端与套接字数量
+        :return: {'clients': 客户端数, 'open_sockets': 套接字总数, 'checked_out': 使用中的套接字总数, 'details': [...]}
+        """
+        with self._lock:
+            self._check_fork()
+            items = list(self._clients.items())
+        details = []
+        for key, (_, counter, client_options) in items:
+            detail = {'host': key[0], 'port': key[1], 'username': key[2]}
+            detail.update(counter.to_dict())
+            details.append(detail)
+        return {
+            'clients': len(details),
+            'open_sockets': sum(d['open_sockets'] for d in details),
+            'checked_out': sum(d['checked_out'] for d in details),
+            'details': details,
+        }
+
+
+# 默认的进程级注册表
+mongo_registry = MongoClientRegistry()
+atexit.register(mongo_registry.close_all)
+
+
+def get_mongo_client(host: str, port: int, username: str = None, password: str = None, **options) -> pymongo.MongoClient:
+    return mongo_registry.get_client(host, port, username, password, **options)
+
+
+def close_mongo_clients():
+    mongo_registry.close_all()
+
+
+def mongo_client_stats() -> dict:
+    return mongo_registry.stats()
@@ -0,0 +1,347 @@
+import base64
+import pymongo
+from bson import json_util, ObjectId
+from .schema import Schema
+from .tools import handle_date, handle_db_remove, handle_db_list, handle_db_projection, handle_text_filter
+
+# 分页查询请求参数的校验规则，模块加载时编译一次
+PAGING_SCHEMA = Schema(
+    verify={
+        '$limit': int, '$offset': int, '$orderby': str, '$start_date': str, '$date_type': str,
+        '$end_date': str, '$after': str, '$before': str, '$fields': str,
+    },
+    optional={'$start_date': '', '$end_date': '', '$date_type': 'update_time',
+              '$offset': 0, '$limit': 10, '$orderby': '', '$after': '', '$before': '', '$fields': ''},
+    allow_extra=True
+)
+
+
+def get_field(docu: dict, key: str):
+    """
+    按 `a.b.c` 形式的路径读取文档字段，不存在时返回 None
+    """
+    value = docu
+    for part in key.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part, None)
+    return value
+
+
+def handle_keyset_sort(sort_list: list) -> list:
+    """
+    游标分页需要全序的排序规则，在末尾追加 _id 作为唯一的决胜字段
+    :param sort_list: [(key, pymongo.ASCENDING/DESCENDING), ...]
+    :return: 追加 _id 后的排序规则列表
+    """
+    keys = [key for key, _ in sort_list]
+    if '_id' in keys:
+        return list(sort_list)
+    direction = sort_list[-1][1] if sort_list else pymongo.ASCENDING
+    return list(sort_list) + [('_id', direction)]
+
+
+def encode_cursor(docu: dict, sort_list: list) -> str:
+    """
+    将文档的排序字段值（含 _id）编码成不透明的游标字符串
+    :param docu: 数据库原始文档（未经过 handle_db_list 处理）
+    :param sort_list: handle_keyset_sort() 处理后的排序规则
+    :return: URL 安全的 base64 字符串
+    """
+    values = [get_field(docu, key) for key, _ in sort_list]
+    raw = json_util.dumps(values, json_options=json_util.CANONICAL_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, sort_list: list) -> list:
+    """
+    解析游标字符串，游标与排序规则不匹配时抛出异常
+    :return: 排序字段值列表
+    """
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode((cursor + padding).encode('ascii'))
+        values = json_util.loads(raw.decode('utf-8'))
+    except Exception:
+        raise Exception('分页游标格式不正确: "{0}"'.format(cursor))
+    if not isinstance(values, list) or len(values) != len(sort_list):
+        raise Exception('分页游标与排序参数不匹配: "{0}"'.format(cursor))
+    return values
+
+
+def build_keyset_filter(sort_list: list, values: list, before: bool = False) -> dict:
+    """
+    根据游标值生成可以利用索引的范围查询条件
+      (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+    排序时 null 与缺少字段排在所有值之前，而 $gt/$lt 不会匹配 null，因此 null 边界单独处理：
+      大于 null 即不为 null，小于非 null 的值时包括 null，没有值小于 null
+    :param sort_list: handle_keyset_sort() 处理后的排序规则
+    :param values: decode_cursor() 解析出的排序字段值
+    :param before: 是否查询游标之前的数据
+    :return: 查询条件字典
+    """
+    or_list = []
+    for i, (key, direction) in enumerate(sort_list):
+        clause = {}
+        for j in range(i):
+            clause[sort_list[j][0]] = values[j]
+        forward = (direction == pymongo.ASCENDING) != before
+        value = values[i]
+        if forward:
+            clause[key] = {'$ne': None} if value is None else {'$gt': value}
+        elif value is None:
+            continue
+        elif key == '_id':
+            clause[key] = {'$lt': value}
+        else:
+            clause['$or'] = [{key: {'$lt': value}}, {key: None}]
+        or_list.append(clause)
+    if len(or_list) == 1:
+        return or_list[0]
+    return {'$or': or_list}
+
+
+def reverse_sort(sort_list: list) -> list:
+    return [(key, -direction) for key, direction in sort_list]
+
+
+def handle_keyset_query(find_dict: dict, sort_list: list, after: str = '', before: str = '') -> tuple:
+    """
+    生成游标分页的查询条件与排序规则
+    :return: (查询条件, 查询排序规则, 游标排序规则)
+    """
+    if after and before:
+        raise Exception('参数 $after 与 $before 不能同时使用')
+    keyset_sort = handle_keyset_sort(sort_list)
+    query_dict = find_dict
+    cursor = after or before
+    if cursor:
+        values = decode_cursor(cursor, keyset_sort)
+        query_dict = {'$and': [find_dict, build_keyset_filter(
+            keyset_sort, values, before=bool(before))]}
+    # 向前翻页时反向排序，取到数据后再恢复顺序
+    query_sort = reverse_sort(keyset_sort) if before else keyset_sort
+    return query_dict, query_sort, keyset_sort
+
+
+def handle_keyset_result(docu_list: list, keyset_sort: list, limit: int, after: str = '', before: str = '') -> dict:
+    """
+    根据多取一条的查询结果，整理当前页数据与前后页游标
+    :return: {'items': 原始文档列表, 'next_cursor': 下一页游标, 'prev_cursor': 上一页游标}
+    """
+    has_more = len(docu_list) > limit
+    docu_list = docu_list[:limit]
+    if before:
+        docu_list.reverse()
+    next_cursor = None
+    prev_cursor = None
+    if docu_list:
+        # 向前翻页时，游标之后必然还有数据；向后翻页时，带有游标说明之前还有数据
+        if has_more or before:
+            next_cursor = encode_cursor(docu_list[-1], keyset_sort)
+        if (has_more and before) or after:
+            prev_cursor = encode_cursor(docu_list[0], keyset_sort)
+    return {'items': docu_list, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+
+def verify_paging_param(parameter) -> dict:
+    """
+    校验分页查询的请求参数，兼容GET和POST两个请求方式
+    :param parameter: 请求参数实例
+    :return: 校验后的参数字典，额外的筛选参数在 redundant_dict 中
+    """
+    if parameter.method == 'GET':
+        checking = parameter.param_url
+    else:
+        checking = parameter.param_json
+    if isinstance(checking, dict):
+        # 校验会修改参数字典，复制一份，避免同一个请求参数实例多次查询时结果不一致
+        checking = dict(checking)
+    return parameter.verification(checking=checking, verify=PAGING_SCHEMA)
+
+
+def build_paging_query(param: dict, filter_fields: dict = None, projection=None, fields: list = None, keyset: bool = False) -> dict:
+    """
+    根据分页请求参数生成查询方案，参数不符合要求时抛出异常
+    :param param: verify_paging_param() 校验后的参数字典
+    :param filter_fields: 字符串筛选字段的匹配方式，{字段: exact/prefix/text/regex}
+    :param projection: 固定的字段投影，请求中的 $fields 参数会覆盖该设置
+    :param fields: 允许通过 $fields 参数获取的字段白名单，'*' 为不限制，默认不允许使用 $fields 参数
+    :param keyset: 是否使用游标分页
+    :return: {
+        'find_dict': 统计总数的查询条件, 'query_dict': 获取当前页的查询条件, 'sort_list': 请求的排序规则,
+        'query_sort': 获取当前页的排序规则, 'keyset_sort': 游标排序规则, 'projection': 字段投影,
+        'limit': 页大小, 'offset': 起始位置, 'fetch_limit': 获取文档数量, 'skip': 跳过文档数量,
+        'after', 'before', 'use_keyset': 是否游标分页, 'use_text': 是否全文搜索,
+    }
+    """
+    filter_fields = filter_fields or {}
+    limit = int(param['$limit'])  # 指示页大小（从1开始）
+    offset = int(param['$offset'])  # 指示记录起始位置（从0开始）
+    if limit < 1:
+        raise Exception('指示页大小必须从 1 开始计算')
+    # 排序规则（`key1 desc,key2 asc`），asc=升序，desc=降序
+    orderby = param['$orderby']
+    sort_list = []  # 数据库排序规则列表
+    if orderby:
+        # 整理请求参数中的筛排序列表
+        orderby = orderby.split(',')
+        for order in orderby:
+            order_kv = order.split(' ')
+            if len(order_kv) == 2 and (order_kv[1] == 'asc' or order_kv[1] == 'desc') and order_kv[0].strip() != '':
+                if order_kv[1] == 'asc':
+                    sort_list.append((order_kv[0], pymongo.ASCENDING))
+                elif order_kv[1] == 'desc':
+                    sort_list.append((order_kv[0], pymongo.DESCENDING))
+            else:
+                raise Exception(
+                    '排序参数不符合格式要求: "{0}"'.format(param['$orderby']))
+    start_date = handle_date(date=param['$start_date'])  # 可选——开始日期
+    # 可选——结束日期，与开始日期组成日期区间
+    end_date = handle_date(date=param['$end_date'], date_type='end')
+    # 查找字典和排序列表，处理假删除数据
+    find_dict = handle_db_remove({})
+    redundant_filter = param['redundant_dict']  # 额外的数据库筛选字典
+    text_list = []  # 全文搜索的值列表
+    for filter_key, filter_value in redundant_filter.items():
+        # 整理请求参数中的筛选项字典
+        if type(filter_value) == int or type(filter_value) == dict or type(filter_value) == bool:
+            find_dict[filter_key] = filter_value
+        elif filter_key == 'id' or filter_key == '_id':
+            find_dict['_id'] = ObjectId(str(filter_value))
+        elif type(filter_value) == list:
+            # 值为列表，则使用元素匹配逻辑，将数据库中对应字段包含list元素的数据全部赛选出来
+            find_dict[filter_key] = {
+                "$elemMatch": {"$in": filter_value}}
+        else:
+            # 按字段配置的匹配方式筛选，默认模糊匹配
+            if filter_value.strip() != '':
+                filter_mode = filter_fields.get(filter_key, 'regex')
+                if filter_mode == 'text':
+                    # 全文搜索每个查询只能有一个 $text 条件，多个字段的值合并搜索
+                    text_list.append(filter_value)
+                else:
+                    find_dict[filter_key] = handle_text_filter(
+                        filter_value, filter_mode)
+    if text_list:
+        find_dict['$text'] = {'$search': ' '.join(text_list)}
+    # 仅存在日期查询区间参数时，进行额外的创建时间区间查询
+    if start_date and end_date:
+        find_dict[param['$date_type']] = {
+            '$gte': start_date, '$lte': end_date}
+    # 字段投影（`key1,key2`），仅允许白名单中的字段
+    if param['$fields']:
+        field_list = [field.strip() for field in param['$fields'].split(',') if field.strip()]
+        if fields is None:
+            # 没有白名单时不信任客户端的投影，避免覆盖默认投影获取内部字段
+            raise Exception('没有设置字段白名单，不支持 $fields 参数')
+        if fields != '*':
+            denied_list = [field for field in field_list if field not in fields]
+            if denied_list:
+                raise Exception('不允许获取的字段: {0}'.format(denied_list))
+        projection = field_list
+    projection = handle_db_projection(projection)
+    # 游标分页，忽略 $offset 参数
+    after = param['$after']
+    before = param['$before']
+    use_keyset = bool(keyset or after or before)
+    query_sort = sort_list
+    if text_list and not sort_list and not use_keyset:
+        # 没有指定排序规则时，按相关度排序
+        query_sort = [('score', {'$meta': 'textScore'})]
+    keyset_sort = None
+    if use_keyset:
+        query_dict, query_sort, keyset_sort = handle_keyset_query(
+            find_dict, sort_list, after, before)
+        # 生成游标需要排序字段的值
+        projection = handle_db_projection(
+            projection, extra_fields=[key for key, _ in keyset_sort])
+        # 多取一条用于判断是否还有更多数据
+        fetch_limit = limit + 1
+        skip = 0
+    else:
+        query_dict = find_dict
+        fetch_limit = limit
+        skip = offset
+    return {
+        'find_dict': find_dict, 'query_dict': query_dict, 'sort_list': sort_list,
+        'query_sort': query_sort, 'keyset_sort': keyset_sort, 'projection': projection,
+        'limit': limit, 'offset': offset, 'fetch_limit': fetch_limit, 'skip': skip,
+        'after': after, 'before': before, 'use_keyset': use_keyset, 'use_text': bool(text_list),
+    }
+
+
+def build_facet_pipeline(find_dict: dict, sort_list: list, limit: int, skip: int = 0, items_dict: dict = None, projection: dict = None) -> list:
+    """
+    生成一次获取当前页文档、筛选总数和假删除文档数的 $match + $sort + $facet 聚合管道，参数详见 DBConnect.find_facet()
+    没有索引可以提供排序时需要在内存中排序，执行时需要设置 allowDiskUse=True
+    """
+    remove_dict = {'remove_time': {'$exists': True}}
+    # $facet 内部的阶段无法使用索引，排序放在 $facet 之前，有合适的索引时由索引提供顺序；
+    # 之后的 $match（游标分页的范围条件）、$skip、$limit 都会保持该顺序
+    items_pipeline = [{'$match': items_dict or find_dict}]
+    if skip:
+        items_pipeline.append({'$skip': skip})
+    items_pipeline.append({'$limit': limit})
+    if projection:
+        items_pipeline.append({'$project': projection})
+    # 先筛选出 当前查询条件 或 假删除 的文档
+    pipeline = [{'$match': {'$or': [find_dict, remove_dict]}}]
+    if sort_list:
+        pipeline.append({'$sort': dict(sort_list)})
+    return pipeline + [
+        {'$facet': {
+            'items': items_pipeline,
+            'total': [{'$match': find_dict}, {'$count': 'count'}],
+            'dummy_remove': [{'$match': remove_dict}, {'$count': 'count'}],
+        }},
+    ]
+
+
+def build_facet_result(facet: dict) -> dict:
+    """
+    整理 build_facet_pipeline() 的聚合结果
+    :return: {'items': 原始文档列表, 'total': 筛选总数, 'dummy_remove': 假删除文档数}
+    """
+    total = facet.get('total', [])
+    dummy_remove = facet.get('dummy_remove', [])
+    return {
+        'items': facet.get('items', []),
+        'total': total[0]['count'] if total else 0,
+        'dummy_remove': dummy_remove[0]['count'] if dummy_remove else 0,
+    }
+
+
+def build_paging_result(query: dict, docu_list: list, records_filtered, remove_count: int, total_strategy: str, list_handler=handle_db_list) -> dict:
+    """
+    整理分页查询的响应数据
+    :param query: build_paging_query() 生成的查询方案
+    :param docu_list: 数据库原始文档列表
+    :param list_handler: 文档列表转换函数，默认为 handle_db_list
+    :return: {'total', 'items', 'dummy_remove', 'total_strategy'}，游标分页时额外返回 next_cursor/prev_cursor
+    """
+    if query['use_keyset']:
+        paging_data = handle_keyset_result(
+            list(docu_list), query['keyset_sort'], query['limit'], query['after'], query['before'])
+        docu_list = paging_data['items']
+    # 处理返回数据
+    query_result = list_handler(list(docu_list))
+    # 判断数据是否为空
+    if records_filtered:
+        result = {
+            'total': records_filtered,
+            'items': query_result,
+            'dummy_remove': remove_count,
+            'total_strategy': total_strategy,
+        }
+    else:
+        result = {
+            'total': 0,
+            'items': [],
+            'dummy_remove': remove_count,
+            'total_strategy': total_strategy,
+        }
+    if query['use_keyset']:
+        result['next_cursor'] = paging_data['next_cursor']
+        result['prev_cursor'] = paging_data['prev_cursor']
+    return result
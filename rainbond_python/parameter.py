@@ -1,25 +1,81 @@
+import os
+import copy
 import json
+from functools import cached_property
 from flask import abort, Response
 from .tools import handle_abnormal
+from .schema import Schema
+from .upload import DirectorySink, stream_upload, CHUNK_SIZE
+
+# 解析 Json 请求体的最大字节数，为空时不限制
+MAX_BODY_SIZE = int(os.environ.get('RAINBOND_MAX_BODY_SIZE', 0)) or None
 
 
 class Parameter():
-    def __init__(self, request):
+    """
+    请求参数，headers/param_url/param_json/param_form 在第一次访问时才解析，并缓存解析结果
+    """
+
+    def __init__(self, request, max_body_size: int = None):
+        """
+        :param request: Flask 请求对象
+        :param max_body_size: 解析 Json 请求体的最大字节数，超过时返回 413 异常，默认使用环境变量 RAINBOND_MAX_BODY_SIZE
+        """
         self.request = request
         self.ip = request.environ.get('HTTP_X_REAL_IP', request.remote_addr)
         self.method = request.method  # 请求方法
-        self.headers = dict(request.headers)  # 请求头
+        self.max_body_size = max_body_size or MAX_BODY_SIZE
+
+    @cached_property
+    def headers(self) -> dict:
+        # 请求头
+        return dict(self.request.headers)
+
+    @cached_property
+    def param_url(self) -> dict:
         # GET方法的取参
-        self.param_url = request.args.to_dict()
-        # 非GET方法取值
-        try:
-            self.param_json = json.loads(
-                request.get_data(as_text=True)
+        return self.request.args.to_dict()
+
+    @cached_property
+    def param_json(self) -> dict:
+        # 非GET方法取值，只解析 Json 类型（或未声明类型）的请求体
+        if self.request.mimetype and not self.request.is_json:
+            return {}
+        content_length = self.request.content_length
+        if self.max_body_size and content_length and content_length > self.max_body_size:
+            handle_abnormal(
+                message='请求内容过大',
+                status=413,
+                other={'prompt': '请求体不能超过 {0} 字节'.format(self.max_body_size)}
             )
-        except json.decoder.JSONDecodeError:
-            self.param_json = {}
+        if self.max_body_size and content_length is None:
+            # 分块传输时没有 Content-Length，最多读取 max_body_size + 1 字节，超过限制时立即返回 413 异常
+            data = b''
+            while len(data) <= self.max_body_size:
+                chunk = self.request.stream.read(self.max_body_size + 1 - len(data))
+                if not chunk:
+                    break
+                data += chunk
+            if len(data) > self.max_body_size:
+                handle_abnormal(
+                    message='请求内容过大',
+                    status=413,
+                    other={'prompt': '请求体不能超过 {0} 字节'.format(self.max_body_size)}
+                )
+        else:
+            data = self.request.get_data()
+        if not data:
+            return {}
+        try:
+            # 直接解析字节串，不需要先解码为字符串
+            return json.loads(data)
+        except ValueError:
+            return {}
+
+    @cached_property
+    def param_form(self) -> dict:
         # 表单提交取值
-        self.param_form = dict(request.form)
+        return dict(self.request.form)
 
     def get_content(self) -> dict:
         return {
@@ -30,13 +86,21 @@ class Parameter():
             'param_form': self.param_form
         }
 
-    def verification(self, checking: dict, verify: dict, optional: dict = {}, null_value: bool = False, allow_extra: bool = False) -> dict:
+    def verification(self, checking: dict, verify, optional: dict = None, null_value: bool = False, allow_extra: bool = False) -> dict:
+        """
+        校验参数字典
+        :param checking: 需要校验的参数字典
+        :param verify: 校验内容字典 {参数名: 参数类型}，或预先编译的 Schema（此时忽略其他参数）
+        """
+        if isinstance(verify, Schema):
+            return verify.validate(checking)
+        optional = optional or {}
         if type(checking) != dict:
             handle_abnormal(message='请求格式不规范', status=400)
         for opt_k, opt_v in optional.items():
-            # 没有选填参数时，填充预设的默认值
+            # 没有选填参数时，填充预设的默认值（可变的默认值复制后使用，避免不同请求共享）
             if not checking.__contains__(opt_k):
-                checking[opt_k] = opt_v
+                checking[opt_k] = copy.deepcopy(opt_v) if isinstance(opt_v, (list, dict, set)) else opt_v
         if not set(verify.keys()).issubset(set(checking.keys())):
             json_data = {'All Parameters': {}, 'Optional': optional}
             for k, v in verify.items():
@@ -94,6 +158,30 @@ class Parameter():
             checking['redundant_dict'] = redundant_dict
         return checking
 
+    def verification_many(self, checking: list, verify, optional: dict = None, null_value: bool = False, allow_extra: bool = False, max_errors: int = None, raise_err: bool = False) -> tuple:
+        """
+        批量校验记录列表（Eg: 批量导入接口的 Json 数组），校验规则与 verification() 相同
+          valid_list, error_list = parameter.verification_many(parameter.param_json, {'name': str, 'age': int})
+          db.write_many_docu(valid_list)
+        :param checking: 需要校验的记录列表
+        :param verify: 校验内容字典 {参数名: 参数类型}，或预先编译的 Schema（此时忽略 optional/null_value/allow_extra）
+        :param max_errors: 错误数量达到该值时停止校验
+        :param raise_err: 存在不合格的记录时是否直接返回异常响应（400），响应中包含全部错误
+        :return: (合格的记录列表, 错误列表 [{'index': 记录下标, 'message': 异常信息, 'prompt': 提示内容}, ...])
+        """
+        if type(checking) != list:
+            handle_abnormal(message='请求格式不规范', status=400, other={'prompt': '需要校验的内容应该是列表'})
+        if not isinstance(verify, Schema):
+            verify = Schema(verify, optional=optional, null_value=null_value, allow_extra=allow_extra)
+        valid_list, error_list = verify.validate_many(checking, max_errors=max_errors)
+        if raise_err and error_list:
+            handle_abnormal(
+                message='批量请求参数校验失败',
+                status=400,
+                other={'prompt': error_list}
+            )
+        return valid_list, error_list
+
     def verification_file(self, verify_field: list, verify_suffix: list = []):
         files = self.request.files
         for field in verify_field:
@@ -126,3 +214,31 @@ class Parameter():
                             status=400,
                         )
         return files
+
+    def stream_files(self, verify_field: list = None, verify_suffix: list = None, directory: str = None, sink=None, max_size=None, magic=None, checksum: str = 'sha256', chunk_size: int = CHUNK_SIZE, multiple: list = None) -> dict:
+        """
+        流式接收表单文件：边接收边校验 后缀/文件头/大小，同时计算校验和并直接写入目标，内存占用与文件大小无关
+        需要在访问 request.files/request.form/param_form 之前调用（请求体只能读取一次）
+        :param verify_field: 必须存在的文件字段
+        :param verify_suffix: 与 verify_field 对应的允许的后缀名，与 verification_file() 相同
+        :param directory: 保存目录，与 sink 二选一
+        :param sink: 自定义写入目标，详见 upload.DirectorySink
+        :param max_size: 单个文件的最大字节数（超过时返回 413 异常），或 {字段: 最大字节数}
+        :param magic: 允许的文件头字节串列表（Eg: [b'\\x89PNG']），或 {字段: 文件头列表}
+        :param checksum: 校验和算法，默认为 sha256
+        :param chunk_size: 每次读取的字节数
+        :param multiple: 允许上传多个文件的字段，这些字段的结果为列表；其他字段重复时返回 400 异常
+        :return: {'files': {字段: {'field', 'filename', 'size', 'sha256', 'path'} 或 [...]}, 'form': {字段: 值}}
+        """
+        if self.request.mimetype != 'multipart/form-data':
+            handle_abnormal(message='请求格式不规范', status=400, other={'prompt': '需要 multipart/form-data 格式的请求'})
+        boundary = self.request.mimetype_params.get('boundary', '')
+        if not boundary:
+            handle_abnormal(message='请求格式不规范', status=400, other={'prompt': '缺少 multipart 分隔符'})
+        if sink is None:
+            if not directory:
+                handle_abnormal(message='参数 directory 与 sink 至少需要指定一个', status=500)
+            sink = DirectorySink(directory)
+        return stream_upload(
+            self.request.stream, boundary.encode('latin-1'), sink, verify_field=verify_field, verify_suffix=verify_suffix,
+            max_size=max_size, magic=magic, checksum=checksum, chunk_size=chunk_size, multiple=multiple)
@@ -0,0 +1,527 @@
+import re
+import time
+import heapq
+import logging
+import itertools
+import threading
+from functools import cmp_to_key
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+from .db_connect import DBConnect
+from .parameter import Parameter
+from .mongo_client import parse_read_preference, parse_write_concern
+from .index_advisor import ensure_indexes
+from .json_encoder import dumps_json, handle_db_json_list
+from .paging import get_field, verify_paging_param, build_paging_query, build_paging_result
+from .tools import handle_db_list, handle_db_dict, handle_db_id, handle_db_docu, handle_db_remove, handle_abnormal, handle_db_error, db_now, handle_db_projection, handle_group_pipeline
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='[%(asctime)s] [%(levelname)s] %(message)s'
+)
+
+# 分区周期与对应的集合名称后缀格式
+PARTITION_PERIODS = {'month': '%Y%m', 'day': '%Y%m%d'}
+
+
+def handle_partition_time(value: datetime) -> datetime:
+    """
+    统一为与 db_now() 相同的不带时区的 UTC 时间
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def partition_end(start: datetime, period: str) -> datetime:
+    # 分区的结束时间（不包含）
+    if period == 'month':
+        if start.month == 12:
+            return datetime(start.year + 1, 1, 1)
+        return datetime(start.year, start.month + 1, 1)
+    return datetime.fromordinal(start.toordinal() + 1)
+
+
+def handle_partition_range(find_dict: dict, field: str) -> tuple:
+    """
+    从查询条件中提取分区字段的时间范围，用于裁剪需要查询的分区
+    :return: (开始时间, 结束时间)，没有对应条件时为 None
+    """
+    lower, upper = None, None
+    condition_list = [find_dict.get(field, None)]
+    for sub_dict in find_dict.get('$and', []):
+        if isinstance(sub_dict, dict):
+            condition_list.append(sub_dict.get(field, None))
+    for condition in condition_list:
+        if isinstance(condition, datetime):
+            condition = {'$gte': condition, '$lte': condition}
+        if not isinstance(condition, dict):
+            continue
+        for operator in ('$gte', '$gt'):
+            if isinstance(condition.get(operator, None), datetime):
+                value = handle_partition_time(condition[operator])
+                lower = value if lower is None else max(lower, value)
+        for operator in ('$lte', '$lt'):
+            if isinstance(condition.get(operator, None), datetime):
+                value = handle_partition_time(condition[operator])
+                upper = value if upper is None else min(upper, value)
+    return lower, upper
+
+
+def compare_value(value1, value2) -> int:
+    # 近似 MongoDB 的比较规则：None 最小，不同类型按类型名称比较
+    if value1 == value2:
+        return 0
+    if value1 is None:
+        return -1
+    if value2 is None:
+        return 1
+    try:
+        return -1 if value1 < value2 else 1
+    except TypeError:
+        return -1 if type(value1).__name__ < type(value2).__name__ else 1
+
+
+def merge_sorted(docu_iter_list: list, sort_list: list):
+    """
+    合并多个已按 sort_list 排序的文档序列
+    :param docu_iter_list: 文档列表或游标的列表
+    :param sort_list: [(key, pymongo.ASCENDING/DESCENDING), ...]，为空时按顺序拼接
+    :return: 合并后的文档迭代器
+    """
+    if not sort_list:
+        return itertools.chain(*docu_iter_list)
+
+    def compare(docu1, docu2):
+        for key, direction in sort_list:
+            result = compare_value(get_field(docu1, key), get_field(docu2, key))
+            if result:
+                return result * direction
+        return 0
+
+    return heapq.merge(*docu_iter_list, key=cmp_to_key(compare))
+
+
+class PartitionedDBConnect(DBConnect):
+    """
+    按时间分区的集合，文档按 creation_time 写入 `集合名称_YYYYMM`（或 `集合名称_YYYYMMDD`）集合
+      db = PartitionedDBConnect(db='db_name', collection='events', period='month')
+    查询时按分区字段的时间范围裁剪分区，并发查询各分区后合并排序结果与总数；
+    删除过期数据时直接删除整个分区集合（drop_partitions），代替范围删除
+    """
+
+    def __init__(self, db: str, collection: str, period: str = 'month', partition_field: str = 'creation_time', max_workers: int = 8, partition_ttl: float = 60, indexes: list = None, **options):
+        """
+        :param period: 分区周期，month=按月，day=按天
+        :param partition_field: 分区字段，必须是时间类型（写入时 creation_time 会自动补充）
+        :param max_workers: 并发查询分区的最大线程数
+        :param partition_ttl: 分区列表的缓存时间（秒），其他进程创建的分区最多延迟该时间后可见
+        :param indexes: 声明式索引，在每个分区第一次使用时确保索引存在
+        :param options: 其他 DBConnect 参数
+        """
+        if period not in PARTITION_PERIODS:
+            handle_abnormal(message='分区周期必须是 {0} 之一'.format(tuple(PARTITION_PERIODS)), status=500)
+        super().__init__(db, collection, **options)
+        self.period = period
+        self.partition_field = partition_field
+        self.partition_ttl = partition_ttl
+        self.indexes = indexes
+        self.partition_pattern = re.compile(
+            r'^{0}_(\d{{{1}}})$'.format(re.escape(collection), 6 if period == 'month' else 8))
+        self.partitions = None  # 已知的分区名称集合
+        self.partitions_expire = 0.0
+        self.partition_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='partition')
+
+    def partition_name(self, value: datetime) -> str:
+        """
+        获取时间所在分区的集合名称
+        """
+        return '{0}_{1}'.format(self.mongo_collection.name, handle_partition_time(value).strftime(PARTITION_PERIODS[self.period]))
+
+    def partition_bounds(self, name: str) -> tuple:
+        """
+        获取分区的时间范围
+        :return: (开始时间, 结束时间)，不包含结束时间
+        """
+        start = datetime.strptime(self.partition_pattern.match(name).group(1), PARTITION_PERIODS[self.period])
+        return start, partition_end(start, self.period)
+
+    def list_partitions(self, refresh: bool = False) -> list:
+        """
+        获取已存在的分区名称，按时间升序排列
+        :param refresh: 是否忽略缓存重新获取
+        """
+        with self.partition_lock:
+            if refresh or self.partitions is None or self.partitions_expire < time.monotonic():
+                self.partitions = {
+                    name for name in self.mongo_db.list_collection_names() if self.partition_pattern.match(name)}
+                self.partitions_expire = time.monotonic() + self.partition_ttl
+            return sorted(self.partitions)
+
+    def get_partition(self, name: str, read_preference=None, write_concern=None):
+        """
+        获取分区集合，读偏好/写关注与实例配置相同，可以单独覆盖
+        """
+        collection = self.mongo_db.get_collection(
+            name, read_preference=self.mongo_collection.read_preference,
+            write_concern=self.mongo_collection.write_concern)
+        if read_preference is not None or write_concern is not None:
+            collection = collection.with_options(
+                read_preference=parse_read_preference(read_preference),
+                write_concern=parse_write_concern(write_concern))
+        return collection
+
+    def get_write_partition(self, name: str, write_concern=None):
+        # 写入前登记新分区，并确保索引存在
+        with self.partition_lock:
+            if self.partitions is not None:
+                self.partitions.add(name)
+        collection = self.get_partition(name, write_concern=write_concern)
+        if self.indexes is not None:
+            ensure_indexes(collection, self.indexes)
+        return collection
+
+    def select_partitions(self, find_dict: dict) -> list:
+        """
+        按查询条件中分区字段的时间范围裁剪分区；按 _id 查询时，ObjectId 生成时间所在的分区排在最前面
+        :return: 分区名称列表，按时间降序排列（最新的分区在前）
+        """
+        lower, upper = handle_partition_range(find_dict, self.partition_field)
+        name_list = []
+        for name in reversed(self.list_partitions()):
+            start, end = self.partition_bounds(name)
+            if (lower is not None and end <= lower) or (upper is not None and start > upper):
+                continue
+            name_list.append(name)
+        object_id = find_dict.get('_id', None)
+        if isinstance(object_id, ObjectId) and self.partition_field == 'creation_time':
+            hint = self.partition_name(object_id.generation_time)
+            if hint in name_list:
+                name_list.remove(hint)
+                name_list.insert(0, hint)
+        return name_list
+
+    def map_partitions(self, func, name_list: list) -> list:
+        """
+        并发地对每个分区执行 func(分区名称)
+        :return: 与 name_list 顺序相同的结果列表
+        """
+        if len(name_list) <= 1:
+            return [func(name) for name in name_list]
+        return list(self.executor.map(func, name_list))
+
+    def unsupported(self, name: str):
+        handle_abnormal(message='分区集合不支持 {0}()'.format(name), status=500)
+
+    def drop_partitions(self, before: datetime = None, keep: int = None) -> list:
+        """
+        删除过期的分区集合
+        :param before: 删除结束时间不晚于该时间的分区（即全部数据都早于该时间）
+        :param keep: 只保留最新的 N 个分区
+        :return: 已删除的分区名称列表
+        """
+        if before is None and keep is None:
+            handle_abnormal(message='参数 before 与 keep 至少需要指定一个', status=500)
+        name_list = self.list_partitions(refresh=True)
+        drop_list = []
+        if keep is not None:
+            drop_list = name_list[:max(len(name_list) - keep, 0)]
+        if before is not None:
+            before = handle_partition_time(before)
+            drop_list = sorted(set(drop_list) | {
+                name for name in name_list if self.partition_bounds(name)[1] <= before})
+        try:
+            for name in drop_list:
+                self.mongo_db.drop_collection(name)
+                logging.warning('MongoDB(组件)已删除分区集合 {0}'.format(name))
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)删除分区集合异常')
+        finally:
+            with self.partition_lock:
+                self.partitions = None
+            self.invalidate_cache()
+        return drop_list
+
+    def write_one_docu(self, docu: dict, write_concern=None) -> str:
+        new_docu = handle_db_docu(docu)
+        if not isinstance(new_docu.get(self.partition_field, None), datetime):
+            handle_abnormal(message='分区字段 {0} 必须是时间类型'.format(self.partition_field), status=400)
+        try:
+            collection = self.get_write_partition(
+                self.partition_name(new_docu[self.partition_field]), write_concern=write_concern)
+            new_data = collection.insert_one(new_docu)
+            self.invalidate_cache()
+            return str(new_data.inserted_id)
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现写入错误')
+
+    def write_many_docu(self, docu_list: list, write_concern=None) -> list:
+        if not isinstance(docu_list, list) or not all(isinstance(docu, dict) for docu in docu_list):
+            handle_abnormal(
+                message='参数docu_list格式不正确，要求为：[{},{},{}...]',
+                status=500,
+                other={'prompt': {'docu_list': str(docu_list)}}
+            )
+        now = db_now()
+        new_docu_list = [handle_db_docu(docu, now=now) for docu in docu_list]
+        group_dict = {}  # 分区名称 -> 文档列表
+        for new_docu in new_docu_list:
+            if not isinstance(new_docu.get(self.partition_field, None), datetime):
+                handle_abnormal(message='分区字段 {0} 必须是时间类型'.format(self.partition_field), status=400)
+            group_dict.setdefault(self.partition_name(new_docu[self.partition_field]), []).append(new_docu)
+        try:
+            for name, group_list in group_dict.items():
+                self.get_write_partition(name, write_concern=write_concern).insert_many(group_list)
+            self.invalidate_cache()
+            # insert_many() 会为文档补充 _id，按传入顺序返回
+            return [str(new_docu['_id']) for new_docu in new_docu_list]
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现写入错误')
+
+    def update_partitions(self, find_docu: dict, update: dict, many: bool, write_concern=None) -> dict:
+        # 更新多个文档时并发更新全部分区，更新单个文档时按分区顺序更新到第一个匹配的文档为止
+        name_list = self.select_partitions(find_docu)
+        if many:
+            result_list = self.map_partitions(lambda name: self.get_partition(
+                name, write_concern=write_concern).update_many(find_docu, update), name_list)
+        else:
+            result_list = []
+            for name in name_list:
+                result = self.get_partition(name, write_concern=write_concern).update_one(find_docu, update)
+                result_list.append(result)
+                if result.matched_count:
+                    break
+        self.invalidate_cache()
+        return {
+            'matched_count': sum(result.matched_count for result in result_list),
+            'modified_count': sum(result.modified_count for result in result_list),
+        }
+
+    def update_docu(self, find_docu: dict, modify_docu: dict, many=False, write_concern=None) -> dict:
+        try:
+            find_docu = handle_db_remove(handle_db_id(find_docu))
+            if not modify_docu.__contains__('update_time'):
+                modify_docu = dict(modify_docu, update_time=db_now())
+            return self.update_partitions(find_docu, {'$set': modify_docu}, many, write_concern=write_concern)
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现更新错误')
+
+    def update_docu_inc(self, find_docu: dict, modify_docu: dict, many=False, buffered: bool = False, write_concern=None) -> dict:
+        if buffered:
+            self.unsupported('update_docu_inc(buffered=True)')
+        try:
+            find_docu = handle_db_remove(handle_db_id(find_docu))
+            update = {'$inc': modify_docu, '$set': {'update_time': db_now()}}
+            return self.update_partitions(find_docu, update, many, write_concern=write_concern)
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现更新错误')
+
+    def delete_docu(self, find_docu: dict, many: bool = False, false_delete: bool = False, write_concern=None) -> dict:
+        if false_delete:
+            # 假删除通过 update_docu() 完成
+            return super().delete_docu(find_docu, many=many, false_delete=True, write_concern=write_concern)
+        try:
+            find_docu = handle_db_id(find_docu)
+            name_list = self.select_partitions(find_docu)
+            if many:
+                result_list = self.map_partitions(lambda name: self.get_partition(
+                    name, write_concern=write_concern).delete_many(find_docu), name_list)
+            else:
+                result_list = []
+                for name in name_list:
+                    result = self.get_partition(name, write_concern=write_concern).delete_one(find_docu)
+                    result_list.append(result)
+                    if result.deleted_count:
+                        break
+            self.invalidate_cache()
+            deleted_count = sum(result.deleted_count for result in result_list)
+            if not deleted_count:
+                logging.error('MongoDB(组件)出现删除异常: 没有任何文档被真删除')
+            return {'deleted_count': deleted_count, 'false_delete': false_delete}
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现删除错误')
+
+    def does_it_exist(self, docu: dict) -> bool:
+        find_dict = handle_db_id(docu)
+        for name in self.select_partitions(find_dict):
+            if self.get_partition(name).count_documents(find_dict, limit=1):
+                return True
+        return False
+
+    def find_docu(self, find_dict: dict, many: bool = True, projection=None, as_json: bool = False, read_preference=None, max_time_ms: int = None, batch_size: int = None) -> list:
+        """
+        查询文档，多文档查询时并发查询各分区，结果按分区时间降序拼接
+        """
+        try:
+            deep_find_dict = handle_db_remove(handle_db_id(find_dict))
+            projection = handle_db_projection(projection)
+            hit, cache_key, cache_value = self.get_cache(
+                'find_docu', deep_find_dict, many, projection, as_json)
+            if hit:
+                return cache_value
+            name_list = self.select_partitions(deep_find_dict)
+
+            def find_partition(name):
+                collection = self.get_partition(name, read_preference=read_preference)
+                return list(self.get_cursor(
+                    collection, deep_find_dict, projection, max_time_ms=max_time_ms, batch_size=batch_size))
+
+            if many and not isinstance(deep_find_dict.get('_id', None), ObjectId):
+                docu_list = list(itertools.chain(*self.map_partitions(find_partition, name_list)))
+            else:
+                # 单文档查询（或按 _id 精确查询）时，按分区顺序查询到第一个匹配的文档为止
+                docu_list = []
+                for name in name_list:
+                    collection = self.get_partition(name, read_preference=read_preference)
+                    docu_list = list(self.get_cursor(
+                        collection, deep_find_dict, projection, max_time_ms=max_time_ms).limit(-1))
+                    if docu_list:
+                        break
+            if as_json:
+                result = dumps_json(handle_db_json_list(docu_list))
+            else:
+                result = handle_db_list(docu_list)
+            self.set_cache(cache_key, result)
+            return result
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现查询错误')
+
+    def iter_docu(self, find_dict: dict, batch_size: int = 1000, sort_list: list = None, projection=None):
+        """
+        以生成器方式逐个返回查询结果，指定排序规则时合并各分区的有序游标，否则按分区时间降序依次返回
+        """
+        try:
+            deep_find_dict = handle_db_remove(handle_db_id(find_dict))
+            projection = handle_db_projection(
+                projection, extra_fields=[key for key, _ in sort_list or []])
+            cursor_list = []
+            for name in self.select_partitions(deep_find_dict):
+                query_cursor = self.get_partition(name).find(deep_find_dict, projection).batch_size(batch_size)
+                if sort_list:
+                    query_cursor = query_cursor.sort(sort_list)
+                cursor_list.append(query_cursor)
+        except Exception as err:
+            handle_abnormal(
+                message='MongoDB(组件)出现查询错误',
+                status=500,
+                other={'prompt': str(err)}
+            )
+
+        def generate():
+            try:
+                for docu in merge_sorted(cursor_list, sort_list):
+                    yield handle_db_dict(docu)
+            finally:
+                for query_cursor in cursor_list:
+                    query_cursor.close()
+
+        return generate()
+
+    def aggregate_group(self, field: str, find_dict: dict = None, unwind: bool = True, stages: list = None) -> list:
+        """
+        按字段分组聚合，通过 $unionWith 在一次聚合中合并全部匹配的分区（要求 MongoDB 4.4+）
+        """
+        pipeline = handle_group_pipeline(field, find_dict, unwind)
+        hit, cache_key, cache_value = self.get_cache('aggregate_group', pipeline, stages)
+        if hit:
+            return cache_value
+        match_stage = pipeline[0]
+        name_list = self.select_partitions(match_stage['$match'])
+        if not name_list:
+            return []
+        union_list = [{'$unionWith': {'coll': name, 'pipeline': [match_stage]}} for name in name_list[1:]]
+        try:
+            result = list(self.get_partition(name_list[0]).aggregate(
+                [match_stage] + union_list + pipeline[1:] + (stages or []), allowDiskUse=True))
+        except Exception as err:
+            handle_db_error(err, message='MongoDB(组件)出现查询错误')
+        self.set_cache(cache_key, result)
+        return result
+
+    def count_docu(self, find_dict: dict, count: str = 'exact', count_cap: int = 10000, count_ttl: int = 60, collection=None, max_time_ms: int = None, read_preference=None) -> tuple:
+        """
+        统计全部匹配分区的文档数量之和，计数策略详见 DBConnect.count_docu()
+        :param collection: 指定时只统计该集合（单个分区）
+        """
+        if collection is not None:
+            return super().count_docu(
+                find_dict, count=count, count_cap=count_cap, count_ttl=count_ttl, collection=collection, max_time_ms=max_time_ms)
+        if count == 'estimated' and find_dict != handle_db_remove({}):
+            count = 'exact'
+        result_list = self.map_partitions(lambda name: super(PartitionedDBConnect, self).count_docu(
+            find_dict, count=count, count_cap=count_cap, count_ttl=count_ttl,
+            collection=self.get_partition(name, read_preference=read_preference), max_time_ms=max_time_ms
+        ), self.select_partitions(find_dict))
+        if count == 'capped':
+            # 单个分区超过上限时按上限+1计算
+            total = sum(value if isinstance(value, int) else count_cap + 1 for value, _ in result_list)
+            return ('{0}+'.format(count_cap) if total > count_cap else total), 'capped'
+        return sum(value for value, _ in result_list), count
+
+    def find_paging(self, parameter: Parameter, keyset: bool = False, facet: bool = False, count: str = 'exact', count_cap: int = 10000, count_ttl: int = 60, projection=None, fields: list = None, as_json: bool = False, read_preference=None, max_time_ms: int = None) -> dict:
+        """
+        分页查询，并发查询按时间范围裁剪后的分区，合并排序结果与总数（参数详见 DBConnect.find_paging()）
+        每个分区最多获取 $offset+$limit 个文档，偏移量较大时建议使用游标分页；不支持 facet 与全文搜索
+        """
+        param = verify_paging_param(parameter)
+        try:
+            query = build_paging_query(
+                param, filter_fields=self.filter_fields, projection=projection, fields=fields, keyset=keyset)
+            if query['use_text']:
+                raise Exception('分区集合的分页查询不支持全文搜索')
+            hit, cache_key, cache_value = self.get_cache(
+                'find_paging', query['find_dict'], query['query_dict'], query['query_sort'], query['fetch_limit'],
+                query['skip'], query['projection'], query['use_keyset'], count, count_cap, as_json)
+            if hit:
+                return cache_value
+            find_dict = query['find_dict']
+            name_list = self.select_partitions(find_dict)
+            # 合并排序需要排序字段的值
+            query_projection = handle_db_projection(
+                query['projection'], extra_fields=[key for key, _ in query['query_sort']])
+            fetch_count = query['skip'] + query['fetch_limit']
+
+            def find_partition(name):
+                collection = self.get_partition(name, read_preference=read_preference)
+                find_data = self.get_cursor(collection, query['query_dict'], query_projection, max_time_ms=max_time_ms)
+                if query['query_sort']:
+                    find_data = find_data.sort(query['query_sort'])
+                return list(find_data.limit(fetch_count))
+
+            docu_list = list(itertools.islice(
+                merge_sorted(self.map_partitions(find_partition, name_list), query['query_sort']),
+                query['skip'], fetch_count))
+            records_filtered, total_strategy = self.count_docu(
+                find_dict, count=count, count_cap=count_cap, count_ttl=count_ttl,
+                max_time_ms=max_time_ms, read_preference=read_preference)
+            # 假删除数据的数据量统计全部分区，非精确计数策略时使用缓存
+            remove_dict = {'remove_time': {'$exists': True}}
+            remove_list = self.map_partitions(lambda name: super(PartitionedDBConnect, self).count_docu(
+                remove_dict, count='exact' if count == 'exact' else 'cached', count_ttl=count_ttl,
+                collection=self.get_partition(name, read_preference=read_preference), max_time_ms=max_time_ms
+            ), self.list_partitions())
+            remove_count = sum(value for value, _ in remove_list)
+            if as_json:
+                result = dumps_json(build_paging_result(
+                    query, docu_list, records_filtered, remove_count, total_strategy, list_handler=handle_db_json_list))
+            else:
+                result = build_paging_result(
+                    query, docu_list, records_filtered, remove_count, total_strategy)
+            self.set_cache(cache_key, result)
+            return result
+        except Exception as err:
+            handle_db_error(err, message='计算组件分页参数异常', status=400)
+
+    def find_facet(self, *args, **kwargs):
+        self.unsupported('find_facet')
+
+    def bulk_writer(self, *args, **kwargs):
+        self.unsupported('bulk_writer')
+
+    def archiver(self, *args, **kwargs):
+        self.unsupported('archiver')
+
+    def counter_buffer(self, *args, **kwargs):
+        self.unsupported('counter_buffer')
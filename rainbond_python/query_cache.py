@@ -0,0 +1,160 @@
+import copy
+import time
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from bson import json_util
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='[%(asctime)s] [%(levelname)s] %(message)s'
+)
+
+
+class QueryCache:
+    """
+    查询结果缓存，进程内 LRU（带有效期和容量上限）+ 可选的 Redis 二级缓存
+    每个集合有一个版本号，通过同一个 DBConnect 写入时版本号递增，旧版本的缓存自然失效
+      cache = QueryCache(max_size=2048, ttl=30, redis_connect=RedisConnect(db=1))
+      db = DBConnect(db='db_name', collection='collection_name', cache=cache)
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60, redis_connect=None, redis_ttl: int = None, prefix: str = 'rainbond_query_cache'):
+        """
+        :param max_size: 进程内缓存的最大条目数
+        :param ttl: 进程内缓存有效期（秒）
+        :param redis_connect: RedisConnect 实例，设置后启用 Redis 二级缓存
+        :param redis_ttl: Redis 缓存有效期（秒），默认与 ttl 相同
+        :param prefix: Redis 键的前缀
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis_connect = redis_connect
+        self.redis_ttl = int(redis_ttl or ttl)
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (过期时间, 结果)
+        self.generations = {}  # 集合 -> 版本号
+        self.counters = {'hits': 0, 'local_hits': 0, 'redis_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        # 规范化查询条件/排序/投影等参数，字典键排序后生成摘要
+        raw = json_util.dumps(parts, sort_keys=True)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def generation(self, namespace: str) -> int:
+        with self.lock:
+            return self.generations.get(namespace, 0)
+
+    def redis_generation(self, namespace: str) -> str:
+        return self.redis_connect.get_('{0}:gen:{1}'.format(self.prefix, namespace)) or '0'
+
+    def snapshot(self, namespace: str) -> tuple:
+        """
+        读取集合当前的版本号，在查询数据库之前调用，之后以同一个版本号写入结果
+        查询期间如果有写入使版本号递增，结果会写入旧版本，不会被后续读取命中
+        :return: (进程内版本号, Redis 版本号)，Redis 不可用时 Redis 版本号为 None
+        """
+        redis_generation = None
+        if self.redis_connect:
+            try:
+                redis_generation = self.redis_generation(namespace)
+            except Exception as err:
+                logging.warning('查询缓存读取 Redis 版本号失败: {0}'.format(err))
+        return self.generation(namespace), redis_generation
+
+    def get(self, namespace: str, key: str, generation: tuple = None) -> tuple:
+        """
+        读取缓存
+        :param generation: snapshot() 返回的版本号，默认读取当前版本号
+        :return: (是否命中, 结果)，结果为缓存值的拷贝，调用方可以任意修改
+        """
+        if generation is None:
+            generation = self.snapshot(namespace)
+        local_key = (namespace, generation[0], key)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(local_key, None)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(local_key)
+                self.counters['hits'] += 1
+                self.counters['local_hits'] += 1
+                return True, copy.deepcopy(entry[1])
+            if entry:
+                del self.entries[local_key]
+        if self.redis_connect and generation[1] is not None:
+            try:
+                redis_key = '{0}:{1}:{2}:{3}'.format(
+                    self.prefix, namespace, generation[1], key)
+                raw = self.redis_connect.get_(redis_key)
+                if raw is not None:
+                    value = json_util.loads(raw)
+                    self.set_local(local_key, value)
+                    with self.lock:
+                        self.counters['hits'] += 1
+                        self.counters['redis_hits'] += 1
+                    return True, value
+            except Exception as err:
+                logging.warning('查询缓存读取 Redis 失败: {0}'.format(err))
+        with self.lock:
+            self.counters['misses'] += 1
+        return False, None
+
+    def set_local(self, local_key: tuple, value):
+        with self.lock:
+            self.entries[local_key] = (
+                time.monotonic() + self.ttl, copy.deepcopy(value))
+            self.entries.move_to_end(local_key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def set(self, namespace: str, key: str, value, generation: tuple = None):
+        """
+        写入缓存
+        :param generation: 查询前 snapshot() 返回的版本号，默认使用当前版本号
+        """
+        if generation is None:
+            generation = self.snapshot(namespace)
+        if generation[0] == self.generation(namespace):
+            self.set_local((namespace, generation[0], key), value)
+        if self.redis_connect and generation[1] is not None:
+            try:
+                redis_key = '{0}:{1}:{2}:{3}'.format(
+                    self.prefix, namespace, generation[1], key)
+                self.redis_connect.set_(
+                    redis_key, json_util.dumps(value), ex=self.redis_ttl)
+            except Exception as err:
+                logging.warning('查询缓存写入 Redis 失败: {0}'.format(err))
+
+    def invalidate(self, namespace: str):
+        """
+        使集合的全部缓存失效
+        """
+        with self.lock:
+            self.generations[namespace] = self.generations.get(namespace, 0) + 1
+            self.counters['invalidations'] += 1
+            # 旧版本的条目不会再被命中，直接清理释放内存
+            for local_key in [k for k in self.entries if k[0] == namespace]:
+                del self.entries[local_key]
+        if self.redis_connect:
+            try:
+                self.redis_connect.incr_('{0}:gen:{1}'.format(self.prefix, namespace))
+            except Exception as err:
+                logging.warning('查询缓存更新 Redis 版本号失败: {0}'.format(err))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        """
+        :return: {'hits', 'local_hits', 'redis_hits', 'misses', 'invalidations', 'size', 'hit_rate'}
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats['size'] = len(self.entries)
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / total if total else 0.0
+        return stats
@@ -1,6 +1,8 @@
 import os
 import redis
 import logging
+from redis.retry import Retry
+from redis.backoff import ExponentialBackoff
 from .tools import handle_abnormal
 
 logging.basicConfig(
@@ -8,12 +10,24 @@ logging.basicConfig(
     format='[%(asctime)s] [%(levelname)s] %(message)s'
 )
 
+HEALTH_CHECK_INTERVAL = 30  # 连接空闲超过该秒数后，使用前先发送 PING 检查
+RETRIES = 3  # 连接异常时的重试次数
+
 
 class RedisConnect:
-    def __init__(self, db=0, host_key='REDIS_HOST', port_key='REDIS_PORT', password='REDIS_PASSWORD', decode_responses: bool = True, *args, **kwargs):
+    def __init__(self, db=0, host_key='REDIS_HOST', port_key='REDIS_PORT', password='REDIS_PASSWORD', decode_responses: bool = True, *args,
+                 health_check_interval: int = HEALTH_CHECK_INTERVAL, retries: int = RETRIES, socket_keepalive: bool = True, **kwargs):
+        """
+        :param health_check_interval: 连接空闲超过该秒数后，使用前由连接池发送 PING 检查，为 0 时不检查
+        :param retries: 连接异常、超时时按指数退避重试的次数，为 0 时不重试
+        :param socket_keepalive: 是否开启 TCP keepalive，及时发现被中间网络设备断开的连接
+        """
         self.redis_host = os.environ.get(host_key, '127.0.0.1')
         self.redis_port = os.environ.get(port_key, 6379)
         self.redis_password = os.environ.get(password, None)
+        kwargs.setdefault('retry', Retry(ExponentialBackoff(cap=1, base=0.05), retries))
+        kwargs.setdefault('health_check_interval', health_check_interval)
+        kwargs.setdefault('socket_keepalive', socket_keepalive)
         # 创建Redis连接池
         if self.redis_password:
             self.pool = redis.ConnectionPool(
@@ -21,21 +35,36 @@ class RedisConnect:
         else:
             self.pool = redis.ConnectionPool(
                 host=self.redis_host, port=self.redis_port, decode_responses=decode_responses, *args, **kwargs)
+        # 长期使用的Redis实例（共享一个连接池），连接的可用性由连接池检查
+        self.client = redis.Redis(connection_pool=self.pool)
 
     def connect(self):
+        """
+        获取Redis实例，不会发送请求（Eg: 用于 pipeline()）
+        """
+        return self.client
+
+    def execute(self, command: str, *args, **kwargs):
+        """
+        执行Redis命令，重试后仍然连接失败时直接返回异常响应
+        execute('hset', 'hash1', 'k1', 'v1')
+        """
         try:
-            # 创建Redis实例（共享一个连接池）
-            con = redis.Redis(connection_pool=self.pool)
-            con.get('usability_testing')  # 主动尝试连接
-            return con
-        except Exception as e:
-            # 尝试连接失败直接抛出异常
+            return getattr(self.client, command)(*args, **kwargs)
+        except (redis.ConnectionError, redis.TimeoutError) as e:
             handle_abnormal(
                 message='Redis 连接失败',
                 status=500,
                 other={'prompt': str(e)}
             )
 
+    def ping_(self):
+        """
+        主动检查连接是否可用
+        ping_()
+        """
+        return self.execute('ping')
+
     def mset_(self, *args, **kwargs):
         """
         批量设置值
@@ -44,21 +73,29 @@ class RedisConnect:
         mset_('k1', 'k2')
         mset_('k1')
         """
-        return self.connect().mset(*args, **kwargs)
+        return self.execute('mset', *args, **kwargs)
+
+    def set_(self, *args, **kwargs):
+        """
+        设置值，ex 为过期时间（秒）
+        set_('foo', 'bar')
+        set_('foo', 'bar', ex=60)
+        """
+        return self.execute('set', *args, **kwargs)
 
     def getset_(self, *args, **kwargs):
         """
         设置新值并获取原来的值
         getset_('food', 'barbecue')
         """
-        return self.connect().getset(*args, **kwargs)
+        return self.execute('getset', *args, **kwargs)
 
     def get_(self, *args, **kwargs):
         """
         取出键对应的值
         get_('foo')
         """
-        return self.connect().get(*args, **kwargs)
+        return self.execute('get', *args, **kwargs)
 
     def mget_(self, *args, **kwargs):
         """
@@ -67,21 +104,21 @@ class RedisConnect:
         mget_(['k1', 'k2'])
         mget_('fruit', 'fruit1', 'fruit2', 'k1', 'k2')
         """
-        return self.connect().mget(*args, **kwargs)
+        return self.execute('mget', *args, **kwargs)
 
     def delete_(self, *args, **kwargs):
         """
         删除
         delete_('gender')
         """
-        return self.connect().delete(*args, **kwargs)
+        return self.execute('delete', *args, **kwargs)
 
     def incr_(self, *args, **kwargs):
         """
         自增 name 对应的值，当 name 不存在时，则创建 name＝amount，否则，则自增
         incr_('foo', amount=1)
         """
-        return self.connect().incr(*args, **kwargs)
+        return self.execute('incr', *args, **kwargs)
 
     def decr_(self, *args, **kwargs):
         """
@@ -90,46 +127,46 @@ class RedisConnect:
         decr_('foo1', amount=1)
         decr_('foo1', 'foo4')
         """
-        return self.connect().decr(*args, **kwargs)
+        return self.execute('decr', *args, **kwargs)
 
     def lpush_(self, *args, **kwargs):
         """
         list增加（类似于list的append，只是这里是从左边新增加）--没有就新建
         lpush_('list1', 11, 22, 33)
         """
-        return self.connect().lpush(*args, **kwargs)
+        return self.execute('lpush', *args, **kwargs)
 
     def rpush_(self, *args, **kwargs):
         """
         list增加（从右边增加）--没有就新建
         rpush_('list2', 11, 22, 33)
         """
-        return self.connect().rpush(*args, **kwargs)
+        return self.execute('rpush', *args, **kwargs)
 
     def lpop_(self, *args, **kwargs):
         """
         list从左删除并返回删除值
         lpop_('list2')
         """
-        return self.connect().lpop(*args, **kwargs)
+        return self.execute('lpop', *args, **kwargs)
 
     def rpop_(self, *args, **kwargs):
         """
         list从右删除并返回删除值
         rpop_('list2')
         """
-        return self.connect().rpop(*args, **kwargs)
+        return self.execute('rpop', *args, **kwargs)
 
     def exists_(self, *args):
         """
         检查名字是否存在
         exists_('zset1')
         """
-        return self.connect().exists(*args)
+        return self.execute('exists', *args)
 
     def expire_(self, *args, **kwargs):
         """
         设置超时时间
         expire_('list5', time=3)
         """
-        return self.connect().expire(*args, **kwargs)
+        return self.execute('expire', *args, **kwargs)
@@ -0,0 +1,250 @@
+import copy
+import json
+from .tools import handle_abnormal
+
+
+class SchemaError(Exception):
+    """
+    参数校验失败，message 为响应信息，prompt 为具体的提示内容（其中的 {path} 在校验结束后替换为字段路径）
+    """
+
+    def __init__(self, message: str, prompt=None):
+        super().__init__(message)
+        self.message = message
+        self.prompt = prompt
+        self.path = []  # 字段路径，由外层逐级补充，只在校验失败时生成
+
+    def get_prompt(self):
+        if not isinstance(self.prompt, str):
+            return self.prompt
+        path = ''
+        for part in self.path:
+            path += '[{0}]'.format(part) if isinstance(part, int) else ('.' + part if path else part)
+        return self.prompt.format(path=path)
+
+
+class Field:
+    """
+    带有约束条件的字段声明
+      Field(int, min=0, max=150)  # 数值范围
+      Field(str, min=1, max=20)  # 字符串、列表的长度范围
+      Field(str, enum=['male', 'female'])  # 枚举值
+      Field(list, items=int)  # 元素类型，也可以直接写作 [int]
+    """
+
+    def __init__(self, type_, min=None, max=None, enum=None, items=None, null_value: bool = None):
+        """
+        :param type_: 字段类型（str/int/float/bool/list/dict），也可以是嵌套的字典声明或 Schema
+        :param min: 最小值，str/list 时为最小长度
+        :param max: 最大值，str/list 时为最大长度
+        :param enum: 允许的取值列表
+        :param items: 列表元素的类型声明
+        :param null_value: 字符串是否允许为空，默认与 Schema 相同
+        """
+        self.type = type_
+        self.min = min
+        self.max = max
+        self.enum = enum
+        self.items = items
+        self.null_value = null_value
+
+
+def type_error(prompt: str) -> SchemaError:
+    return SchemaError('请求参数类型校验失败', prompt)
+
+
+def parse_json_value(value, type_):
+    # 字符串形式的列表、字典（通常来自URL参数或表单）
+    try:
+        value = json.loads(value)
+    except (ValueError, TypeError):
+        value = None
+    if type(value) != type_:
+        raise type_error('参数 {{path}} 应该符合 {0} 格式'.format(type_))
+    return value
+
+
+def compile_check(spec, null_value: bool, allow_extra: bool):
+    """
+    将字段声明编译为校验函数
+    :param spec: 类型、[元素类型]、嵌套字典声明、Field 或 Schema
+    :return: check(value, not_null) -> 转换后的值，校验失败时抛出 SchemaError
+    """
+    if isinstance(spec, Field):
+        field = spec
+    elif isinstance(spec, list):
+        if len(spec) != 1:
+            raise TypeError('列表声明只能包含一个元素类型: {0}'.format(spec))
+        field = Field(list, items=spec[0])
+    else:
+        field = Field(spec)
+    if field.null_value is not None:
+        null_value = field.null_value
+    type_ = field.type
+    if isinstance(type_, dict):
+        type_ = Schema(type_, null_value=null_value, allow_extra=allow_extra)
+    if isinstance(type_, Schema):
+        schema = type_
+
+        def check_type(value, not_null):
+            if type(value) != dict:
+                if type(value) != str:
+                    raise type_error('参数 {{path}} 应该是 {0} 类型'.format(dict))
+                value = parse_json_value(value, dict)
+            return schema.check(value, redundant=False)
+    elif type_ in (int, float):
+        def check_type(value, not_null):
+            if type(value) != type_:
+                # 特殊处理字符串形式的数字类型
+                try:
+                    value = type_(value)
+                except (ValueError, TypeError):
+                    raise type_error('参数 {{path}} 应该符合 {0} 格式'.format(type_))
+            return value
+    elif type_ == list:
+        item_check = compile_check(field.items, null_value, allow_extra) if field.items is not None else None
+
+        def check_type(value, not_null):
+            if type(value) != list:
+                if type(value) != str:
+                    raise type_error('参数 {{path}} 应该符合 {0} 格式'.format(list))
+                value = parse_json_value(value, list)
+            if item_check:
+                new_list = []
+                for i, item in enumerate(value):
+                    try:
+                        new_list.append(item_check(item, True))
+                    except SchemaError as err:
+                        err.path.insert(0, i)
+                        raise
+                value = new_list
+            return value
+    elif type_ == str:
+        def check_type(value, not_null):
+            if type(value) != str:
+                raise type_error('参数 {{path}} 应该是 {0} 类型'.format(str))
+            if not_null and not null_value and not value.strip():
+                raise type_error('参数 {path} 不能是空字符串')
+            return value
+    else:
+        def check_type(value, not_null):
+            if type(value) != type_:
+                raise type_error('参数 {{path}} 应该是 {0} 类型'.format(type_))
+            return value
+
+    if field.min is None and field.max is None and field.enum is None:
+        return check_type
+    sized = type_ in (str, list)
+    enum = tuple(field.enum) if field.enum is not None else None
+
+    def check(value, not_null):
+        value = check_type(value, not_null)
+        size = len(value) if sized else value
+        if field.min is not None and size < field.min:
+            raise type_error('参数 {{path}} {0}不能小于 {1}'.format('的长度' if sized else '', field.min))
+        if field.max is not None and size > field.max:
+            raise type_error('参数 {{path}} {0}不能大于 {1}'.format('的长度' if sized else '', field.max))
+        if enum is not None and value not in enum:
+            raise type_error('参数 {{path}} 应该是 {0} 之一'.format(field.enum))
+        return value
+
+    return check
+
+
+class Schema:
+    """
+    预先编译的参数校验规则，在模块加载时创建一次，每次请求只需要遍历一次参数字典
+      USER_SCHEMA = Schema({'name': str, 'age': Field(int, min=0), 'tags': [str], 'detail': {'city': str}}, optional={'age': 18})
+      param = parameter.verification(parameter.param_json, USER_SCHEMA)
+    """
+
+    def __init__(self, verify: dict, optional: dict = None, null_value: bool = False, allow_extra: bool = False):
+        """
+        :param verify: 校验内容字典，{参数名: 参数类型}，参数类型可以是 类型、[元素类型]、嵌套字典、Field 或 Schema
+        :param optional: 可选参数及其默认值
+        :param null_value: str 类型的必选参数是否允许为空字符串
+        :param allow_extra: 是否允许额外的参数，允许时额外参数收集在返回值的 redundant_dict 中
+        """
+        self.verify = verify
+        self.optional = dict(optional or {})
+        self.null_value = null_value
+        self.allow_extra = allow_extra
+        self.required = frozenset(verify.keys())
+        # {参数名: (校验函数, 是否不允许空字符串)}
+        self.checks = {
+            key: (compile_check(spec, null_value, allow_extra), key not in self.optional) for key, spec in verify.items()}
+        # 可变的默认值每次复制，避免不同请求共享同一个对象
+        self.defaults = [(key, value, isinstance(value, (list, dict, set))) for key, value in self.optional.items()]
+        self.prompt = {
+            'All Parameters': {key: str(spec) for key, spec in verify.items()},
+            'Optional': self.optional,
+        }
+
+    def check(self, checking: dict, redundant: bool = True) -> dict:
+        """
+        校验并转换参数字典（会修改传入的字典），失败时抛出 SchemaError
+        :param redundant: 允许额外参数时，是否在返回值中添加 redundant_dict（嵌套字典与批量校验时不添加）
+        """
+        for key, value, mutable in self.defaults:
+            if key not in checking:
+                checking[key] = copy.deepcopy(value) if mutable else value
+        if not self.required <= checking.keys():
+            raise SchemaError('请求参数不完整', self.prompt)
+        redundant_dict = {}
+        checks = self.checks
+        for key, value in checking.items():
+            item = checks.get(key, None)
+            if item is None:
+                if not self.allow_extra:
+                    err = SchemaError('有多余的请求参数', "'{path}'")
+                    err.path.append(key)
+                    raise err
+                redundant_dict[key] = value  # 收集多余的参数
+                continue
+            try:
+                new_value = item[0](value, item[1])
+            except SchemaError as err:
+                err.path.insert(0, key)
+                raise
+            if new_value is not value:
+                checking[key] = new_value
+        if self.allow_extra and redundant:
+            checking['redundant_dict'] = redundant_dict
+        return checking
+
+    def validate(self, checking: dict) -> dict:
+        """
+        校验参数字典，失败时直接返回异常响应（400）
+        :param checking: 需要校验的参数字典
+        :return: 转换后的参数字典，允许额外参数时包含 redundant_dict
+        """
+        if type(checking) != dict:
+            handle_abnormal(message='请求格式不规范', status=400)
+        try:
+            return self.check(checking)
+        except SchemaError as err:
+            handle_abnormal(message=err.message, status=400, other={'prompt': err.get_prompt()})
+
+    def validate_many(self, checking_list: list, max_errors: int = None) -> tuple:
+        """
+        批量校验记录列表，一次遍历完成，不合格的记录不会中断校验
+        额外参数直接保留在记录中（不添加 redundant_dict），合格的记录可以直接传给 write_many_docu()
+        :param checking_list: 需要校验的记录列表（会修改其中的字典）
+        :param max_errors: 错误数量达到该值时停止校验，默认校验全部记录
+        :return: (合格的记录列表, 错误列表 [{'index': 记录下标, 'message': 异常信息, 'prompt': 提示内容}, ...])
+        """
+        valid_list = []
+        error_list = []
+        check = self.check
+        for index, checking in enumerate(checking_list):
+            if type(checking) != dict:
+                error_list.append({'index': index, 'message': '请求格式不规范', 'prompt': None})
+            else:
+                try:
+                    valid_list.append(check(checking, redundant=False))
+                    continue
+                except SchemaError as err:
+                    error_list.append({'index': index, 'message': err.message, 'prompt': err.get_prompt()})
+            if max_errors and len(error_list) >= max_errors:
+                break
+        return valid_list, error_list
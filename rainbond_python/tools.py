@@ -1,10 +1,14 @@
-import logging
+import os
+import re
 import time
+import logging
 import json
 import socket
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pymongo.cursor import Cursor
+from pymongo.errors import ExecutionTimeout, WTimeoutError, ServerSelectionTimeoutError, AutoReconnect
 from bson.objectid import ObjectId
+from bson.datetime_ms import DatetimeMS
 from flask import abort, Response
 
 
@@ -13,18 +17,38 @@ logging.basicConfig(
     format='[%(asctime)s] [%(levelname)s] %(message)s'
 )
 
+FILTER_MODES = ('exact', 'prefix', 'text', 'regex')  # 字符串筛选的匹配方式
+TIMESTAMP_MISSING = ('now', 'none', 'zero')  # 文档缺少创建/更新时间时的处理方式：当前时间/null/0
+# 默认的缺失时间处理方式
+TIMESTAMP_MISSING_DEFAULT = os.environ.get('RAINBOND_TIMESTAMP_MISSING', 'now')
+# 无时区日期的解释方式：local（默认，与已有数据一致，按服务器本地时间写入和读取）/utc（pymongo 读写的约定，新部署可选）
+NAIVE_TIMEZONE = os.environ.get('RAINBOND_NAIVE_TIMEZONE', 'local')
+EPOCH = datetime(1970, 1, 1)
+EPOCH_AWARE = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MILLISECOND = timedelta(milliseconds=1)
+
 
 def handle_date(date: str, date_type='start') -> datetime:
+    """
+    将日期字符串或时间戳转换为查询条件使用的无时区日期，与 db_now() 写入的时间保持一致（默认为本地时间）
+    日期字符串按服务器本地时间的零点（或 23:59:59）解释
+    """
     try:
         if not date:
             date_data = None
         elif date.isdigit():
-            date_time = date[:10]
-            date_data = datetime.fromtimestamp(int(date_time))
+            date_time = int(date[:10])
+            if NAIVE_TIMEZONE == 'local':
+                date_data = datetime.fromtimestamp(date_time)
+            else:
+                date_data = datetime.fromtimestamp(date_time, timezone.utc).replace(tzinfo=None)
         else:
             date_data = datetime.strptime(date, "%Y-%m-%d")
             if date_type == 'end' and date_data:
                 date_data += timedelta(hours=23, minutes=59, seconds=59)
+            if NAIVE_TIMEZONE != 'local':
+                # 无时区日期的 astimezone() 按本地时间解释
+                date_data = date_data.astimezone(timezone.utc).replace(tzinfo=None)
         return date_data
     except Exception as err:
         handle_abnormal(
@@ -34,10 +58,11 @@ def handle_date(date: str, date_type='start') -> datetime:
         )
 
 
-def handle_db_to_list(db_cursor: Cursor) -> list:
+def handle_db_to_list(db_cursor: Cursor, missing: str = None) -> list:
     """
     将db列表数据，转换为list（原db的id是ObjectId类型，转为json会报错）
     :param db_cursor:db列表数据（find()获取）
+    :param missing:缺少时间字段时的处理方式（now/none/zero）
     :return:转换后的列表
     """
     if not isinstance(db_cursor, Cursor):
@@ -45,26 +70,31 @@ def handle_db_to_list(db_cursor: Cursor) -> list:
             message='类型必须是 %s (获取类型为 %s)' % (Cursor, type(db_cursor)),
             status=500,
         )
-    result = []
-    for db in db_cursor:
-        result.append(handle_db_dict(db_dict=db))
-    return result
+    return handle_db_list(list(db_cursor), missing=missing)
+
 
+def handle_db_dict(db_dict: dict, missing: str = None) -> dict:
+    return handle_db_list([db_dict], missing=missing)[0]
 
-def handle_db_dict(db_dict: dict) -> dict:
+
+def handle_db_list(docu_list: list, missing: str = None) -> list:
+    """
+    批量将数据库文档转换为响应格式：_id 转为字符串 id，创建时间和更新时间转为13位时间戳（会修改传入的文档）
+    :param docu_list: 数据库原始文档列表
+    :param missing: 缺少时间字段时的处理方式，详见 handle_timestamp_list()
+    :return: 转换后的文档列表
+    """
     try:
-        db_dict['id'] = str(db_dict['_id'])
-        del db_dict['_id']
-        # 创建时间和更新时间如果不存在，则设置为当前时间
-        db_dict['creation_time'] = db_dict.get(
-            'creation_time', datetime.today())
-        db_dict['update_time'] = db_dict.get('update_time', datetime.today())
-        # 将日期格式的时间，转化为13位时间戳
-        db_dict['creation_time'] = int(time.mktime(
-            db_dict['creation_time'].timetuple())) * 1000
-        db_dict['update_time'] = int(time.mktime(
-            db_dict['update_time'].timetuple())) * 1000
-        return db_dict
+        creation_list = handle_timestamp_list(
+            [docu.get('creation_time', None) for docu in docu_list], missing=missing)
+        update_list = handle_timestamp_list(
+            [docu.get('update_time', None) for docu in docu_list], missing=missing)
+        for docu, creation_time, update_time in zip(docu_list, creation_list, update_list):
+            docu['id'] = str(docu['_id'])
+            del docu['_id']
+            docu['creation_time'] = creation_time
+            docu['update_time'] = update_time
+        return docu_list
     except Exception as err:
         handle_abnormal(
             message='MongoDB 数据字典解析异常',
@@ -73,7 +103,120 @@ def handle_db_dict(db_dict: dict) -> dict:
         )
 
 
+def db_now() -> datetime:
+    """
+    写入数据库的当前时间，与 NAIVE_TIMEZONE 的解释方式保持一致（默认为无时区的本地时间）
+    """
+    if NAIVE_TIMEZONE == 'local':
+        return datetime.today()
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+local_offsets = {}  # 按小时缓存的本地时区偏移（秒），避免每个时间都调用 time.mktime()
+
+
+def handle_local_timestamp(value: datetime) -> int:
+    """
+    按本地时区将无时区日期转换为13位时间戳（舍弃毫秒），与旧版本的 time.mktime() 结果相同
+    """
+    seconds = (value.toordinal() - EPOCH.toordinal()) * 86400 + value.hour * 3600 + value.minute * 60 + value.second
+    hour = seconds // 3600
+    offset = local_offsets.get(hour, None)
+    if offset is None:
+        if len(local_offsets) > 4096:
+            local_offsets.clear()
+        start = value.replace(minute=0, second=0, microsecond=0)
+        offset_list = [
+            (hour + i) * 3600 - int(time.mktime((start + timedelta(hours=i)).timetuple())) for i in (-1, 0, 1)]
+        # 前后一小时的偏移不同说明处于夏令时切换附近，该小时不使用缓存
+        offset = offset_list[1] if len(set(offset_list)) == 1 else False
+        local_offsets[hour] = offset
+    if offset is False:
+        return int(time.mktime(value.timetuple())) * 1000
+    return (seconds - offset) * 1000
+
+
+def handle_timestamp(value: datetime, missing_value=None):
+    """
+    将日期转换为13位时间戳（毫秒），无时区的日期按 NAIVE_TIMEZONE 解释，带时区的日期按其时区转换
+    使用 DatetimeConversion.DATETIME_MS 读取的 DatetimeMS 已经是 UTC 毫秒数，直接返回
+    """
+    if value is None:
+        return missing_value
+    if isinstance(value, DatetimeMS):
+        return int(value)
+    if value.tzinfo is not None:
+        return (value - EPOCH_AWARE) // MILLISECOND
+    if NAIVE_TIMEZONE == 'local':
+        return handle_local_timestamp(value) + value.microsecond // 1000
+    return (value - EPOCH) // MILLISECOND
+
+
+def handle_timestamp_list(value_list: list, missing: str = None) -> list:
+    """
+    批量将日期转换为13位时间戳（毫秒）
+    :param value_list: 日期列表，元素可以为 None
+    :param missing: 日期为 None 时的处理方式，默认为 TIMESTAMP_MISSING_DEFAULT
+      now: 使用当前时间（同一批次使用同一个时间）
+      none: 返回 None
+      zero: 返回 0
+    :return: 时间戳列表
+    """
+    missing = missing or TIMESTAMP_MISSING_DEFAULT
+    if missing not in TIMESTAMP_MISSING:
+        handle_abnormal(
+            message='缺失时间的处理方式必须是 {0} 之一'.format(TIMESTAMP_MISSING),
+            status=500,
+        )
+    missing_value = None
+    if missing == 'now' and None in value_list:
+        missing_value = handle_timestamp(db_now())
+    elif missing == 'zero':
+        missing_value = 0
+    return [handle_timestamp(value, missing_value) for value in value_list]
+
+
+def handle_json_stream(docu_iter, json_array: bool = False, chunk_size: int = 64 * 1024) -> Response:
+    """
+    将文档迭代器转换为流式响应，逐块编码发送，内存占用与数据量无关
+    :param docu_iter: 文档迭代器（通常来自 DBConnect.iter_docu()）
+    :param json_array: 是否输出 JSON 数组，默认输出 NDJSON（每行一个文档）
+    :param chunk_size: 每次发送的最小字节数，避免逐条发送过多的小数据块
+    :return: Flask Response
+    """
+    def generate():
+        buffer = []
+        size = 0
+        first = True
+        if json_array:
+            buffer.append('[')
+        for docu in docu_iter:
+            line = json.dumps(docu, ensure_ascii=False, default=str)
+            if json_array:
+                line = line if first else ',' + line
+            else:
+                line += '\n'
+            first = False
+            buffer.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+        if json_array:
+            buffer.append(']')
+        if buffer:
+            yield ''.join(buffer)
+
+    if json_array:
+        return Response(generate(), content_type='application/json; charset=utf-8')
+    return Response(generate(), content_type='application/x-ndjson; charset=utf-8')
+
+
 def handle_db_id(data_dict: dict) -> dict:
+    """
+    将 id/_id 处理成符合mongo格式的 ObjectId，不修改传入的字典，需要处理时返回新的顶层字典
+    """
     if not isinstance(data_dict, dict):
         handle_abnormal(
             message='类型错误，预期 %s ,却得到 %s' % (dict, type(id)),
@@ -81,23 +224,28 @@ def handle_db_id(data_dict: dict) -> dict:
         )
     try:
         if data_dict.__contains__('_id') and isinstance(data_dict['_id'], str):
+            data_dict = dict(data_dict)
             data_dict['_id'] = ObjectId(str(data_dict['_id']))
         elif data_dict.__contains__('id'):
-            if isinstance(data_dict['id'], str):
-                data_dict['_id'] = ObjectId(str(data_dict['id']))
+            data_dict = dict(data_dict)
+            id_value = data_dict.pop('id')
+            if isinstance(id_value, str):
+                data_dict['_id'] = ObjectId(str(id_value))
             else:
-                data_dict['_id'] = data_dict['id']
-            del data_dict['id']
+                data_dict['_id'] = id_value
         # 处理批量操作时，字符串类型ID问题
         # 判断存在_id，并且值为字典则做特殊处理
         if data_dict.__contains__('_id') and isinstance(data_dict['_id'], dict):
+            id_query = {}
             for key, value in data_dict['_id'].items():
                 if isinstance(value, list):  # 查找ID是列表
-                    for i in range(len(value)):
-                        if isinstance(value[i], str):  # 是字符串
-                            data_dict['_id'][key][i] = ObjectId(str(value[i]))
+                    id_query[key] = [ObjectId(str(item)) if isinstance(item, str) else item for item in value]
                 elif isinstance(value, str):       # 支持mongo的高级查询 {'_id': {'$ne': ObjectId('60867c4b78254307721d4617')}}
-                    data_dict['_id'][key] = ObjectId(str(value))
+                    id_query[key] = ObjectId(str(value))
+                else:
+                    id_query[key] = value
+            data_dict = dict(data_dict)
+            data_dict['_id'] = id_query
         return data_dict
     except Exception as err:
         handle_abnormal(
@@ -107,11 +255,117 @@ def handle_db_id(data_dict: dict) -> dict:
         )
 
 
+def handle_db_docu(docu: dict, now: datetime = None) -> dict:
+    """
+    规范化待写入的文档：处理id，补充创建时间和更新时间
+    只复制顶层字典（写入时驱动会向文档添加_id），不修改也不深拷贝传入的文档
+    :param docu: 待写入的文档
+    :param now: 补充的时间，默认为当前时间
+    :return: 新的文档字典，嵌套的值与传入的文档共享
+    """
+    new_docu = handle_db_id(docu)
+    if new_docu is docu:
+        new_docu = dict(docu)
+    # 添加创建时间和更新时间，日期格式
+    if not new_docu.__contains__('creation_time') or not new_docu.__contains__('update_time'):
+        now = now or db_now()
+        new_docu.setdefault('creation_time', now)
+        new_docu.setdefault('update_time', now)
+    return new_docu
+
+
+def handle_group_pipeline(field: str, find_dict: dict = None, unwind: bool = True) -> list:
+    """
+    生成按字段分组的聚合管道前缀：$match（排除假删除数据）+ $unwind + $group
+    :param field: 分组字段，支持 `a.b` 形式的嵌套字段
+    :param find_dict: 可选的查询条件
+    :param unwind: 是否展开数组字段，按数组元素分组（与 distinct() 相同）
+    :return: 聚合管道列表，分组结果的 _id 为字段值（包括 null），count 为文档数
+    """
+    if not isinstance(field, str) or not field or field.startswith('$'):
+        handle_abnormal(
+            message='分组字段必须是非空字符串，却得到 {0}'.format(field),
+            status=400,
+        )
+    match_dict = handle_db_remove(handle_db_id(find_dict or {}))
+    if field not in match_dict:
+        # 与 distinct() 相同，不统计缺少该字段的文档，展开时也不统计空数组
+        match_dict = dict(match_dict)
+        match_dict[field] = {'$exists': True, '$ne': []} if unwind else {'$exists': True}
+    pipeline = [{'$match': match_dict}]
+    if unwind:
+        # 保留值为 null 的文档，与 distinct() 相同统计 null 值
+        pipeline.append({'$unwind': {'path': '$' + field, 'preserveNullAndEmptyArrays': True}})
+    pipeline.append({'$group': {'_id': '$' + field, 'count': {'$sum': 1}}})
+    return pipeline
+
+
+def handle_db_projection(projection, extra_fields: list = None) -> dict:
+    """
+    处理字段投影，保证 handle_db_dict 需要的 _id、creation_time、update_time 字段始终被获取
+    :param projection: 字段名称列表（Eg: ['name', 'age']）或投影字典（Eg: {'detail': 0}），为空时返回 None 即获取全部字段
+    :param extra_fields: 包含型投影时额外需要获取的字段（Eg: 游标分页的排序字段）
+    :return: 符合 mongo 格式的投影字典
+    """
+    if not projection:
+        return None
+    try:
+        if isinstance(projection, (list, tuple, set)):
+            projection = {field: 1 for field in projection}
+        elif isinstance(projection, dict):
+            projection = dict(projection)
+        else:
+            raise TypeError('投影参数必须是列表或字典，却得到 {0}'.format(type(projection)))
+        if 'id' in projection:
+            projection['_id'] = projection.pop('id')
+        required_fields = ['_id', 'creation_time', 'update_time'] + (extra_fields or [])
+        # 不允许排除必须的字段
+        for field in required_fields:
+            if field in projection and not projection[field]:
+                del projection[field]
+        if any(projection.values()):
+            # 包含型投影，补充必须的字段（_id 默认返回）
+            for field in required_fields[1:]:
+                projection[field] = 1
+            projection.pop('_id', None)
+        if not projection:
+            return None
+        return projection
+    except Exception as err:
+        handle_abnormal(
+            message='MongoDB 字段投影格式解析异常',
+            status=400,
+            other={'prompt': str(err)}
+        )
+
+
+def handle_text_filter(value: str, mode: str = 'regex') -> dict:
+    """
+    根据匹配方式生成字符串筛选条件
+    :param value: 筛选值
+    :param mode: 匹配方式
+      exact: 精确匹配，可以使用索引
+      prefix: 前缀匹配（区分大小写），可以使用索引范围扫描
+      regex: 包含匹配，正则特殊字符全部转义，无法使用索引
+    :return: 字段的筛选条件
+    """
+    if mode == 'exact':
+        return value
+    elif mode == 'prefix':
+        return {'$regex': '^' + re.escape(value)}
+    elif mode == 'regex':
+        return {'$regex': re.escape(value)}
+    handle_abnormal(
+        message='筛选匹配方式必须是 {0} 之一'.format(FILTER_MODES),
+        status=500,
+    )
+
+
 def handle_db_remove(find_dict: dict) -> dict:
     try:
         if not find_dict.__contains__('remove_time'):
-            # 设置搜索条件为不存在remove_time字段的文件
-            find_dict['remove_time'] = {'$exists': False}
+            # 设置搜索条件为不存在remove_time字段的文件，返回新的顶层字典，不修改传入的字典
+            return dict(find_dict, remove_time={'$exists': False})
         # 返回设置后的搜索条件
         return find_dict
     except Exception as err:
@@ -140,6 +394,17 @@ def handle_abnormal(message: str, status: int, header: dict = {'Content-Type': '
         abort(Response(json.dumps(return_body), status, header))
 
 
+def handle_db_error(err: Exception, message: str, status: int = 500):
+    """
+    按数据库异常类型返回异常响应：执行超时（maxTimeMS、写关注超时）为 504，无法连接数据库为 503，其他异常使用传入的信息和状态码
+    """
+    if isinstance(err, (ExecutionTimeout, WTimeoutError)):
+        handle_abnormal(message='MongoDB(组件)执行超时', status=504, other={'prompt': str(err)})
+    if isinstance(err, (ServerSelectionTimeoutError, AutoReconnect)):
+        handle_abnormal(message='MongoDB(组件)暂时无法连接', status=503, other={'prompt': str(err)})
+    handle_abnormal(message=message, status=status, other={'prompt': str(err)})
+
+
 def handle_time_difference(start_timestamp: int, end_timestamp: int) -> float:
     if len(str(start_timestamp)) == 13:
         start_date = datetime.fromtimestamp(start_timestamp/1000)
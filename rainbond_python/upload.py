@@ -0,0 +1,230 @@
+import os
+import uuid
+import hashlib
+import logging
+from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from .tools import handle_abnormal
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='[%(asctime)s] [%(levelname)s] %(message)s'
+)
+
+CHUNK_SIZE = 64 * 1024  # 每次从请求体读取的字节数
+MAX_FORM_MEMORY_SIZE = 500 * 1024  # 普通表单字段的最大字节数
+
+
+class DirectoryWriter:
+    """
+    写入本地文件，先写入临时的 .part 文件，完成后再重命名，中断时删除
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.part_path = path + '.part'
+        self.file = open(self.part_path, 'wb')
+
+    def write(self, data: bytes):
+        self.file.write(data)
+
+    def close(self) -> dict:
+        self.file.close()
+        os.replace(self.part_path, self.path)
+        return {'path': self.path}
+
+    def abort(self):
+        self.file.close()
+        for path in (self.part_path, self.path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class DirectorySink:
+    """
+    上传文件的写入目标：保存到本地目录
+    自定义写入目标（Eg: 对象存储）只需要实现 sink(field, filename) 返回带有 write(data)、close() -> dict、abort() 方法的对象
+    """
+
+    def __init__(self, directory: str, name_func=None):
+        """
+        :param directory: 保存目录，不存在时自动创建
+        :param name_func: 生成保存文件名的函数 name_func(field, filename)，默认为 随机名称+原后缀
+        """
+        self.directory = directory
+        self.name_func = name_func
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, field: str, filename: str) -> DirectoryWriter:
+        if self.name_func:
+            name = secure_filename(self.name_func(field, filename))
+        else:
+            suffix = secure_filename(filename).rsplit('.', 1)
+            name = uuid.uuid4().hex + ('.' + suffix[1] if len(suffix) == 2 else '')
+        return DirectoryWriter(os.path.join(self.directory, name))
+
+
+def get_rule(value, field: str):
+    # 参数可以是对全部字段生效的值，也可以是 {字段: 值} 字典
+    if isinstance(value, dict):
+        return value.get(field, None)
+    return value
+
+
+class UploadFile:
+    """
+    正在接收的单个上传文件：校验后缀、文件头和大小，计算校验和并写入目标
+    """
+
+    def __init__(self, field: str, filename: str, sink, max_size: int = None, suffix: list = None, magic: list = None, checksum: str = 'sha256'):
+        self.field = field
+        self.filename = filename
+        self.max_size = max_size
+        self.magic = [bytes(prefix) for prefix in magic] if magic else None
+        self.magic_size = max(len(prefix) for prefix in self.magic) if self.magic else 0
+        if suffix and filename.split('.')[-1] not in suffix:
+            handle_abnormal(
+                message='文件字段 {0} 仅支持 {1} 后缀'.format(field, suffix),
+                status=400,
+            )
+        self.hash = hashlib.new(checksum)
+        self.checksum = checksum
+        self.size = 0
+        self.head = b''  # 校验文件头之前暂存的数据
+        self.writer = sink(field, filename)
+
+    def check_magic(self):
+        if not any(self.head.startswith(prefix) for prefix in self.magic):
+            handle_abnormal(
+                message='文件字段 {0} 的文件内容与类型不符'.format(self.field),
+                status=400,
+            )
+        self.magic = None
+        self.writer.write(self.head)
+        self.head = b''
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            handle_abnormal(
+                message='请求内容过大',
+                status=413,
+                other={'prompt': '文件字段 {0} 不能超过 {1} 字节'.format(self.field, self.max_size)}
+            )
+        self.hash.update(data)
+        if self.magic:
+            self.head += data
+            if len(self.head) >= self.magic_size:
+                self.check_magic()
+            return
+        self.writer.write(data)
+
+    def close(self) -> dict:
+        if self.magic:
+            # 文件小于文件头长度
+            self.check_magic()
+        result = {
+            'field': self.field,
+            'filename': self.filename,
+            'size': self.size,
+            self.checksum: self.hash.hexdigest(),
+        }
+        result.update(self.writer.close() or {})
+        return result
+
+
+def stream_upload(stream, boundary: bytes, sink, verify_field: list = None, verify_suffix: list = None, max_size=None, magic=None, checksum: str = 'sha256', chunk_size: int = CHUNK_SIZE, max_form_memory_size: int = MAX_FORM_MEMORY_SIZE, multiple: list = None) -> dict:
+    """
+    增量解析 multipart 请求体，边接收边校验并写入，内存占用与文件大小无关
+    :param stream: 请求体数据流
+    :param boundary: multipart 分隔符
+    :param sink: 写入目标 sink(field, filename)，详见 DirectorySink
+    :param verify_field: 必须存在的文件字段
+    :param verify_suffix: 与 verify_field 对应的允许的后缀名（字符串或列表）
+    :param max_size: 单个文件的最大字节数，或 {字段: 最大字节数}
+    :param magic: 允许的文件头字节串列表（Eg: [b'\\x89PNG']），或 {字段: 文件头列表}
+    :param checksum: 校验和算法（hashlib 支持的名称）
+    :param multiple: 允许上传多个文件的字段（Eg: <input multiple>），这些字段的结果为列表；其他字段重复时返回 400 异常
+    :return: {'files': {字段: {'field', 'filename', 'size', 校验和算法: 校验和, 'path'...} 或 [...]}, 'form': {字段: 值}}
+    """
+    verify_field = verify_field or []
+    multiple = multiple or []
+    verify_suffix = verify_suffix or []
+    if verify_suffix and len(verify_suffix) != len(verify_field):
+        handle_abnormal(
+            message='参数 verify_field 与 verify_suffix 的长度不一致',
+            status=500,
+        )
+    suffix_dict = {}
+    for field, suffix in zip(verify_field, verify_suffix):
+        suffix_dict[field] = suffix if isinstance(suffix, list) else [suffix]
+    decoder = MultipartDecoder(boundary, max_form_memory_size=max_form_memory_size)
+    files = {field: [] for field in multiple}
+    form = {}
+    finished = []  # 已完成的文件，后续校验失败时一并删除
+    current = None  # 正在接收的文件
+    field_name = None  # 正在接收的普通表单字段
+    field_data = []
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    current = None
+                    field_name = None
+                    if event.filename:
+                        # 未选择文件时浏览器会提交空文件名，视为没有该字段
+                        if event.name in files and event.name not in multiple:
+                            handle_abnormal(
+                                message='文件字段 {0} 只能上传一个文件'.format(event.name),
+                                status=400,
+                            )
+                        current = UploadFile(
+                            event.name, event.filename, sink, max_size=get_rule(max_size, event.name),
+                            suffix=suffix_dict.get(event.name, None), magic=get_rule(magic, event.name), checksum=checksum)
+                elif isinstance(event, Field):
+                    field_name = event.name
+                    field_data = []
+                elif isinstance(event, Data):
+                    if current is not None:
+                        current.write(event.data)
+                        if not event.more_data:
+                            if current.field in multiple:
+                                files[current.field].append(current.close())
+                            else:
+                                files[current.field] = current.close()
+                            finished.append(current)
+                            current = None
+                    elif field_name is not None:
+                        field_data.append(event.data)
+                        if not event.more_data:
+                            form[field_name] = b''.join(field_data).decode('utf-8', 'replace')
+                            field_name = None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue):
+                break
+            if not chunk:
+                raise ValueError('请求体不完整')
+        missing_list = [field for field in verify_field if not files.get(field, None)]
+        if missing_list:
+            handle_abnormal(
+                message='表单文件参数不完整',
+                status=400,
+                other={'prompt': verify_field}
+            )
+    except BaseException as err:
+        for upload_file in finished + ([current] if current else []):
+            try:
+                upload_file.writer.abort()
+            except Exception as abort_err:
+                logging.warning('上传文件 {0} 清理异常: {1}'.format(upload_file.filename, abort_err))
+        if isinstance(err, RequestEntityTooLarge):
+            handle_abnormal(message='请求内容过大', status=413, other={'prompt': '普通表单字段过大'})
+        if isinstance(err, ValueError):
+            # 请求体格式错误、表单字段过大等解析异常
+            handle_abnormal(message='表单请求解析异常', status=400, other={'prompt': str(err)})
+        raise
+    return {'files': files, 'form': form}
@@ -129,9 +129,9 @@ class VerifyToken:
         if self.mongo_db_name and self.mongo_permission:
             # 添加权限中心/名称到权限管理
             try:
+                db = DBConnect(db=self.mongo_db_name,
+                               collection=self.mongo_permission)
                 for per in per_defaults:
-                    db = DBConnect(db=self.mongo_db_name,
-                                   collection=self.mongo_permission)
                     # 查询是否已存在
                     find_dict = {'center_name': str(per['center_name']),
                                  'permission_name': str(per['permission_name'])}
@@ -237,4 +237,4 @@ class VerifyToken:
         if not is_all_data:
             auth_filter.update({user_field_name: user_name})
 
-        return auth_filter
\ No newline at end of file
+        return auth_filter
\ No newline at end of file
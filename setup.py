@@ -25,6 +25,10 @@ setuptools.setup(
         'redis',
         'itsdangerous==2.0.1',
     ],
+    extras_require={
+        'async': ['motor'],
+        'fast': ['orjson'],
+    },
     keywords='rainbond python cloud native',
     entry_points={
         'console_scripts': [
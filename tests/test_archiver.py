@@ -0,0 +1,25 @@
+from datetime import timedelta
+from rainbond_python.db_connect import DBConnect
+from rainbond_python.tools import db_now
+
+
+def test_soft_delete_archiver():
+    db = DBConnect('unitest_rainbond_python', 'test_archiver')
+    archive = db.mongo_db['test_archiver_archive']
+    db.mongo_collection.delete_many({})
+    archive.delete_many({})
+    db.write_many_docu([{'age': age} for age in range(5)])
+    db.mongo_collection.update_many({'age': {'$lt': 3}}, {'$set': {'remove_time': db_now() - timedelta(days=40)}})
+    db.delete_docu({'age': 3}, false_delete=True)
+    stats = db.archiver(archive_after=30, batch_size=2, max_batches=1).run()
+    assert stats['archived'] == 2
+    assert stats['archive_pending'] == 1
+    assert 'remove_time_partial' in db.mongo_collection.index_information()
+    stats = db.archiver(archive_after=30, batch_size=2).run()
+    assert stats['archived'] == 1
+    assert archive.count_documents({'archive_time': {'$exists': True}}) == 3
+    assert db.mongo_collection.count_documents({}) == 2
+    archive.update_many({}, {'$set': {'archive_time': db_now() - timedelta(days=200)}})
+    stats = db.archiver(archive_after=30, purge_after=180, batch_size=2).run()
+    assert stats['purged'] == 3
+    assert archive.count_documents({}) == 0
@@ -0,0 +1,46 @@
+import json
+import asyncio
+import pytest
+from flask import Flask, request
+from pymongo.errors import ExecutionTimeout
+from werkzeug.exceptions import HTTPException
+from rainbond_python.parameter import Parameter
+
+mongomock_motor = pytest.importorskip('mongomock_motor')
+from rainbond_python.async_db_connect import AsyncDBConnect
+
+
+def test_async_db_connect():
+    async def run():
+        db = AsyncDBConnect(db='test', collection='test', client=mongomock_motor.AsyncMongoMockClient())
+        id_list = await db.write_many_docu([{'age': age} for age in range(5)])
+        assert await db.does_it_exist({'age': 3})
+        assert (await db.find_docu_by_id(id_list[1]))['age'] == 1
+        assert [docu['age'] for docu in await db.find_docu_by_id_list(id_list[::-1], chunk_size=2)] == [4, 3, 2, 1, 0]
+        assert (await db.delete_docu({'age': 0}, false_delete=True))['deleted_count'] == 1
+        assert [docu['age'] async for docu in db.iter_docu({}, sort_list=[('age', -1)])] == [4, 3, 2, 1]
+        assert await db.find_docu_distinct('age') == 4
+        assert await db.group_counts('age', limit=1) == [{'value': 1, 'count': 1}]
+        app = Flask(__name__)
+        with app.test_request_context('/?$limit=2&$orderby=age desc'):
+            result = await db.find_paging(Parameter(request))
+        assert result['total'] == 4
+        assert result['dummy_remove'] == 1
+        assert [docu['age'] for docu in result['items']] == [4, 3]
+        with app.test_request_context('/?$limit=2&$orderby=age desc'):
+            parameter = Parameter(request)
+            assert await db.find_paging(parameter, facet=True) == result
+            cached = await db.find_paging(parameter, count='cached')
+            assert (cached['total'], cached['total_strategy']) == (4, 'cached')
+            assert json.loads(await db.find_paging(parameter, as_json=True))['total'] == 4
+            with pytest.raises(HTTPException) as exc_info:
+                await db.find_paging(parameter, count='unknown')
+            assert exc_info.value.response.status_code == 400
+
+            async def timeout(*args, **kwargs):
+                raise ExecutionTimeout('operation exceeded time limit')
+            db.mongo_collection.count_documents = timeout
+            with pytest.raises(HTTPException) as exc_info:
+                await db.find_paging(parameter)
+            assert exc_info.value.response.status_code == 504
+    asyncio.run(run())
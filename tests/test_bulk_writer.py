@@ -0,0 +1,21 @@
+from rainbond_python.db_connect import DBConnect
+
+
+def test_bulk_writer():
+    db = DBConnect('unitest_rainbond_python', 'test_bulk_writer')
+    db.mongo_collection.delete_many({})
+    with db.bulk_writer(batch_size=2) as writer:
+        writer.insert({'name': 'LaoXu', 'age': 28})
+        writer.insert({'_id': '600535c49495e1c2bec76356', 'name': 'LaoHe', 'age': 18})
+        writer.insert({'_id': '600535c49495e1c2bec76356', 'name': 'LaoHe', 'age': 18})
+        writer.update({'name': 'LaoXu'}, {'age': 29})
+        writer.upsert({'name': 'LaoYang'}, {'age': 35})
+        writer.soft_delete({'name': 'LaoHe'})
+    assert writer.stats['batches'] == 3
+    assert writer.stats['inserted_count'] == 2
+    assert writer.stats['upserted_count'] == 1
+    errors = [error for report in writer.reports for error in report['errors']]
+    assert [(error['index'], error['op']) for error in errors] == [(2, 'insert')]
+    assert db.find_docu({'name': 'LaoXu'})[0]['age'] == 29
+    assert db.find_docu({'name': 'LaoHe'}) == []
+    assert db.find_docu({'name': 'LaoYang'})[0]['creation_time']
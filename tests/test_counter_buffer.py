@@ -0,0 +1,92 @@
+import pytest
+from pymongo.errors import BulkWriteError
+from rainbond_python.counter_buffer import CounterBuffer
+
+
+class FakeResult:
+    modified_count = 1
+
+
+class FakeCollection:
+    full_name = 'unitest.test_counter_buffer'
+
+    def __init__(self):
+        self.requests = []
+        self.fail = False
+        self.write_errors = None
+
+    def bulk_write(self, requests, ordered=True):
+        if self.fail:
+            raise Exception('network error')
+        if self.write_errors:
+            write_errors, self.write_errors = self.write_errors, None
+            raise BulkWriteError({'nModified': 0, 'writeErrors': write_errors})
+        self.requests.extend(requests)
+        return FakeResult()
+
+
+class FakeDB:
+    def __init__(self):
+        self.mongo_collection = FakeCollection()
+
+    def invalidate_cache(self):
+        pass
+
+
+def test_counter_buffer():
+    db = FakeDB()
+    counter = CounterBuffer(db, flush_interval=60, touch_update_time=False)
+    for _ in range(3):
+        counter.incr({'id': '600535c49495e1c2bec76356'}, {'views': 1, 'score': 0.5})
+    counter.incr({'name': 'LaoXu'}, {'views': 2}, many=True)
+    db.mongo_collection.fail = True
+    assert counter.flush()['errors'] == 2
+    db.mongo_collection.fail = False
+    counter.close()
+    updates = sorted([(type(request).__name__, request._doc) for request in db.mongo_collection.requests], key=str)
+    assert updates == [
+        ('UpdateMany', {'$inc': {'views': 2}}),
+        ('UpdateOne', {'$inc': {'views': 3, 'score': 1.5}}),
+    ]
+    assert counter.stats['increments'] == 4
+
+
+def test_counter_buffer_write_errors():
+    db = FakeDB()
+    counter = CounterBuffer(db, flush_interval=60, touch_update_time=False)
+    counter.incr({'name': 'LaoXu'}, {'views': 1})
+    counter.incr({'name': 'LaoHe'}, {'views': 1})
+    db.mongo_collection.write_errors = [
+        {'index': 0, 'code': 14, 'errmsg': 'Cannot apply $inc to a value of non-numeric type'},
+        {'index': 1, 'code': 91, 'errmsg': 'The server is in quiesce mode and will shut down'},
+    ]
+    report = counter.flush()
+    assert (report['errors'], report['dropped']) == (1, 1)
+    counter.close()
+    assert [request._filter['name'] for request in db.mongo_collection.requests] == ['LaoHe']
+    assert counter.stats['dropped_count'] == 1 and counter.stats['error_count'] == 1
+
+
+class FakeRedisConnect:
+    def __init__(self):
+        fakeredis = pytest.importorskip('fakeredis')
+        self.client = fakeredis.FakeStrictRedis(decode_responses=True)
+
+    def connect(self):
+        return self.client
+
+
+def test_counter_buffer_redis():
+    db = FakeDB()
+    redis_connect = FakeRedisConnect()
+    counter = CounterBuffer(db, redis_connect=redis_connect, flush_interval=60, touch_update_time=False)
+    counter.incr({'name': 'LaoXu'}, {'score': 0.5})
+    counter.incr({'name': 'LaoXu'}, {'score': 1, 'views': 2})
+    counter.incr({'name': 'LaoXu'}, {'views': 1})
+    db.mongo_collection.fail = True
+    assert counter.flush()['errors'] == 1
+    db.mongo_collection.fail = False
+    counter.close()
+    assert [request._doc for request in db.mongo_collection.requests] == [{'$inc': {'score': 1.5, 'views': 3}}]
+    assert isinstance(db.mongo_collection.requests[0]._doc['$inc']['views'], int)
+    assert redis_connect.client.hgetall(counter.redis_key) == {}
@@ -1,5 +1,7 @@
 import pytest
+from flask import Flask, request
 from rainbond_python.db_connect import DBConnect
+from rainbond_python.parameter import Parameter
 from werkzeug.exceptions import HTTPException
 
 
@@ -41,3 +43,49 @@ def test_find_docu_by_id_list():
     assert len(docu_list) > 0
     assert isinstance(docu_list[0], dict)
     assert isinstance(docu_list[0]['id'], str)
+    id_list.reverse()
+    missing_id = '6008daa19223551b00548ded'
+    docu_list = db.find_docu_by_id_list(id_list + [missing_id, id_list[0]], missing='none', chunk_size=2)
+    assert [docu['id'] for docu in docu_list[:-1]] == id_list
+    assert docu_list[-1] is None
+
+
+def test_find_paging_facet():
+    db = DBConnect('unitest_rainbond_python', 'test_find_paging')
+    db.write_one_docu({'name': 'LaoXu', 'age': 28})
+    db.write_one_docu({'name': 'LaoHe', 'age': 18})
+    app = Flask(__name__)
+    with app.test_request_context('/?$limit=1&$orderby=age asc&name=Lao'):
+        parameter = Parameter(request)
+        find_data = db.find_paging(parameter)
+        facet_data = db.find_paging(parameter, facet=True)
+    assert find_data == facet_data
+    assert len(facet_data['items']) == 1
+
+
+def test_group_counts():
+    db = DBConnect('unitest_rainbond_python', 'test_group_counts')
+    db.mongo_collection.delete_many({})
+    db.write_many_docu([{'age': age % 3, 'tags': ['a', 'b'] if age % 2 else ['a']} for age in range(6)])
+    db.delete_docu({'age': 2}, many=True, false_delete=True)
+    assert db.find_docu_distinct('age') == 2
+    assert db.find_docu_distinct('tags') == 2
+    assert db.find_docu_distinct('tags', unwind=False) == 2
+    assert db.distinct_values('age') == [0, 1]
+    assert db.group_counts('tags', limit=1) == [{'value': 'a', 'count': 4}]
+    db.write_many_docu([{'age': None, 'tags': []}, {'tags': [None]}])
+    assert db.find_docu_distinct('age') == len(db.mongo_collection.distinct('age', {'remove_time': {'$exists': False}})) == 3
+    assert db.find_docu_distinct('tags') == len(db.mongo_collection.distinct('tags', {'remove_time': {'$exists': False}})) == 3
+    assert None in db.distinct_values('age')
+
+
+def test_count_docu():
+    db = DBConnect('unitest_rainbond_python', 'test_find_paging')
+    db.write_one_docu({'name': 'LaoXu', 'age': 28})
+    db.write_one_docu({'name': 'LaoHe', 'age': 18})
+    find_dict = {'remove_time': {'$exists': False}}
+    exact, strategy = db.count_docu(find_dict)
+    assert strategy == 'exact'
+    assert db.count_docu(find_dict, count='cached') == (exact, 'cached')
+    assert db.count_docu(find_dict, count='capped', count_cap=1) == ('1+', 'capped')
+    assert db.count_docu({'age': 18}, count='estimated')[1] == 'exact'
@@ -0,0 +1,32 @@
+import pymongo
+from rainbond_python.index_advisor import handle_index_spec, suggest_index, analyze_explain
+
+
+def test_handle_index_spec():
+    assert handle_index_spec('name') == ([('name', 1)], {})
+    keys, options = handle_index_spec({'keys': [('name', 1)], 'soft_delete': True, 'unique': True})
+    assert keys == [('name', 1), ('remove_time', 1)]
+    assert options == {'unique': True}
+
+
+def test_suggest_index():
+    find_dict = {
+        'remove_time': {'$exists': False}, 'name': 'LaoXu',
+        'update_time': {'$gte': 1, '$lte': 2}, '$or': [{'age': 1}],
+    }
+    keys = suggest_index(find_dict, [('age', pymongo.DESCENDING)])
+    assert keys == [('name', 1), ('age', -1), ('remove_time', 1), ('update_time', 1)]
+
+
+def test_analyze_explain():
+    explain = {
+        'queryPlanner': {'winningPlan': {'stage': 'LIMIT', 'inputStage': {'stage': 'COLLSCAN'}}},
+        'executionStats': {'totalDocsExamined': 1000, 'nReturned': 10, 'totalKeysExamined': 0},
+    }
+    report = analyze_explain(explain, {'name': 'LaoXu'})
+    assert report['collscan'] and report['slow']
+    assert report['ratio'] == 100
+    assert report['suggest_index'] == [('name', 1)]
+    explain['queryPlanner']['winningPlan']['inputStage'] = {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}
+    explain['executionStats']['totalDocsExamined'] = 10
+    assert not analyze_explain(explain, {'name': 'LaoXu'})['slow']
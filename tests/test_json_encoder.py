@@ -0,0 +1,26 @@
+import json
+from datetime import datetime
+from bson.objectid import ObjectId
+from flask import Flask, jsonify
+from rainbond_python.tools import handle_db_dict
+from rainbond_python.json_encoder import dumps_json, handle_db_json_list, handle_json_response, set_json_encoder, stdlib_encoder
+
+
+def test_handle_db_json_list():
+    app = Flask(__name__)
+    docu = {'_id': ObjectId(), 'name': '小明', 'when': datetime(2020, 1, 2), 'creation_time': datetime(2021, 5, 6), 'update_time': datetime(2021, 5, 7)}
+    with app.app_context():
+        old = json.loads(jsonify([handle_db_dict(dict(docu))]).get_data())
+        for encoder in [None, stdlib_encoder]:
+            set_json_encoder(encoder)
+            assert json.loads(dumps_json(handle_db_json_list([docu]))) == old
+    set_json_encoder()
+    assert '_id' in docu
+
+
+def test_handle_json_response():
+    app = Flask(__name__)
+    with app.app_context():
+        response = handle_json_response({'b': 1, 'a': ObjectId('600535c49495e1c2bec76356')})
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.get_data()) == {'a': '600535c49495e1c2bec76356', 'b': 1}
@@ -0,0 +1,65 @@
+from flask import Flask
+from rainbond_python.loader import DocuLoader, get_request_loader, clear_request_loaders
+
+
+class FakeDB:
+    def __init__(self):
+        self.calls = []
+
+    def find_docu_by_id_list(self, id_list, projection=None, chunk_size=1000, missing='ignore', dedupe=True):
+        self.calls.append(list(id_list))
+        # 与 ObjectId 相同，大小写不同的id对应同一个文档
+        id_list = [id.lower() for id in id_list]
+        if dedupe:
+            id_list = list(dict.fromkeys(id_list))
+        return [{'id': id} if id != 'missing' else None for id in id_list]
+
+
+def test_docu_loader_batches():
+    db = FakeDB()
+    loader = DocuLoader(db)
+    first = loader.defer('a')
+    second = loader.defer('b')
+    assert first() == {'id': 'a'}
+    assert second() == {'id': 'b'}
+    assert loader.load('missing') == {}
+    assert loader.load_many(['b', 'a', 'missing']) == [{'id': 'b'}, {'id': 'a'}, {}]
+    assert db.calls == [['a', 'b'], ['missing']]
+
+
+def test_docu_loader_mixed_case_ids():
+    db = FakeDB()
+    loader = DocuLoader(db)
+    loader.defer('A')
+    loader.defer('a')
+    loader.defer('b')
+    assert loader.load('a') == {'id': 'a'}
+    assert loader.load('A') == {'id': 'a'}
+    assert loader.load('b') == {'id': 'b'}
+    assert db.calls == [['A', 'a', 'b']]
+
+
+def test_request_loader():
+    db = FakeDB()
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        assert get_request_loader(db) is get_request_loader(db)
+    with app.test_request_context('/'):
+        loader = get_request_loader(db)
+    assert loader is not get_request_loader(db)
+
+
+def test_clear_request_loaders():
+    db = FakeDB()
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        loader = get_request_loader(db)
+        other_loader = get_request_loader(FakeDB())
+        loader.load('a')
+        other_loader.load('a')
+        clear_request_loaders(db)
+        assert loader.cache == {}
+        assert other_loader.cache == {'a': {'id': 'a'}}
+        loader.load('a')
+    assert db.calls == [['a'], ['a']]
+    clear_request_loaders(db)  # 不在请求上下文中时不做任何处理
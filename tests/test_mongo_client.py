@@ -0,0 +1,50 @@
+from rainbond_python.db_connect import DBConnect
+from pymongo.read_preferences import ReadPreference
+from pymongo.write_concern import WriteConcern
+from rainbond_python.mongo_client import MongoClientRegistry, mongo_client_stats, parse_read_preference, parse_write_concern
+
+
+def test_registry_shares_client():
+    registry = MongoClientRegistry()
+    client1 = registry.get_client('127.0.0.1', 27017, serverSelectionTimeoutMS=100)
+    client2 = registry.get_client('127.0.0.1', '27017')
+    client3 = registry.get_client('127.0.0.1', 27017, username='root', password='root')
+    assert client1 is client2
+    assert client1 is not client3
+    stats = registry.stats()
+    assert stats['clients'] == 2
+    assert len(stats['details']) == 2
+    assert registry.close('127.0.0.1', 27017)
+    assert not registry.close('127.0.0.1', 27017)
+    registry.close_all()
+    assert registry.stats()['clients'] == 0
+
+
+def test_db_connect_shares_client():
+    db1 = DBConnect('unitest_rainbond_python', 'test_db_connect')
+    db2 = DBConnect('unitest_rainbond_python', 'test_tools')
+    assert db1.mongo_client is db2.mongo_client
+    assert mongo_client_stats()['clients'] >= 1
+
+
+def test_parse_options():
+    assert parse_read_preference(None) is None
+    assert parse_read_preference('primary') == ReadPreference.PRIMARY
+    assert parse_read_preference('secondaryPreferred') == ReadPreference.SECONDARY_PREFERRED
+    assert parse_read_preference(ReadPreference.NEAREST) == ReadPreference.NEAREST
+    assert parse_write_concern(None) is None
+    assert parse_write_concern({'w': 'majority', 'wtimeout': 5000}) == WriteConcern(w='majority', wtimeout=5000)
+    assert parse_write_concern(WriteConcern(w=1)) == WriteConcern(w=1)
+
+
+def test_db_connect_options():
+    db = DBConnect('unitest_rainbond_python', 'test_db_connect',
+                   read_preference='secondaryPreferred', write_concern={'w': 1}, max_time_ms=1000)
+    assert db.mongo_collection.read_preference == ReadPreference.SECONDARY_PREFERRED
+    assert db.mongo_collection.write_concern == WriteConcern(w=1)
+    assert db.get_collection() is db.mongo_collection
+    collection = db.get_collection(read_preference='primary', write_concern={'w': 'majority'})
+    assert collection.read_preference == ReadPreference.PRIMARY
+    assert collection.write_concern == WriteConcern(w='majority')
+    assert db.get_time_options() == {'maxTimeMS': 1000}
+    assert db.get_time_options(200) == {'maxTimeMS': 200}
@@ -0,0 +1,64 @@
+import pytest
+import pymongo
+from datetime import datetime
+from bson.objectid import ObjectId
+from flask import Flask, request
+from rainbond_python.parameter import Parameter
+from rainbond_python.paging import handle_keyset_sort, encode_cursor, decode_cursor, build_keyset_filter, verify_paging_param, build_paging_query
+
+
+def test_cursor_round_trip():
+    sort_list = handle_keyset_sort([('update_time', pymongo.DESCENDING)])
+    assert sort_list == [('update_time', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)]
+    docu = {'_id': ObjectId('600535c49495e1c2bec76356'), 'update_time': datetime(2021, 1, 1, 8, 0, 0)}
+    cursor = encode_cursor(docu, sort_list)
+    assert decode_cursor(cursor, sort_list) == [docu['update_time'], docu['_id']]
+    with pytest.raises(Exception):
+        decode_cursor(cursor, handle_keyset_sort([]))
+    with pytest.raises(Exception):
+        decode_cursor('not a cursor', sort_list)
+
+
+def test_build_keyset_filter():
+    sort_list = handle_keyset_sort([('age', pymongo.ASCENDING)])
+    after = build_keyset_filter(sort_list, [18, 'x'])
+    assert after == {'$or': [{'age': {'$gt': 18}}, {'age': 18, '_id': {'$gt': 'x'}}]}
+    before = build_keyset_filter(sort_list, [18, 'x'], before=True)
+    assert before == {'$or': [{'$or': [{'age': {'$lt': 18}}, {'age': None}]}, {'age': 18, '_id': {'$lt': 'x'}}]}
+    assert build_keyset_filter([('_id', pymongo.ASCENDING)], ['x']) == {'_id': {'$gt': 'x'}}
+
+
+def test_build_keyset_filter_null():
+    # 排序字段为 null 或缺失时，下一页不能为空
+    asc_sort = handle_keyset_sort([('age', pymongo.ASCENDING)])
+    docu = {'_id': 'x'}
+    values = decode_cursor(encode_cursor(docu, asc_sort), asc_sort)
+    assert build_keyset_filter(asc_sort, values) == {'$or': [{'age': {'$ne': None}}, {'age': None, '_id': {'$gt': 'x'}}]}
+    assert build_keyset_filter(asc_sort, values, before=True) == {'age': None, '_id': {'$lt': 'x'}}
+    desc_sort = handle_keyset_sort([('age', pymongo.DESCENDING)])
+    assert build_keyset_filter(desc_sort, [18, 'x']) == {
+        '$or': [{'$or': [{'age': {'$lt': 18}}, {'age': None}]}, {'age': 18, '_id': {'$lt': 'x'}}]}
+
+
+def test_verify_paging_param_repeatable():
+    app = Flask(__name__)
+    with app.test_request_context('/?$limit=1&name=Lao'):
+        parameter = Parameter(request)
+        param = verify_paging_param(parameter)
+        assert param['redundant_dict'] == {'name': 'Lao'}
+        assert verify_paging_param(parameter) == param
+        assert parameter.param_url == {'$limit': '1', 'name': 'Lao'}
+
+
+def test_build_paging_query_fields():
+    app = Flask(__name__)
+    with app.test_request_context('/?$fields=name,password'):
+        param = verify_paging_param(Parameter(request))
+    with pytest.raises(Exception):
+        build_paging_query(param, projection={'password': 0})
+    with pytest.raises(Exception):
+        build_paging_query(param, fields=['name'])
+    assert 'password' in build_paging_query(param, fields='*')['projection']
+    with app.test_request_context('/?$fields=name'):
+        param = verify_paging_param(Parameter(request))
+    assert 'name' in build_paging_query(param, fields=['name'])['projection']
@@ -0,0 +1,46 @@
+import io
+import pytest
+from flask import Flask, request
+from rainbond_python.parameter import Parameter
+from werkzeug.exceptions import HTTPException
+
+
+def test_parameter_lazy():
+    app = Flask(__name__)
+    with app.test_request_context('/?name=LaoXu', method='POST', json={'age': 28}):
+        parameter = Parameter(request)
+        assert 'param_json' not in parameter.__dict__
+        assert parameter.param_url == {'name': 'LaoXu'}
+        assert parameter.param_json == {'age': 28}
+        assert parameter.param_json is parameter.param_json
+        assert parameter.param_form == {}
+    with app.test_request_context('/', method='POST', data={'age': '28'}):
+        parameter = Parameter(request)
+        assert parameter.param_json == {}
+        assert parameter.param_form == {'age': '28'}
+    with app.test_request_context('/', method='POST', data='{"age": 28}'):
+        assert Parameter(request).param_json == {'age': 28}
+    with app.test_request_context('/', method='POST', data='{"age": 28', content_type='application/json'):
+        assert Parameter(request).param_json == {}
+
+
+def test_parameter_max_body_size():
+    app = Flask(__name__)
+    with app.test_request_context('/', method='POST', json={'name': 'LaoXu' * 100}):
+        parameter = Parameter(request, max_body_size=100)
+        assert parameter.param_url == {}
+        with pytest.raises(HTTPException) as exc_info:
+            parameter.param_json
+        assert exc_info.value.response.status_code == 413
+    # 分块传输没有 Content-Length，只读取 max_body_size + 1 字节
+    body = io.BytesIO(b'{"name": "' + b'LaoXu' * 1000 + b'"}')
+    environ = {'wsgi.input': body, 'wsgi.input_terminated': True, 'CONTENT_TYPE': 'application/json'}
+    with app.test_request_context('/', method='POST', environ_overrides=environ):
+        assert request.content_length is None
+        with pytest.raises(HTTPException) as exc_info:
+            Parameter(request, max_body_size=100).param_json
+        assert exc_info.value.response.status_code == 413
+        assert body.tell() == 101
+    environ['wsgi.input'] = io.BytesIO(b'{"age": 28}')
+    with app.test_request_context('/', method='POST', environ_overrides=environ):
+        assert Parameter(request, max_body_size=100).param_json == {'age': 28}
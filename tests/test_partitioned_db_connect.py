@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+from flask import Flask, request
+from rainbond_python.parameter import Parameter
+from rainbond_python.partitioned_db_connect import PartitionedDBConnect, handle_partition_range, merge_sorted, partition_end
+
+
+def test_handle_partition_range():
+    lower, upper = handle_partition_range({'creation_time': {'$gte': datetime(2021, 1, 1), '$lt': datetime(2021, 3, 1)}}, 'creation_time')
+    assert (lower, upper) == (datetime(2021, 1, 1), datetime(2021, 3, 1))
+    lower, upper = handle_partition_range({'$and': [
+        {'creation_time': {'$gte': datetime(2021, 1, 1, tzinfo=timezone.utc)}},
+        {'creation_time': {'$gte': datetime(2021, 2, 1)}},
+    ]}, 'creation_time')
+    assert (lower, upper) == (datetime(2021, 2, 1), None)
+    assert handle_partition_range({'name': 'LaoXu'}, 'creation_time') == (None, None)
+    assert partition_end(datetime(2021, 12, 1), 'month') == datetime(2022, 1, 1)
+    assert partition_end(datetime(2021, 2, 28), 'day') == datetime(2021, 3, 1)
+
+
+def test_merge_sorted():
+    list1 = [{'age': 30, 'name': 'a'}, {'age': 20, 'name': 'b'}]
+    list2 = [{'age': 30, 'name': 'c'}, {'age': 10, 'name': 'd'}]
+    merged = list(merge_sorted([list1, list2], [('age', -1), ('name', 1)]))
+    assert [docu['name'] for docu in merged] == ['a', 'c', 'b', 'd']
+    assert [docu['name'] for docu in merge_sorted([list1, list2], [])] == ['a', 'b', 'c', 'd']
+
+
+def test_partitioned_db_connect():
+    db = PartitionedDBConnect('unitest_rainbond_python', 'test_partitioned', period='month')
+    db.drop_partitions(keep=0)
+    id_list = db.write_many_docu([
+        {'age': month, 'creation_time': datetime(2021, month, 15)} for month in range(1, 5)])
+    assert db.list_partitions() == ['test_partitioned_202101', 'test_partitioned_202102',
+                                    'test_partitioned_202103', 'test_partitioned_202104']
+    assert db.find_docu_by_id(id_list[0])['age'] == 1
+    assert len(db.find_docu({'creation_time': {'$gte': datetime(2021, 2, 1), '$lte': datetime(2021, 3, 31)}})) == 2
+    app = Flask(__name__)
+    with app.test_request_context('/?$limit=2&$offset=1&$orderby=age desc'):
+        find_data = db.find_paging(Parameter(request))
+        assert find_data['total'] == 4
+        assert [docu['age'] for docu in find_data['items']] == [3, 2]
+    assert db.update_docu({'age': {'$gte': 2}}, {'name': 'LaoXu'}, many=True)['matched_count'] == 3
+    assert db.delete_docu({'age': 4})['deleted_count'] == 1
+    assert db.drop_partitions(before=datetime(2021, 3, 1)) == ['test_partitioned_202101', 'test_partitioned_202102']
+    assert len(db.find_docu({})) == 1
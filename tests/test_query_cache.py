@@ -0,0 +1,43 @@
+import time
+from rainbond_python.query_cache import QueryCache
+
+
+def test_query_cache_lru_and_ttl():
+    cache = QueryCache(max_size=2, ttl=60)
+    key = cache.make_key('find_docu', {'b': 1, 'a': 2}, True, None)
+    assert key == cache.make_key('find_docu', {'a': 2, 'b': 1}, True, None)
+    assert cache.get('db.test', key) == (False, None)
+    cache.set('db.test', key, [{'name': 'LaoXu'}])
+    hit, value = cache.get('db.test', key)
+    assert hit and value == [{'name': 'LaoXu'}]
+    value[0]['name'] = 'LaoHe'
+    assert cache.get('db.test', key)[1] == [{'name': 'LaoXu'}]
+    cache.set('db.test', 'k2', 2)
+    cache.set('db.test', 'k3', 3)
+    assert not cache.get('db.test', key)[0]
+    cache.ttl = 0
+    cache.set('db.test', 'k4', 4)
+    time.sleep(0.01)
+    assert not cache.get('db.test', 'k4')[0]
+
+
+def test_query_cache_invalidate():
+    cache = QueryCache()
+    cache.set('db.test', 'k1', 1)
+    cache.set('db.other', 'k1', 1)
+    cache.invalidate('db.test')
+    assert not cache.get('db.test', 'k1')[0]
+    assert cache.get('db.other', 'k1')[0]
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1 and stats['invalidations'] == 1
+
+
+def test_query_cache_stale_generation():
+    cache = QueryCache()
+    generation = cache.snapshot('db.test')
+    assert not cache.get('db.test', 'k1', generation=generation)[0]
+    cache.invalidate('db.test')  # 查询期间有写入
+    cache.set('db.test', 'k1', 'stale', generation=generation)
+    assert not cache.get('db.test', 'k1')[0]
+    cache.set('db.test', 'k1', 'fresh', generation=cache.snapshot('db.test'))
+    assert cache.get('db.test', 'k1') == (True, 'fresh')
@@ -0,0 +1,23 @@
+import time
+import pytest
+from rainbond_python.redis_connect import RedisConnect
+from werkzeug.exceptions import HTTPException
+
+
+def test_redis_connect_pool_options():
+    redis_connect = RedisConnect(db=0, health_check_interval=10, retries=2)
+    assert redis_connect.connect() is redis_connect.connect()
+    connection_kwargs = redis_connect.pool.connection_kwargs
+    assert connection_kwargs['health_check_interval'] == 10
+    assert connection_kwargs['socket_keepalive'] is True
+    assert connection_kwargs['retry'].get_retries() == 2
+
+
+def test_redis_connect_failure(monkeypatch):
+    monkeypatch.setenv('REDIS_PORT', '1')
+    redis_connect = RedisConnect(db=0, retries=0, socket_connect_timeout=1)
+    start = time.monotonic()
+    with pytest.raises(HTTPException) as exc_info:
+        redis_connect.get_('foo')
+    assert exc_info.value.response.status_code == 500
+    assert time.monotonic() - start < 1
@@ -0,0 +1,75 @@
+import json
+import pytest
+from flask import Flask, request
+from rainbond_python.parameter import Parameter
+from rainbond_python.schema import Schema, Field
+from werkzeug.exceptions import HTTPException
+
+USER_SCHEMA = Schema(
+    verify={
+        'name': Field(str, max=10), 'age': Field(int, min=0), 'sex': Field(str, enum=['male', 'female']),
+        'tags': [str], 'detail': {'city': str, 'score': float}, 'items': [{'id': int}],
+    },
+    optional={'tags': [], 'sex': 'male'}
+)
+
+
+def verify_prompt(parameter, checking, schema, **options):
+    with pytest.raises(HTTPException) as exc_info:
+        parameter.verification(checking, schema, **options)
+    return json.loads(exc_info.value.response.get_data())['prompt']
+
+
+def test_schema():
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        parameter = Parameter(request)
+        param = parameter.verification({
+            'name': 'LaoXu', 'age': '28', 'detail': '{"city": "Guangzhou", "score": 1}', 'items': [{'id': '1'}],
+        }, USER_SCHEMA)
+        assert param == {
+            'name': 'LaoXu', 'age': 28, 'detail': {'city': 'Guangzhou', 'score': 1.0}, 'items': [{'id': 1}],
+            'tags': [], 'sex': 'male',
+        }
+        # 可变的默认值不会在多次校验之间共享
+        param['tags'].append('a')
+        assert USER_SCHEMA.optional['tags'] == []
+        valid = {'name': 'LaoXu', 'age': 28, 'detail': {'city': 'Guangzhou', 'score': 1.5}, 'items': []}
+        assert verify_prompt(parameter, dict(valid, age=-1), USER_SCHEMA) == '参数 age 不能小于 0'
+        assert verify_prompt(parameter, dict(valid, name='LaoXu' * 3), USER_SCHEMA) == '参数 name 的长度不能大于 10'
+        assert verify_prompt(parameter, dict(valid, sex='other'), USER_SCHEMA) == "参数 sex 应该是 ['male', 'female'] 之一"
+        assert verify_prompt(parameter, dict(valid, tags=['']), USER_SCHEMA) == '参数 tags[0] 不能是空字符串'
+        assert verify_prompt(parameter, dict(valid, items=[{'id': 'x'}]), USER_SCHEMA) == "参数 items[0].id 应该符合 <class 'int'> 格式"
+        assert verify_prompt(parameter, dict(valid, detail={'city': 'Guangzhou'}), USER_SCHEMA)['Optional'] == {}
+        assert verify_prompt(parameter, dict(valid, other=1), USER_SCHEMA) == "'other'"
+
+
+def test_schema_same_as_verification():
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        parameter = Parameter(request)
+        verify = {'name': str, 'age': int, 'score': float, 'tags': list}
+        optional = {'age': 18}
+        schema = Schema(verify, optional, allow_extra=True)
+        for checking in [{'name': 'LaoXu', 'score': '1.5', 'tags': '[1]', 'other': 1}, {'name': 'LaoXu', 'score': 1, 'tags': []}]:
+            assert parameter.verification(dict(checking), verify, optional, allow_extra=True) == parameter.verification(dict(checking), schema)
+        for checking in [{'name': ' ', 'score': 1, 'tags': []}, {'name': 'LaoXu', 'score': 'x', 'tags': []}, {'score': 1}]:
+            assert verify_prompt(parameter, dict(checking), schema) == verify_prompt(parameter, dict(checking), verify, optional=optional, allow_extra=True)
+
+
+def test_verification_many():
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        parameter = Parameter(request)
+        checking = [{'name': 'LaoXu', 'age': '28'}, {'name': 'LaoHe', 'age': 'x'}, 'LaoLi', {'name': '', 'age': 18}, {'name': 'LaoLi', 'age': 18, 'city': 'Guangzhou'}]
+        valid_list, error_list = parameter.verification_many(checking, {'name': str, 'age': int}, allow_extra=True)
+        assert valid_list == [{'name': 'LaoXu', 'age': 28}, {'name': 'LaoLi', 'age': 18, 'city': 'Guangzhou'}]
+        assert [error['index'] for error in error_list] == [1, 2, 3]
+        assert error_list[0] == {'index': 1, 'message': '请求参数类型校验失败', 'prompt': "参数 age 应该符合 <class 'int'> 格式"}
+        assert error_list[1]['message'] == '请求格式不规范'
+        valid_list, error_list = parameter.verification_many([{'age': 1}, {'age': 2}], USER_SCHEMA, max_errors=1)
+        assert valid_list == [] and len(error_list) == 1
+        with pytest.raises(HTTPException):
+            parameter.verification_many([{'age': 'x'}], {'age': int}, raise_err=True)
+        with pytest.raises(HTTPException):
+            parameter.verification_many({'age': 1}, {'age': int})
@@ -1,8 +1,13 @@
 import pytest
 from bson.objectid import ObjectId
-from rainbond_python.tools import handle_db_id, handle_db_to_list
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from bson.datetime_ms import DatetimeMS
+from rainbond_python.tools import handle_date, handle_db_id, handle_db_docu, handle_db_remove, handle_db_list, handle_timestamp_list, handle_local_timestamp, handle_db_to_list, handle_json_stream, handle_db_projection, handle_text_filter, handle_db_error
 from rainbond_python.db_connect import DBConnect
 from werkzeug.exceptions import HTTPException
+from pymongo.errors import ExecutionTimeout, WTimeoutError, ServerSelectionTimeoutError
 
 
 def test_db_id():
@@ -22,6 +27,29 @@ def test_db_id():
     assert data == {'name': 'XiaoYang', 'age': 8}
 
 
+def test_db_id_no_mutation():
+    find_dict = {'id': '600535c49495e1c2bec76356', 'name': 'LaoXu'}
+    assert handle_db_id(find_dict) == {'name': 'LaoXu', '_id': ObjectId('600535c49495e1c2bec76356')}
+    assert find_dict == {'id': '600535c49495e1c2bec76356', 'name': 'LaoXu'}
+    find_dict = {'_id': {'$in': ['600535c49495e1c2bec76356']}}
+    assert handle_db_id(find_dict)['_id'] == {'$in': [ObjectId('600535c49495e1c2bec76356')]}
+    assert find_dict == {'_id': {'$in': ['600535c49495e1c2bec76356']}}
+    find_dict = {'name': 'LaoXu'}
+    assert handle_db_id(find_dict) is find_dict
+    assert handle_db_remove(find_dict) == {'name': 'LaoXu', 'remove_time': {'$exists': False}}
+    assert find_dict == {'name': 'LaoXu'}
+
+
+def test_handle_db_docu():
+    detail = {'tags': ['a', 'b']}
+    docu = {'name': 'LaoXu', 'detail': detail}
+    new_docu = handle_db_docu(docu)
+    assert new_docu is not docu
+    assert new_docu['detail'] is detail
+    assert new_docu['creation_time'] == new_docu['update_time']
+    assert docu == {'name': 'LaoXu', 'detail': detail}
+
+
 def test_handle_db_to_list():
     with pytest.raises(HTTPException):
         handle_db_to_list('')
@@ -35,3 +63,80 @@ def test_handle_db_to_list():
     assert isinstance(new_list, list)
     assert len(new_list) > 0
     assert isinstance(new_list[0]['id'], str)
+
+
+def test_handle_timestamp_list(monkeypatch):
+    monkeypatch.setattr('rainbond_python.tools.NAIVE_TIMEZONE', 'utc')
+    value_list = [datetime(2021, 5, 6, 7, 8, 9, 123456), None, datetime(2021, 5, 6, 15, 8, 9, tzinfo=timezone(timedelta(hours=8)))]
+    assert handle_timestamp_list(value_list, missing='none') == [1620284889123, None, 1620284889000]
+    assert handle_timestamp_list(value_list, missing='zero') == [1620284889123, 0, 1620284889000]
+    assert handle_timestamp_list(value_list, missing='now')[1] > 1620284889000
+    assert handle_timestamp_list([DatetimeMS(1620284889123)]) == [1620284889123]
+    with pytest.raises(HTTPException):
+        handle_timestamp_list(value_list, missing='bogus')
+
+
+def test_handle_db_list(monkeypatch):
+    monkeypatch.setattr('rainbond_python.tools.NAIVE_TIMEZONE', 'utc')
+    docu_list = [{'_id': ObjectId('600535c49495e1c2bec76356'), 'creation_time': datetime(1970, 1, 1, 0, 0, 1)}]
+    assert handle_db_list(docu_list, missing='none') == [
+        {'id': '600535c49495e1c2bec76356', 'creation_time': 1000, 'update_time': None}]
+
+
+def test_handle_local_timestamp():
+    for value in [datetime(2021, 3, 28, 1, 30), datetime(2021, 10, 31, 2, 15, 59, 999), datetime.today()]:
+        assert handle_local_timestamp(value) == int(time.mktime(value.timetuple())) * 1000
+
+
+def test_handle_date(monkeypatch):
+    monkeypatch.setenv('TZ', 'Asia/Shanghai')
+    time.tzset()
+    try:
+        # 默认按本地时间，与旧版本写入的数据一致
+        assert handle_date('1609459200') == datetime(2021, 1, 1, 8)
+        assert handle_date('2021-01-01') == datetime(2021, 1, 1)
+        assert handle_date('') is None
+        assert handle_timestamp_list([datetime(2021, 1, 1, 8, 0, 0, 123000)]) == [1609459200123]
+        monkeypatch.setattr('rainbond_python.tools.NAIVE_TIMEZONE', 'utc')
+        assert handle_date('1609459200') == datetime(2021, 1, 1)
+        assert handle_date('1609459200000') == datetime(2021, 1, 1)
+        assert handle_date('2021-01-01') == datetime(2020, 12, 31, 16)
+        assert handle_date('2021-01-01', date_type='end') == datetime(2021, 1, 1, 15, 59, 59)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def test_handle_json_stream():
+    docu_list = [{'id': str(i), 'name': 'LaoXu'} for i in range(100)]
+    ndjson = ''.join(handle_json_stream(iter(docu_list), chunk_size=128).response)
+    assert [json.loads(line) for line in ndjson.splitlines()] == docu_list
+    array = ''.join(handle_json_stream(iter(docu_list), json_array=True).response)
+    assert json.loads(array) == docu_list
+    assert ''.join(handle_json_stream(iter([]), json_array=True).response) == '[]'
+
+
+def test_handle_db_projection():
+    assert handle_db_projection(None) is None
+    assert handle_db_projection(['name']) == {'name': 1, 'creation_time': 1, 'update_time': 1}
+    assert handle_db_projection({'detail': 0, '_id': 0, 'update_time': 0}) == {'detail': 0}
+    assert handle_db_projection({'_id': 0}) is None
+    with pytest.raises(HTTPException):
+        handle_db_projection('name')
+
+
+def test_handle_text_filter():
+    assert handle_text_filter('a.b', 'exact') == 'a.b'
+    assert handle_text_filter('a.b', 'prefix') == {'$regex': '^a\\.b'}
+    assert handle_text_filter('(a)*', 'regex') == {'$regex': '\\(a\\)\\*'}
+    with pytest.raises(HTTPException):
+        handle_text_filter('a', 'unknown')
+
+
+def test_handle_db_error():
+    for err, status in [(ExecutionTimeout('operation exceeded time limit'), 504), (WTimeoutError('waiting for replication timed out'), 504),
+                        (ServerSelectionTimeoutError('No servers found'), 503), (ValueError('bad value'), 400)]:
+        with pytest.raises(HTTPException) as exc_info:
+            handle_db_error(err, message='计算组件分页参数异常', status=400)
+        assert exc_info.value.response.status_code == status
+        assert json.loads(exc_info.value.response.get_data())['prompt'] == str(err)
@@ -0,0 +1,54 @@
+import io
+import os
+import json
+import hashlib
+import pytest
+from flask import Flask, request
+from rainbond_python.parameter import Parameter
+from werkzeug.exceptions import HTTPException
+
+PNG_DATA = b'\x89PNG\r\n\x1a\n' + b'0123456789' * 10000
+
+
+def stream_files(data: dict, **options):
+    app = Flask(__name__)
+    with app.test_request_context('/', method='POST', data=data, content_type='multipart/form-data'):
+        return Parameter(request).stream_files(**options)
+
+
+def test_stream_files(tmp_path):
+    result = stream_files(
+        {'name': 'LaoXu', 'image': (io.BytesIO(PNG_DATA), 'avatar.png')},
+        verify_field=['image'], verify_suffix=[['png', 'jpg']], directory=str(tmp_path),
+        max_size=len(PNG_DATA), magic=[b'\x89PNG'], chunk_size=1024)
+    assert result['form'] == {'name': 'LaoXu'}
+    image = result['files']['image']
+    assert image['filename'] == 'avatar.png'
+    assert image['size'] == len(PNG_DATA)
+    assert image['sha256'] == hashlib.sha256(PNG_DATA).hexdigest()
+    with open(image['path'], 'rb') as f:
+        assert f.read() == PNG_DATA
+
+
+@pytest.mark.parametrize('data, options, status', [
+    ({'image': (io.BytesIO(PNG_DATA), 'avatar.png')}, {'max_size': 1000}, 413),
+    ({'image': (io.BytesIO(b'GIF89a'), 'avatar.png')}, {'magic': {'image': [b'\x89PNG']}}, 400),
+    ({'image': (io.BytesIO(PNG_DATA), 'avatar.gif')}, {'verify_field': ['image'], 'verify_suffix': ['png']}, 400),
+    ({'other': (io.BytesIO(PNG_DATA), 'avatar.png')}, {'verify_field': ['image']}, 400),
+    ({'image': [(io.BytesIO(PNG_DATA), 'a.png'), (io.BytesIO(PNG_DATA), 'b.png')]}, {}, 400),
+])
+def test_stream_files_abort(tmp_path, data, options, status):
+    with pytest.raises(HTTPException) as exc_info:
+        stream_files(data, directory=str(tmp_path), **options)
+    assert exc_info.value.response.status_code == status
+    assert json.loads(exc_info.value.response.get_data())['code'] == status
+    # 校验失败时不保留任何文件
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_stream_files_multiple(tmp_path):
+    result = stream_files(
+        {'image': [(io.BytesIO(PNG_DATA), 'a.png'), (io.BytesIO(b'GIF89a'), 'b.gif')]},
+        verify_field=['image'], directory=str(tmp_path), multiple=['image'])
+    assert [image['filename'] for image in result['files']['image']] == ['a.png', 'b.gif']
+    assert sorted(os.listdir(str(tmp_path))) == sorted(os.path.basename(image['path']) for image in result['files']['image'])